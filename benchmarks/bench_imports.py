@@ -0,0 +1,104 @@
+"""
+Benchmark the start-up time of the pipeline commands.
+
+Every command runs with --dry-run in a fresh interpreter under `python -X importtime`,
+which imports what the command needs without calling the API or the database. The
+"eager" row imports every pipeline module, as the entry point did before its imports
+were made lazy, for comparison.
+
+The command exits with status 1 when a command imports a heavy library it does not
+need (see UNNEEDED_MODULES), so it can fail CI:
+
+    python -m benchmarks.bench_imports --repeat 5
+"""
+from pathlib import Path
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+
+PIPELINE_MODULE = "etl_project.pipelines.accuweather"
+CONFIG_PATH = Path(__file__).parents[1] / "etl_project" / "pipelines" / "accuweather.yaml"
+HEAVY_MODULES = ["pandas", "numpy", "sqlalchemy", "pg8000", "jinja2", "requests"]
+
+# heavy libraries each command must not import
+UNNEEDED_MODULES = {
+    "help": HEAVY_MODULES,
+    "extract": ["pandas", "numpy", "sqlalchemy", "pg8000", "jinja2"],
+    "transform": ["pandas", "numpy", "requests"],
+}
+
+
+def get_commands(config_path: Path) -> dict[str, list[str]]:
+    """Python arguments of every benchmarked command."""
+    commands = {
+        "help": ["-m", PIPELINE_MODULE, "--help"],
+        **{
+            command: ["-m", PIPELINE_MODULE, command, "--dry-run", "--config", str(config_path)]
+            for command in ["extract", "load", "transform", "run"]
+        },
+        "eager": ["-c", "import etl_project.assets.accuweather, etl_project.assets.transform_load"],
+    }
+    return commands
+
+
+def measure(arguments: list[str]) -> tuple[float, float, set[str]]:
+    """
+    Runs python with arguments, returning the wall seconds of the interpreter, the
+    seconds spent importing and the top-level packages imported.
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments], capture_output=True, text=True
+    )
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise Exception(f"{' '.join(arguments)} failed:\n{process.stderr}")
+    import_microseconds = 0
+    packages = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented below the module that imported them
+        if not name.startswith("  "):
+            import_microseconds += int(cumulative)
+        packages.add(name.strip().split(".")[0])
+    return wall_seconds, import_microseconds / 1_000_000, packages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as folder:
+        # keep the dry runs' log files out of the project
+        pipeline_config = yaml.safe_load(CONFIG_PATH.read_text())
+        pipeline_config["config"]["log_folder_path"] = folder
+        config_path = Path(folder) / "accuweather.yaml"
+        config_path.write_text(yaml.safe_dump(pipeline_config))
+
+        print(f"{'command':>10} {'wall s':>8} {'import s':>9}  heavy modules")
+        for command, arguments in get_commands(config_path).items():
+            timings = [measure(arguments) for _ in range(args.repeat)]
+            wall_seconds = min(timing[0] for timing in timings)
+            import_seconds = min(timing[1] for timing in timings)
+            packages = timings[-1][2]
+            heavy_modules = [module for module in HEAVY_MODULES if module in packages]
+            print(f"{command:>10} {wall_seconds:>8.3f} {import_seconds:>9.3f}  {', '.join(heavy_modules)}")
+            unneeded = [module for module in UNNEEDED_MODULES.get(command, []) if module in packages]
+            if unneeded:
+                failures.append(f"{command} imports {', '.join(unneeded)}")
+    for failure in failures:
+        print(f"Unneeded import: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Benchmark the pipeline stages end to end against a local stub of the AccuWeather API.
+
+Measures extract_forecasts_weather() (over HTTP, against benchmarks.stub_server),
+raw_data_transform(), the staging load with PostgreSqlClient.upsert and
+PostgreSqlClient.bulk_upsert, and transform_load(). The database stages need a local
+Postgres configured with the POSTGRES_* variables (see .env.sample) and are skipped
+otherwise.
+
+Each load method is timed on an empty staging table, so every repeat inserts all rows.
+
+Results are compared with the baseline stored in benchmarks/baselines.json. Baselines
+depend on the machine they were recorded on, so slower stages are only reported, unless
+--check is given: then the command exits with status 1 when a stage is slower than its
+baseline by more than --tolerance, for CI runners that recorded their own baseline:
+
+    python -m benchmarks.bench_pipeline --locations 200 --latency 0.01
+    python -m benchmarks.bench_pipeline --update-baseline
+    python -m benchmarks.bench_pipeline --check
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+import pandas as pd
+
+from benchmarks.stub_server import StubServer
+from etl_project.assets.accuweather import extract_forecasts_weather, raw_data_transform
+from etl_project.assets.forecast_schema import get_staging_table, set_dtypes
+from etl_project.assets.transform_load import transform_load
+from etl_project.connectors.accuweather import AccuWeatherApiClient
+from etl_project.connectors.postgresql import PostgreSqlClient
+from etl_project.pipelines.accuweather import get_serving_table
+
+
+BASELINE_PATH = Path(__file__).parent / "baselines.json"
+STAGING_TABLE_NAME = "bench_staging_forecast_weather"
+SERVING_TABLE_NAME = "bench_serving_forecast_weather"
+TRANSFORM_TEMPLATE = """{% set config = {
+    "sources": ["STAGING_TABLE_NAME"],
+    "target": "SERVING_TABLE_NAME",
+    "extract_type": "full",
+    "materialization": "in_database"
+} %}
+
+select date, sum(cast(has_precipitation as int)) as count_precipitations_next_five_days
+from STAGING_TABLE_NAME
+group by date
+"""
+
+
+def best_of(repeat: int, function, setup=None) -> tuple[float, object]:
+    """
+    Runs function repeat times, returning the shortest wall time and the last result.
+    setup, when given, runs untimed before every repeat.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def get_postgresql_client() -> PostgreSqlClient:
+    load_dotenv()
+    if not os.environ.get("POSTGRES_HOST"):
+        return None
+    return PostgreSqlClient(
+        server_name=os.environ.get("POSTGRES_HOST"),
+        database_name=os.environ.get("POSTGRES_DB"),
+        username=os.environ.get("POSTGRES_USER"),
+        password=os.environ.get("POSTGRES_PASSWORD"),
+        port=os.environ.get("POSTGRES_PORT"),
+    )
+
+
+def drop_bench_tables(postgresql_client: PostgreSqlClient) -> None:
+    for table_name in [SERVING_TABLE_NAME, STAGING_TABLE_NAME]:
+        postgresql_client.engine.execute(f"drop table if exists {table_name} cascade")
+    postgresql_client.invalidate_schema_cache()
+
+
+def run(scenario: dict, repeat: int) -> dict[str, dict]:
+    """Runs every stage of the scenario, returning the seconds, rows and rows/s per stage."""
+    results = {}
+
+    def record(stage: str, seconds: float, rows: int) -> None:
+        results[stage] = {"seconds": seconds, "rows": rows, "rows_per_second": rows / seconds}
+        print(f"{stage:>20} {seconds:>10.4f} {rows:>10} {rows / seconds:>12.0f}")
+
+    # keys ending in 999 are answered with 404 by the stub
+    location_keys = [key for key in range(1, scenario["locations"] * 2) if key % 1000 != 999][:scenario["locations"]]
+    print(f"{'stage':>20} {'seconds':>10} {'rows':>10} {'rows/s':>12}")
+    with StubServer(latency_seconds=scenario["latency"], error_rate=scenario["error_rate"]) as server:
+        accuweather_client = AccuWeatherApiClient(
+            api_key="stub",
+            base_url=server.base_url,
+            max_workers=scenario["max_workers"],
+            backoff_factor=0.01,
+        )
+        seconds, frames = best_of(repeat, lambda: extract_forecasts_weather(
+            accuweather_client=accuweather_client,
+            location_keys=location_keys,
+            forecast_days=scenario["forecast_days"],
+        ))
+    record("extract", seconds, sum(len(frame) for frame in frames.values()))
+
+    # as in the pipeline, locations are transformed untyped and converted once per task
+    seconds, dataframe = best_of(repeat, lambda: set_dtypes(pd.concat(
+        [raw_data_transform(frame, location_key=location_key, typed=False) for location_key, frame in frames.items()],
+        ignore_index=True
+    )))
+    record("raw_data_transform", seconds, len(dataframe))
+
+    postgresql_client = get_postgresql_client()
+    if postgresql_client is None:
+        print("POSTGRES_HOST is not set, skipping the database stages.")
+        return results
+    staging_table, staging_metadata = get_staging_table(STAGING_TABLE_NAME)
+    serving_table, serving_metadata = get_serving_table(SERVING_TABLE_NAME)
+    drop_bench_tables(postgresql_client)
+
+    def empty_staging_table() -> None:
+        # a reloaded row is unchanged and skipped, time the inserts of a first load
+        postgresql_client.execute(f"truncate table {STAGING_TABLE_NAME}")
+
+    try:
+        postgresql_client.create_table(STAGING_TABLE_NAME, metadata=staging_metadata)
+        postgresql_client.create_date_partitions(STAGING_TABLE_NAME, dataframe["date"].unique())
+        seconds, _ = best_of(repeat, lambda: postgresql_client.upsert(
+            data=postgresql_client.dataframe_records(dataframe, columns=staging_table.columns),
+            table=staging_table,
+            metadata=staging_metadata,
+        ), setup=empty_staging_table)
+        record("upsert", seconds, len(dataframe))
+        seconds, _ = best_of(repeat, lambda: postgresql_client.bulk_upsert(
+            dataframe=dataframe, table=staging_table, metadata=staging_metadata
+        ), setup=empty_staging_table)
+        record("bulk_upsert", seconds, len(dataframe))
+
+        with tempfile.TemporaryDirectory() as environment_path:
+            (Path(environment_path) / "bench.sql").write_text(
+                TRANSFORM_TEMPLATE.replace("STAGING_TABLE_NAME", STAGING_TABLE_NAME)
+                .replace("SERVING_TABLE_NAME", SERVING_TABLE_NAME)
+            )
+            seconds, counts = best_of(repeat, lambda: transform_load(
+                environment_path=environment_path,
+                postgresql_client=postgresql_client,
+                metadata=serving_metadata,
+                source_table_name=STAGING_TABLE_NAME,
+                target_table_name=serving_table,
+            ))
+        # the transform aggregates, count the serving rows it wrote or found unchanged
+        record("transform_load", seconds, sum(sum(target_counts) for target_counts in counts.values()))
+    finally:
+        drop_bench_tables(postgresql_client)
+    return results
+
+
+def compare(results: dict[str, dict], baseline: dict, tolerance: float) -> list[str]:
+    """Lists the stages whose rows/s dropped more than tolerance below the baseline."""
+    regressions = []
+    for stage, result in results.items():
+        baseline_result = baseline["stages"].get(stage)
+        if baseline_result is None:
+            continue
+        change = result["rows_per_second"] / baseline_result["rows_per_second"] - 1
+        print(f"{stage:>20} {change:>+10.1%} vs baseline")
+        if change < -tolerance:
+            regressions.append(
+                f"{stage}: {result['rows_per_second']:.0f} rows/s, baseline {baseline_result['rows_per_second']:.0f} rows/s"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--forecast-days", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds the stub waits before each response")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests the stub answers with 503")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown before a stage fails")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 when a stage regressed")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    scenario = {
+        "locations": args.locations,
+        "forecast_days": args.forecast_days,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "max_workers": args.max_workers,
+    }
+    results = run(scenario, repeat=args.repeat)
+    total_seconds = sum(result["seconds"] for result in results.values())
+    print(f"end to end: {results['raw_data_transform']['rows'] / total_seconds:.0f} rows/s")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({"scenario": scenario, "stages": results}, indent=2) + "\n")
+        print(f"Stored baseline in {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, run with --update-baseline to store one.")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["scenario"] != scenario:
+        print(f"Baseline was measured for {baseline['scenario']}, not comparing.")
+        return 0
+    regressions = compare(results, baseline, tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"Regression in {regression}")
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
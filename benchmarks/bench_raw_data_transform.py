@@ -0,0 +1,55 @@
+"""
+Benchmark raw_data_transform() on synthetic forecasts for many locations.
+
+Reports the wall time and the per-row cost of the transformation for growing
+input sizes, so the scaling from a single location to a country-wide run is
+visible at a glance.
+
+    python -m benchmarks.bench_raw_data_transform --sizes 5 1000 100000 1000000
+"""
+from datetime import date
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_daily_forecasts
+from etl_project.assets.accuweather import raw_data_transform
+
+
+def make_forecast_dataframe(rows: int, forecast_days: int = 5, block_rows: int = 50_000) -> pd.DataFrame:
+    """
+    Normalize `rows` synthetic forecasts, i.e. rows / forecast_days locations.
+
+    At most block_rows forecasts are normalized and then tiled, json_normalize on
+    a million nested payloads would not fit in a small container.
+    """
+    block_rows = min(rows, block_rows)
+    locations = max(block_rows // forecast_days, 1)
+    # a small pool of distinct payloads is repeated to keep generation cheap
+    pool = [make_daily_forecasts(forecast_days, date(2023, 9, 26), seed=seed) for seed in range(min(locations, 100))]
+    data = [forecast for location in range(locations) for forecast in pool[location % len(pool)]][:block_rows]
+    block = pd.json_normalize(data=data)
+    blocks = [block] * (rows // len(block)) + [block.iloc[:rows % len(block)]]
+    return pd.concat(blocks, ignore_index=True)
+
+
+def run(sizes: list[int], repeat: int) -> None:
+    print(f"{'rows':>10} {'seconds':>10} {'us/row':>10}")
+    for rows in sizes:
+        df_forecast = make_forecast_dataframe(rows)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            raw_data_transform(df_forecast=df_forecast, location_key=60449)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{rows:>10} {best:>10.4f} {best / rows * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 100, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(sizes=args.sizes, repeat=args.repeat)
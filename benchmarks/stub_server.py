@@ -0,0 +1,76 @@
+"""Local stub of the AccuWeather forecast API serving synthetic `DailyForecasts` payloads."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+
+from benchmarks.synthetic import make_daily_forecasts
+
+
+class SyntheticForecastHandler(BaseHTTPRequestHandler):
+    """
+    Serves synthetic forecasts for any location key, except 404 for keys ending in 999.
+
+    The server's latency_seconds delays every response, and error_rate is the share of
+    requests answered with a retryable 503.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, with Nagle's algorithm the body waits for the
+    # client's delayed ACK of the headers, adding ~40 ms to every response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        match = re.search(r"/(\d+)day/(\d+)\?", self.path)
+        forecast_days, location_key = int(match.group(1)), int(match.group(2))
+        if self.server.latency_seconds:
+            time.sleep(self.server.latency_seconds)
+        if location_key % 1000 == 999:
+            status_code, body = 404, b"{}"
+        elif self.server.error_rate and self.server.rng.random() < self.server.error_rate:
+            status_code, body = 503, b"{}"
+        else:
+            status_code = 200
+            body = json.dumps(
+                {"DailyForecasts": make_daily_forecasts(forecast_days=forecast_days, seed=location_key)}
+            ).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """
+    Runs the stub API on a local port in a background thread.
+
+        with StubServer(latency_seconds=0.05, error_rate=0.01) as server:
+            client = AccuWeatherApiClient(api_key="stub", base_url=server.base_url)
+    """
+    def __init__(self, latency_seconds: float = 0, error_rate: float = 0, seed: int = 0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SyntheticForecastHandler)
+        self.server.latency_seconds = latency_seconds
+        self.server.error_rate = error_rate
+        self.server.rng = random.Random(seed)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_port
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
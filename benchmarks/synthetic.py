@@ -0,0 +1,68 @@
+"""Synthetic AccuWeather `DailyForecasts` payloads for offline tests and benchmarks."""
+from datetime import date, timedelta
+import random
+
+
+AIR_AND_POLLEN_NAMES = ["AirQuality", "Grass", "Mold", "Ragweed", "Tree", "UVIndex"]
+CATEGORIES = ["Good", "Low", "Moderate", "High", "Very High", "Unhealthy"]
+WIND_DIRECTIONS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+MOON_PHASES = ["New", "WaxingCrescent", "First", "WaxingGibbous", "Full", "WaningGibbous", "Last", "WaningCrescent"]
+
+
+def _period(rng: random.Random) -> dict:
+    has_precipitation = rng.random() < 0.4
+    degrees = rng.randrange(0, 360)
+    return {
+        "Icon": rng.randrange(1, 45),
+        "IconPhrase": "Partly sunny",
+        "HasPrecipitation": has_precipitation,
+        "ShortPhrase": "Partly sunny",
+        "PrecipitationProbability": rng.randrange(0, 101),
+        "ThunderstormProbability": rng.randrange(0, 101),
+        "RainProbability": rng.randrange(0, 101),
+        "SnowProbability": rng.randrange(0, 101),
+        "IceProbability": rng.randrange(0, 101),
+        "Wind": {
+            "Speed": {"Value": round(rng.uniform(0, 40), 1), "Unit": "km/h", "UnitType": 7},
+            "Direction": {"Degrees": degrees, "Localized": WIND_DIRECTIONS[degrees // 45], "English": WIND_DIRECTIONS[degrees // 45]},
+        },
+        "CloudCover": rng.randrange(0, 101),
+    }
+
+
+def make_daily_forecast(forecast_date: date, rng: random.Random) -> dict:
+    """Build one `DailyForecasts` entry shaped like the AccuWeather 'details=true' response."""
+    day = forecast_date.isoformat()
+    minimum = round(rng.uniform(-10, 20), 1)
+    maximum = round(minimum + rng.uniform(0, 15), 1)
+    air_and_pollen = [
+        {"Name": name, "Value": rng.randrange(0, 200), "Category": rng.choice(CATEGORIES), "CategoryValue": rng.randrange(1, 6)}
+        for name in AIR_AND_POLLEN_NAMES
+    ]
+    air_and_pollen[0]["Type"] = "Ozone"
+    return {
+        "Date": f"{day}T07:00:00-04:00",
+        "EpochDate": 0,
+        "Sun": {"Rise": f"{day}T06:5{rng.randrange(10)}:00-04:00", "EpochRise": 0, "Set": f"{day}T18:4{rng.randrange(10)}:00-04:00", "EpochSet": 0},
+        "Moon": {"Rise": f"{day}T17:1{rng.randrange(10)}:00-04:00", "EpochRise": 0, "Set": f"{day}T03:2{rng.randrange(10)}:00-04:00", "EpochSet": 0, "Phase": rng.choice(MOON_PHASES), "Age": rng.randrange(0, 30)},
+        "Temperature": {
+            "Minimum": {"Value": minimum, "Unit": "C", "UnitType": 17},
+            "Maximum": {"Value": maximum, "Unit": "C", "UnitType": 17},
+        },
+        "RealFeelTemperature": {
+            "Minimum": {"Value": minimum - 1, "Unit": "C", "UnitType": 17, "Phrase": "Chilly"},
+            "Maximum": {"Value": maximum + 1, "Unit": "C", "UnitType": 17, "Phrase": "Pleasant"},
+        },
+        "HoursOfSun": round(rng.uniform(0, 12), 1),
+        "AirAndPollen": air_and_pollen,
+        "Day": _period(rng),
+        "Night": _period(rng),
+        "Sources": ["AccuWeather"],
+    }
+
+
+def make_daily_forecasts(forecast_days: int = 5, start_date: date = None, seed: int = 0) -> list[dict]:
+    """Build the `DailyForecasts` list returned for one location."""
+    rng = random.Random(seed)
+    start_date = start_date or date.today()
+    return [make_daily_forecast(start_date + timedelta(days=offset), rng) for offset in range(forecast_days)]
@@ -1,7 +1,39 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import groupby
+from typing import Iterable, Iterator, NamedTuple
 from etl_project.connectors.accuweather import AccuWeatherApiClient
-from etl_project.connectors.postgresql import PostgreSqlClient
+from etl_project.connectors.postgresql import PostgreSqlClient, UpsertCounts
+from etl_project.connectors.raw_store import RawResponseStore
+from etl_project.assets.run_metrics import peak_rss_bytes
+from etl_project.assets.forecast_schema import (
+    AIR_AND_POLLEN_NAMES,
+    CATEGORICAL_COLUMNS,
+    COLUMN_NAMES,
+    SOURCE_COLUMNS,
+    set_dtypes,
+)
 from sqlalchemy import Table, MetaData
+import numpy as np
 import pandas as pd
+import time
+
+
+class TaskResult(NamedTuple):
+    """
+    Result of one extract and transform task.
+
+    dataframe holds the transformed rows (None if every location failed), failures maps
+    location keys to error messages, and stats maps stage names ("extract",
+    "raw_data_transform") to the metrics the task measured for them (see RunMetrics.add()).
+    """
+    dataframe: pd.DataFrame
+    failures: dict[int, str]
+    stats: dict[str, dict]
+
+
+# client used by extract_transform_locations() worker processes, created once per process
+_worker_accuweather_client: AccuWeatherApiClient = None
 
 
 def extract_forecast_weather(
@@ -24,112 +56,66 @@ def extract_forecast_weather(
     return pd.json_normalize(data=data)
 
 
+def extract_forecasts_weather(
+    accuweather_client: AccuWeatherApiClient,
+    location_keys: list[int],
+    forecast_days: int,
+    max_workers: int = None
+) -> dict[int, pd.DataFrame]:
+    """
+    Extract forecast data from AccuWeather API for many locations at once.
+
+    Requests are sent concurrently through the client's pooled session, capped at
+    max_workers in flight and throttled by the client's rate limit.
+
+    Returns a dictionary mapping each location_key to its forecast dataframe.
+    """
+    data = accuweather_client.get_forecasts(
+        location_keys=location_keys,
+        forecast_days=forecast_days,
+        max_workers=max_workers
+    )
+    return {
+        location_key: pd.json_normalize(data=forecasts)
+        for location_key, forecasts in data.items()
+    }
+
+
 def raw_data_transform(
     df_forecast: pd.DataFrame,
-    location_key: str
+    location_key: str,
+    typed: bool = True
 ) -> pd.DataFrame:
     """
     Perform transformation on dataframe returned from the extract_forecast_weather() function.
+
+    The selected fields, their column names and dtypes come from the forecast schema
+    (see etl_project.assets.forecast_schema). With typed=False the columns keep their
+    parsed dtypes, so that many locations can be concatenated and converted at once
+    with set_dtypes().
     """
     # transformation 1 -> filter columns
-    columns_of_interest = [
-        "Date",
-        "AirAndPollen",
-        "Sun.Rise",
-        "Sun.Set",
-        "Moon.Rise",
-        "Moon.Set",
-        "Moon.Phase",
-        "Temperature.Minimum.Value",
-        "Temperature.Minimum.Unit",
-        "Temperature.Maximum.Value",
-        "Temperature.Maximum.Unit",
-        "RealFeelTemperature.Minimum.Value",
-        "RealFeelTemperature.Minimum.Unit",
-        "RealFeelTemperature.Maximum.Value",
-        "RealFeelTemperature.Maximum.Unit",
-        "Day.HasPrecipitation",
-        "Day.PrecipitationProbability",
-        "Day.ThunderstormProbability",
-        "Day.RainProbability",
-        "Day.SnowProbability",
-        "Day.IceProbability",
-        "Night.HasPrecipitation",
-        "Night.PrecipitationProbability",
-        "Night.ThunderstormProbability",
-        "Night.RainProbability",
-        "Night.SnowProbability",
-        "Night.IceProbability",
-        "Day.Wind.Speed.Value",
-        "Day.Wind.Speed.Unit",
-        "Day.Wind.Direction.Degrees",
-        "Day.Wind.Direction.English",
-        "Night.Wind.Speed.Value",
-        "Night.Wind.Speed.Unit",
-        "Night.Wind.Direction.Degrees",
-        "Night.Wind.Direction.English",
-        "Day.CloudCover",
-        "Night.CloudCover"
-    ]
-
-    df_clean_forecast = df_forecast[columns_of_interest]
+    df_clean_forecast = df_forecast[[*SOURCE_COLUMNS, "AirAndPollen"]]
 
     # transformation 2 -> renaming fields
-    renaming_fields_map = {
-        "Date": "date",
-        "Sun.Rise": "sunrise_time",
-        "Sun.Set": "sunset_time",
-        "Moon.Rise": "moonrise_time",
-        "Moon.Set": "moonset_time",
-        "Moon.Phase": "moon_phase",
-        "Temperature.Minimum.Value": "minimum_temperature_value",
-        "Temperature.Minimum.Unit": "minimum_temperature_unit",
-        "Temperature.Maximum.Value": "maximum_temperature_value",
-        "Temperature.Maximum.Unit": "maximum_temperature_unit",
-        "RealFeelTemperature.Minimum.Value": "minimum_real_feel_temperature_value",
-        "RealFeelTemperature.Minimum.Unit": "minimum_real_feel_temperature_unit",
-        "RealFeelTemperature.Maximum.Value": "maximum_real_feel_temperature_value",
-        "RealFeelTemperature.Maximum.Unit": "maximum_real_feel_temperature_unit",
-        "Day.HasPrecipitation": "day_has_precipitation",
-        "Day.PrecipitationProbability": "day_precipitation_probability",
-        "Day.ThunderstormProbability": "day_thunderstorm_probability",
-        "Day.RainProbability": "day_rain_probability",
-        "Day.SnowProbability": "day_snow_probability",
-        "Day.IceProbability": "day_ice_probability",
-        "Night.HasPrecipitation": "night_has_precipitation",
-        "Night.PrecipitationProbability": "night_precipitation_probability",
-        "Night.ThunderstormProbability": "night_thunderstorm_probability",
-        "Night.RainProbability": "night_rain_probability",
-        "Night.SnowProbability": "night_snow_probability",
-        "Night.IceProbability": "night_ice_probability",
-        "Day.Wind.Speed.Value": "day_wind_speed_value",
-        "Day.Wind.Speed.Unit": "day_wind_speed_unit",
-        "Day.Wind.Direction.Degrees": "day_wind_direction_degrees",
-        "Day.Wind.Direction.English": "day_wind_direction_english_abbreviation",
-        "Night.Wind.Speed.Value": "night_wind_speed_value",
-        "Night.Wind.Speed.Unit": "night_wind_speed_unit",
-        "Night.Wind.Direction.Degrees": "night_wind_direction_degrees",
-        "Night.Wind.Direction.English": "night_wind_direction_english_abbreviation",
-        "Day.CloudCover": "day_percentage_cloud_cover",
-        "Night.CloudCover": "night_percentage_cloud_cover"
-    }
-
-    df_clean_forecast = df_clean_forecast.rename(columns=renaming_fields_map)
+    df_clean_forecast = df_clean_forecast.rename(columns=SOURCE_COLUMNS)
 
     # transformation 3 -> convert "Date" field to date (and not timestamp)
     df_clean_forecast["date"] = pd.to_datetime(df_clean_forecast["date"]).dt.date
 
     # transformation 4 -> clean AirAndPollen column
-    # there are 5 different type of entries in the AirAndPollen column
-    for index in range(6):
-        temp_df = pd.json_normalize(df_clean_forecast["AirAndPollen"].apply(lambda x: x[index]))
-        # rename columns
-        temp_df[f"{temp_df['Name'][0].lower()}_category"] = temp_df["Category"]
-        # join with clean dataframe
-        df_clean_forecast = pd.concat([df_clean_forecast, temp_df[f"{temp_df['Name'][0].lower()}_category"]], axis=1)
-
-    # Drop original AirAndPollen column
-    df_clean_forecast.drop(columns="AirAndPollen", inplace=True)
+    # each entry is a list of {"Name": ..., "Category": ...} records. Explode all rows at once
+    # and pivot on Name so the result does not depend on the order of the records.
+    air_and_pollen = df_clean_forecast["AirAndPollen"].explode().dropna()
+    air_and_pollen = pd.DataFrame(
+        air_and_pollen.tolist(), index=air_and_pollen.index, columns=["Name", "Category"]
+    )
+    air_and_pollen_categories = (
+        air_and_pollen.pivot(columns="Name", values="Category")
+        .reindex(columns=AIR_AND_POLLEN_NAMES)
+        .rename(columns=lambda name: f"{name.lower()}_category")
+    )
+    df_clean_forecast = df_clean_forecast.drop(columns="AirAndPollen").join(air_and_pollen_categories)
 
     # Add location_key as column
     df_clean_forecast["location_key"] = location_key
@@ -144,20 +130,253 @@ def raw_data_transform(
     )
 
     # transformation 7 -> create column to show which period of the day (day or night) is windier
-    df_clean_forecast.loc[df_clean_forecast["day_wind_speed_value"] >= df_clean_forecast["night_wind_speed_value"], "windier_period"] = "day"
-    df_clean_forecast["windier_period"].fillna("night", inplace=True)
+    df_clean_forecast["windier_period"] = np.where(
+        df_clean_forecast["day_wind_speed_value"] >= df_clean_forecast["night_wind_speed_value"],
+        "day",
+        "night"
+    )
 
-    return df_clean_forecast
+    # transformation 8 -> order columns as in the staging table and set their dtypes
+    df_clean_forecast = df_clean_forecast[COLUMN_NAMES]
+    return set_dtypes(df_clean_forecast) if typed else df_clean_forecast
+
+
+def compact_dataframe(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stores the low-cardinality string columns of transformed forecasts as categoricals.
+
+    Units such as "C" and "km/h" repeat on every row. As categoricals, each row holds a
+    small integer code into one array of distinct values, instead of its own Python string.
+    """
+    return dataframe.astype({
+        column: "category" for column in CATEGORICAL_COLUMNS if column in dataframe.columns
+    })
+
+
+def _init_worker(api_key: str, client_config: dict, workers: int) -> None:
+    global _worker_accuweather_client
+    _worker_accuweather_client = AccuWeatherApiClient.from_config(
+        api_key=api_key, config=client_config, workers=workers
+    )
+
+
+def _extract_transform_chunk(
+    location_keys: list[int],
+    forecast_days: int,
+    accuweather_client: AccuWeatherApiClient = None,
+    compact: bool = False,
+    raw_store: RawResponseStore = None
+) -> TaskResult:
+    """
+    Extract and transform a chunk of locations, isolating failures per location.
+
+    Raw responses are appended to raw_store, when given, before they are transformed.
+    """
+    accuweather_client = accuweather_client or _worker_accuweather_client
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    start_retries, start_bytes_fetched = accuweather_client.retries, accuweather_client.bytes_fetched
+    data = accuweather_client.get_forecasts(
+        location_keys=location_keys,
+        forecast_days=forecast_days,
+        return_exceptions=True
+    )
+    if raw_store is not None:
+        for location_key, forecasts in data.items():
+            if not isinstance(forecasts, Exception):
+                raw_store.write(location_key=location_key, data=forecasts)
+    extract_stats = {
+        "wall_seconds": time.perf_counter() - start_wall,
+        "cpu_seconds": time.process_time() - start_cpu,
+        "rows_in": len(location_keys),
+        "rows_out": sum(len(forecasts) for forecasts in data.values() if not isinstance(forecasts, Exception)),
+        "bytes_fetched": accuweather_client.bytes_fetched - start_bytes_fetched,
+        "http_retries": accuweather_client.retries - start_retries,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    result = _transform_chunk(data.items(), compact)
+    return result._replace(stats={"extract": extract_stats, **result.stats})
+
+
+def _transform_chunk(
+    responses: Iterable[tuple[int, list]],
+    compact: bool = False
+) -> TaskResult:
+    """Transform (location_key, forecasts) pairs, isolating failures per location."""
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    failures = {}
+    frames = []
+    rows_in = 0
+    for location_key, forecasts in responses:
+        if isinstance(forecasts, Exception):
+            failures[location_key] = str(forecasts)
+            continue
+        rows_in += len(forecasts)
+        try:
+            frames.append(
+                raw_data_transform(
+                    df_forecast=pd.json_normalize(data=forecasts), location_key=location_key, typed=False
+                )
+            )
+        except Exception as e:
+            failures[location_key] = f"{type(e).__name__}: {e}"
+    dataframe = set_dtypes(pd.concat(frames, ignore_index=True)) if frames else None
+    if compact and dataframe is not None:
+        dataframe = compact_dataframe(dataframe)
+    transform_stats = {
+        "wall_seconds": time.perf_counter() - start_wall,
+        "cpu_seconds": time.process_time() - start_cpu,
+        "rows_in": rows_in,
+        "rows_out": len(dataframe) if dataframe is not None else 0,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    return TaskResult(dataframe, failures, {"raw_data_transform": transform_stats})
+
+
+def extract_transform_locations(
+    api_key: str,
+    client_config: dict,
+    location_keys: list[int],
+    forecast_days: int,
+    max_processes: int = 1,
+    locations_per_task: int = 50,
+    compact: bool = False,
+    raw_store: RawResponseStore = None,
+    accuweather_client: AccuWeatherApiClient = None,
+    executor: ProcessPoolExecutor = None
+) -> Iterator[TaskResult]:
+    """
+    Extract and transform forecasts for many locations across a process pool.
+
+    Location keys are split into tasks of locations_per_task keys. Each worker process
+    builds one AccuWeatherApiClient from client_config (see AccuWeatherApiClient.from_config)
+    and fetches its tasks concurrently over that client's pooled session, so the API
+    calls are I/O-parallel and raw_data_transform is CPU-parallel.
+
+    A location that fails is reported instead of aborting the others. Yields one
+    TaskResult per task, in task order.
+
+    When compact is set, the dataframes are returned by compact_dataframe(), which also
+    shrinks what worker processes send back. When raw_store is given, every raw
+    response is kept there so it can be replayed (see replay_transform_locations()).
+
+    Long-running callers can keep connections warm between calls by passing an
+    executor from create_worker_pool(), or, with max_processes <= 1, an accuweather_client.
+    """
+    chunks = [
+        location_keys[start:start + locations_per_task]
+        for start in range(0, len(location_keys), locations_per_task)
+    ]
+    if executor is None and max_processes <= 1:
+        accuweather_client = accuweather_client or AccuWeatherApiClient.from_config(api_key=api_key, config=client_config)
+        for chunk in chunks:
+            yield _extract_transform_chunk(chunk, forecast_days, accuweather_client, compact, raw_store)
+        return
+    if executor is None:
+        with create_worker_pool(api_key, client_config, max_processes) as executor:
+            yield from _submit_chunks(executor, chunks, forecast_days, compact, raw_store)
+    else:
+        yield from _submit_chunks(executor, chunks, forecast_days, compact, raw_store)
+
+
+def create_worker_pool(api_key: str, client_config: dict, max_processes: int) -> ProcessPoolExecutor:
+    """
+    Creates a process pool for extract_transform_locations(), where every worker process
+    builds one AccuWeatherApiClient from client_config.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_processes,
+        initializer=_init_worker,
+        initargs=(api_key, client_config, max_processes)
+    )
+
+
+def _submit_chunks(
+    executor: ProcessPoolExecutor,
+    chunks: list[list[int]],
+    forecast_days: int,
+    compact: bool,
+    raw_store: RawResponseStore
+) -> Iterator[TaskResult]:
+    futures = [
+        executor.submit(_extract_transform_chunk, chunk, forecast_days, None, compact, raw_store)
+        for chunk in chunks
+    ]
+    for chunk, future in zip(chunks, futures):
+        try:
+            yield future.result()
+        except Exception as e:
+            # the worker itself died, e.g. it could not be started
+            yield TaskResult(None, {location_key: f"{type(e).__name__}: {e}" for location_key in chunk}, {})
+
+
+def replay_transform_locations(
+    raw_store: RawResponseStore,
+    start_date: date = None,
+    end_date: date = None,
+    location_keys: list[int] = None,
+    locations_per_task: int = 50,
+    compact: bool = False
+) -> Iterator[TaskResult]:
+    """
+    Transform the raw responses kept in raw_store instead of calling the API.
+
+    Responses extracted between start_date and end_date (both inclusive) are read
+    oldest first and transformed locations_per_task at a time. Yields a TaskResult per
+    task like extract_transform_locations(), grouped by extraction date, so
+    a later extraction of the same forecast day is always yielded after an earlier one.
+    """
+    responses = raw_store.read(start_date=start_date, end_date=end_date, location_keys=location_keys)
+    for _, date_responses in groupby(responses, key=lambda response: response.extracted_at[:10]):
+        chunk = []
+        for response in date_responses:
+            chunk.append((response.location_key, response.data))
+            if len(chunk) >= locations_per_task:
+                yield _transform_chunk(chunk, compact)
+                chunk = []
+        if chunk:
+            yield _transform_chunk(chunk, compact)
 
 
 def staging_upsert_load(
     dataframe: pd.DataFrame,
     postgresql_client: PostgreSqlClient,
     table: Table,
-    metadata: MetaData
-) -> None:
-    postgresql_client.upsert(
-        data=dataframe.to_dict(orient="records"),
-        table=table,
-        metadata=metadata
+    metadata: MetaData,
+    load_method: str = "copy",
+    batch_size: int = 1000,
+    partition_interval: str = "month"
+) -> UpsertCounts:
+    """
+    Upsert the transformed dataframe into the staging table, returning how many rows were
+    inserted, updated and skipped because they were unchanged.
+
+    The load_method argument selects how rows are sent to the database: "copy" streams
+    the dataframe with COPY and merges it in one statement, "insert" sends
+    INSERT ... ON CONFLICT statements of batch_size rows each.
+
+    When the staging table is partitioned by date, the partitions needed for the
+    dataframe's dates are created first, one per partition_interval ("day" or "month").
+    """
+    postgresql_client.create_table(table_name=table.name, metadata=metadata)
+    postgresql_client.create_date_partitions(
+        table_name=table.name,
+        dates=dataframe["date"].unique(),
+        interval=partition_interval
     )
+    if load_method == "copy":
+        return postgresql_client.bulk_upsert(
+            dataframe=dataframe,
+            table=table,
+            metadata=metadata
+        )
+    elif load_method == "insert":
+        return postgresql_client.upsert(
+            data=postgresql_client.dataframe_records(dataframe, columns=table.columns),
+            table=table,
+            metadata=metadata,
+            batch_size=batch_size
+        )
+    else:
+        raise Exception(
+            f"Load method {load_method} is not supported. Please use either 'copy' or 'insert' load method."
+        )
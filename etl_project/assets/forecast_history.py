@@ -0,0 +1,262 @@
+from datetime import datetime
+from etl_project.connectors.postgresql import PostgreSqlClient, UpsertCounts
+from etl_project.assets.forecast_schema import FORECAST_WEATHER_COLUMNS
+from sqlalchemy import (
+    Table,
+    Column,
+    MetaData,
+    String,
+    SmallInteger,
+    BigInteger,
+    DateTime,
+    Identity,
+    Index,
+    UniqueConstraint,
+    select,
+    text,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql
+import pandas as pd
+
+
+# key of a forecast, a version of it is stored for every fetch where it changed
+KEY_COLUMNS = [column for column in FORECAST_WEATHER_COLUMNS if column.primary_key]
+
+# columns stored per version, bit i of changed_columns is set when VERSION_COLUMNS[i] changed
+VERSION_COLUMNS = [column for column in FORECAST_WEATHER_COLUMNS if not column.primary_key]
+
+# changed_columns of the first version of a forecast
+ALL_CHANGED = (1 << len(VERSION_COLUMNS)) - 1
+
+assert len(VERSION_COLUMNS) < 63, "changed_columns is a bigint bit mask"
+
+
+def get_history_tables(table_name: str) -> tuple[Table, Table, MetaData]:
+    """
+    Forecast history table and its lookup table of category codes.
+
+    Each row of the history table is a version of the forecast of a date and location,
+    fetched at fetched_at. Only the columns that changed since the previous version are
+    set, the others are null, and changed_columns tells which ones changed (a column
+    can change to null). Categorical columns store the smallint code of their value in
+    the lookup table `<table_name>_codes`. Versions are BRIN-indexed on fetched_at,
+    which grows with the physical order of the table.
+    """
+    history_metadata = MetaData()
+    codes_table = Table(
+        f"{table_name}_codes",
+        history_metadata,
+        Column("code", SmallInteger, Identity(), primary_key=True),
+        Column("column_name", String, nullable=False),
+        Column("value", String, nullable=False),
+        UniqueConstraint("column_name", "value"),
+    )
+    history_table = Table(
+        table_name,
+        history_metadata,
+        *[Column(column.name, column.sql_type, primary_key=True) for column in KEY_COLUMNS],
+        Column("fetched_at", DateTime(timezone=True), primary_key=True),
+        Column("changed_columns", BigInteger, nullable=False),
+        *[
+            Column(column.name, SmallInteger if column.categorical else column.sql_type)
+            for column in VERSION_COLUMNS
+        ],
+        Index(f"{table_name}_fetched_at", "fetched_at", postgresql_using="brin"),
+    )
+    return history_table, codes_table, history_metadata
+
+
+_identifier_preparer = postgresql.dialect().identifier_preparer
+
+
+def _quote(name: str) -> str:
+    return _identifier_preparer.quote(name)
+
+
+def _changed(column_index: int) -> str:
+    return f"changed_columns & {1 << column_index}::bigint <> 0"
+
+
+def get_versions_view_sql(history_table: Table, codes_table: Table) -> str:
+    """
+    Creates the view `<history table>_versions`, which has one row per stored version
+    with the full forecast as it was at fetched_at, categories decoded.
+
+    Each column takes its value from the latest version up to fetched_at where it changed.
+    """
+    key_names = ", ".join(_quote(column.name) for column in KEY_COLUMNS)
+    changes = ",\n        ".join(
+        f"array_agg({_quote(column.name)}) filter (where {_changed(index)}) over versions as {_quote(column.name)}"
+        for index, column in enumerate(VERSION_COLUMNS)
+    )
+    values = []
+    joins = []
+    for column in VERSION_COLUMNS:
+        name = _quote(column.name)
+        value = f"changes.{name}[cardinality(changes.{name})]"
+        if column.categorical:
+            code_alias = _quote(f"code_{column.name}")
+            joins.append(f"left join {_quote(codes_table.name)} {code_alias} on {code_alias}.code = {value}")
+            value = f"{code_alias}.value"
+        values.append(f"{value} as {name}")
+    values = ",\n    ".join(values)
+    joins = "\n".join(joins)
+    return f"""create or replace view {_quote(f"{history_table.name}_versions")} as
+select
+    {", ".join(f"changes.{_quote(column.name)}" for column in KEY_COLUMNS)},
+    changes.fetched_at,
+    changes.changed_columns,
+    {values}
+from (
+    select
+        {key_names},
+        fetched_at,
+        changed_columns,
+        {changes}
+    from {_quote(history_table.name)}
+    window versions as (partition by {key_names} order by fetched_at)
+) changes
+{joins}
+"""
+
+
+def create_history_tables(postgresql_client: PostgreSqlClient, table_name: str) -> tuple[Table, Table]:
+    """Creates the history table, its lookup table and its versions view if they don't exist."""
+    history_table, codes_table, history_metadata = get_history_tables(table_name)
+    if not postgresql_client.table_exists(table_name):
+        postgresql_client.create_table(codes_table.name, metadata=history_metadata)
+        postgresql_client.create_table(table_name, metadata=history_metadata)
+        postgresql_client.execute(text(get_versions_view_sql(history_table, codes_table)))
+    return history_table, codes_table
+
+
+def encode_categories(
+    dataframe: pd.DataFrame,
+    postgresql_client: PostgreSqlClient,
+    codes_table: Table
+) -> pd.DataFrame:
+    """
+    Replaces the values of the categorical columns with their code in codes_table,
+    adding the values that have no code yet.
+    """
+    categorical_names = [column.name for column in VERSION_COLUMNS if column.categorical]
+    values = {
+        (name, value)
+        for name in categorical_names
+        for value in dataframe[name].dropna().astype(str).unique()
+    }
+    if not values:
+        return dataframe
+
+    def get_codes() -> dict[tuple[str, str], int]:
+        with postgresql_client.begin() as connection:
+            rows = connection.execute(
+                select(codes_table.c.column_name, codes_table.c.value, codes_table.c.code)
+                .where(tuple_(codes_table.c.column_name, codes_table.c.value).in_(list(values)))
+            )
+            return {(column_name, value): code for column_name, value, code in rows}
+
+    codes = get_codes()
+    missing_values = values - codes.keys()
+    if missing_values:
+        # only insert missing values, conflicting inserts would still use up identity values
+        postgresql_client.execute(
+            postgresql.insert(codes_table)
+            .values([dict(column_name=name, value=value) for name, value in sorted(missing_values)])
+            .on_conflict_do_nothing(index_elements=["column_name", "value"])
+        )
+        codes = get_codes()
+    encoded = {
+        name: dataframe[name].astype(object).map(
+            lambda value, name=name: codes[(name, str(value))] if pd.notna(value) else None
+        ).astype("Int16")
+        for name in categorical_names
+    }
+    return dataframe.assign(**encoded)
+
+
+def get_delta_insert_sql(history_table: Table, incoming_table: Table) -> str:
+    """
+    Inserts the rows of incoming_table that differ from the latest version of their
+    forecast as new versions fetched at :fetched_at, keeping only the changed columns.
+    Returns the number of versions inserted.
+    """
+    history_name = _quote(history_table.name)
+    key_names = [_quote(column.name) for column in KEY_COLUMNS]
+    latest_values = ",\n        ".join(
+        f"(array_agg({_quote(column.name)} order by fetched_at desc) filter (where {_changed(index)}))[1] as {_quote(column.name)}"
+        for index, column in enumerate(VERSION_COLUMNS)
+    )
+    changed_columns = "\n            + ".join(
+        f"case when incoming.{_quote(column.name)} is distinct from latest.{_quote(column.name)} "
+        f"then {1 << index}::bigint else 0 end"
+        for index, column in enumerate(VERSION_COLUMNS)
+    )
+    version_names = [_quote(column.name) for column in VERSION_COLUMNS]
+    changed_values = ",\n        ".join(
+        f"case when {_changed(index)} then {name} end"
+        for index, name in enumerate(version_names)
+    )
+    return f"""with latest as (
+    select
+        {", ".join(key_names)},
+        {latest_values}
+    from {history_name}
+    where ({", ".join(key_names)}) in (select {", ".join(key_names)} from {_quote(incoming_table.name)})
+    group by {", ".join(key_names)}
+),
+deltas as (
+    select
+        {", ".join(f"incoming.{name}" for name in key_names)},
+        case when latest.{key_names[0]} is null then {ALL_CHANGED}::bigint else (
+            {changed_columns}
+        ) end as changed_columns,
+        {", ".join(f"incoming.{name}" for name in version_names)}
+    from {_quote(incoming_table.name)} incoming
+    left join latest on {" and ".join(f"latest.{name} = incoming.{name}" for name in key_names)}
+),
+inserted as (
+    insert into {history_name} ({", ".join(key_names)}, fetched_at, changed_columns, {", ".join(version_names)})
+    select
+        {", ".join(key_names)},
+        cast(:fetched_at as timestamptz),
+        changed_columns,
+        {changed_values}
+    from deltas
+    where changed_columns <> 0
+    on conflict do nothing
+    returning 1
+)
+select count(*) from inserted
+"""
+
+
+def history_load(
+    dataframe: pd.DataFrame,
+    postgresql_client: PostgreSqlClient,
+    table_name: str,
+    fetched_at: datetime,
+    chunk_rows: int = 10_000
+) -> UpsertCounts:
+    """
+    Stores the transformed forecasts of a fetch as new versions in the history table,
+    as deltas against the previous version of each forecast (see get_history_tables()).
+
+    Forecasts that did not change since their previous version are not stored. Returns
+    the versions inserted, and the forecasts skipped because they were unchanged.
+    """
+    history_table, codes_table = create_history_tables(postgresql_client, table_name)
+    encoded = encode_categories(dataframe, postgresql_client, codes_table)
+    columns = [
+        Column(column.name, column.type)
+        for column in history_table.columns
+        if column.name not in ("fetched_at", "changed_columns")
+    ]
+    with postgresql_client.temporary_table(
+        encoded, f"{table_name}_incoming", columns, chunk_rows
+    ) as (connection, incoming_table):
+        inserted = connection.execute(
+            text(get_delta_insert_sql(history_table, incoming_table)), {"fetched_at": fetched_at}
+        ).scalar()
+    return UpsertCounts(inserted, 0, len(dataframe) - inserted)
@@ -0,0 +1,123 @@
+from typing import NamedTuple
+from sqlalchemy import (
+    Table,
+    Column,
+    MetaData,
+    String,
+    Integer,
+    Float,
+    Boolean,
+    DateTime,
+    Date,
+    Interval,
+    Index,
+)
+from sqlalchemy.types import TypeEngine
+import pandas as pd
+
+
+# names of the entries in the AirAndPollen list, each one becomes a "<name>_category" column
+AIR_AND_POLLEN_NAMES = ["AirQuality", "Grass", "Mold", "Ragweed", "Tree", "UVIndex"]
+
+
+class SchemaColumn(NamedTuple):
+    """
+    One column of the transformed forecasts.
+
+    source is the field of the normalized API response the column is renamed from, or
+    None for columns computed by raw_data_transform. dtype is the pandas dtype of the
+    column, or None to keep the parsed values (e.g. strings, or timedeltas for intervals).
+    Categorical columns are low-cardinality strings that compact_dataframe() stores as
+    categoricals.
+    """
+    name: str
+    source: str
+    sql_type: TypeEngine
+    dtype: str
+    primary_key: bool = False
+    categorical: bool = False
+
+
+FORECAST_WEATHER_COLUMNS = [
+    SchemaColumn("date", "Date", Date, None, primary_key=True),
+    SchemaColumn("location_key", None, Integer, "int64", primary_key=True),
+    SchemaColumn("sunrise_time", "Sun.Rise", DateTime, None),
+    SchemaColumn("sunset_time", "Sun.Set", DateTime, None),
+    SchemaColumn("moonrise_time", "Moon.Rise", DateTime, None),
+    SchemaColumn("moonset_time", "Moon.Set", DateTime, None),
+    SchemaColumn("moon_phase", "Moon.Phase", String, None, categorical=True),
+    SchemaColumn("minimum_temperature_value", "Temperature.Minimum.Value", Float, "float64"),
+    SchemaColumn("minimum_temperature_unit", "Temperature.Minimum.Unit", String, None, categorical=True),
+    SchemaColumn("maximum_temperature_value", "Temperature.Maximum.Value", Float, "float64"),
+    SchemaColumn("maximum_temperature_unit", "Temperature.Maximum.Unit", String, None, categorical=True),
+    SchemaColumn("minimum_real_feel_temperature_value", "RealFeelTemperature.Minimum.Value", Float, "float64"),
+    SchemaColumn("minimum_real_feel_temperature_unit", "RealFeelTemperature.Minimum.Unit", String, None, categorical=True),
+    SchemaColumn("maximum_real_feel_temperature_value", "RealFeelTemperature.Maximum.Value", Float, "float64"),
+    SchemaColumn("maximum_real_feel_temperature_unit", "RealFeelTemperature.Maximum.Unit", String, None, categorical=True),
+    SchemaColumn("day_has_precipitation", "Day.HasPrecipitation", Boolean, "boolean"),
+    SchemaColumn("day_precipitation_probability", "Day.PrecipitationProbability", Integer, "Int64"),
+    SchemaColumn("day_thunderstorm_probability", "Day.ThunderstormProbability", Integer, "Int64"),
+    SchemaColumn("day_rain_probability", "Day.RainProbability", Integer, "Int64"),
+    SchemaColumn("day_snow_probability", "Day.SnowProbability", Integer, "Int64"),
+    SchemaColumn("day_ice_probability", "Day.IceProbability", Integer, "Int64"),
+    SchemaColumn("night_has_precipitation", "Night.HasPrecipitation", Boolean, "boolean"),
+    SchemaColumn("night_precipitation_probability", "Night.PrecipitationProbability", Integer, "Int64"),
+    SchemaColumn("night_thunderstorm_probability", "Night.ThunderstormProbability", Integer, "Int64"),
+    SchemaColumn("night_rain_probability", "Night.RainProbability", Integer, "Int64"),
+    SchemaColumn("night_snow_probability", "Night.SnowProbability", Integer, "Int64"),
+    SchemaColumn("night_ice_probability", "Night.IceProbability", Integer, "Int64"),
+    SchemaColumn("day_wind_speed_value", "Day.Wind.Speed.Value", Float, "float64"),
+    SchemaColumn("day_wind_speed_unit", "Day.Wind.Speed.Unit", String, None, categorical=True),
+    SchemaColumn("day_wind_direction_degrees", "Day.Wind.Direction.Degrees", Integer, "Int64"),
+    SchemaColumn("day_wind_direction_english_abbreviation", "Day.Wind.Direction.English", String, None, categorical=True),
+    SchemaColumn("night_wind_speed_value", "Night.Wind.Speed.Value", Float, "float64"),
+    SchemaColumn("night_wind_speed_unit", "Night.Wind.Speed.Unit", String, None, categorical=True),
+    SchemaColumn("night_wind_direction_degrees", "Night.Wind.Direction.Degrees", Integer, "Int64"),
+    SchemaColumn("night_wind_direction_english_abbreviation", "Night.Wind.Direction.English", String, None, categorical=True),
+    SchemaColumn("day_percentage_cloud_cover", "Day.CloudCover", Integer, "Int64"),
+    SchemaColumn("night_percentage_cloud_cover", "Night.CloudCover", Integer, "Int64"),
+    *[
+        SchemaColumn(f"{name.lower()}_category", None, String, None, categorical=True)
+        for name in AIR_AND_POLLEN_NAMES
+    ],
+    SchemaColumn("has_precipitation", None, Boolean, "boolean"),
+    SchemaColumn("time_between_sunset_and_sunrise", None, Interval, None),
+    SchemaColumn("windier_period", None, String, None, categorical=True),
+]
+
+# fields of the normalized API response selected by raw_data_transform, and their column names
+SOURCE_COLUMNS = {column.source: column.name for column in FORECAST_WEATHER_COLUMNS if column.source is not None}
+
+# column names of the transformed forecasts, in table order
+COLUMN_NAMES = [column.name for column in FORECAST_WEATHER_COLUMNS]
+
+# pandas dtype of each transformed column that is converted
+PANDAS_DTYPES = {column.name: column.dtype for column in FORECAST_WEATHER_COLUMNS if column.dtype is not None}
+
+# low-cardinality string columns, stored as categoricals by compact_dataframe()
+CATEGORICAL_COLUMNS = [column.name for column in FORECAST_WEATHER_COLUMNS if column.categorical]
+
+
+def set_dtypes(dataframe: pd.DataFrame) -> pd.DataFrame:
+    """Converts the columns of transformed forecasts that are not of their schema dtype yet."""
+    dtypes = {
+        name: dtype for name, dtype in PANDAS_DTYPES.items()
+        if name in dataframe.columns and dataframe[name].dtype != dtype
+    }
+    return dataframe.astype(dtypes) if dtypes else dataframe
+
+
+def get_staging_table(table_name: str) -> tuple[Table, MetaData]:
+    """Staging table the transformed forecasts are loaded into."""
+    staging_metadata = MetaData()
+    staging_table = Table(
+        table_name,
+        staging_metadata,
+        *[
+            Column(column.name, column.sql_type, primary_key=column.primary_key)
+            for column in FORECAST_WEATHER_COLUMNS
+        ],
+        Index(f"{table_name}_location_key_date", "location_key", "date"),
+        postgresql_partition_by="RANGE (date)",
+    )
+    return staging_table, staging_metadata
@@ -1,7 +1,11 @@
+from etl_project.assets.pipeline_logging import decompress_logs
 from etl_project.connectors.postgresql import PostgreSqlClient
 from datetime import datetime, timezone
-from sqlalchemy import Table, Column, Integer, String, MetaData, JSON
-from sqlalchemy import insert, select, func
+from sqlalchemy import Table, Column, Integer, String, MetaData, JSON, LargeBinary
+from sqlalchemy import insert, select, func, literal
+from sqlalchemy.dialects import postgresql
+import queue
+import threading
 
 
 class MetaDataLoggingStatus:
@@ -13,14 +17,29 @@ class MetaDataLoggingStatus:
 
 
 class MetaDataLogging:
+    """
+    Writes the status of pipeline runs to a log table.
+
+    log() only queues the row. A background writer inserts queued rows in batches of up
+    to batch_size, so the pipeline does not wait on the database. Call close() at the
+    end of the run to write the remaining rows.
+
+    The logs of a run are stored as gzip-compressed chunks, one row each, in
+    `<log_table_name>_chunks` (see get_logs()).
+    """
     def __init__(
         self,
         pipeline_name: str,
         postgresql_client: PostgreSqlClient,
         config: dict = {},
         log_table_name: str = "pipeline_logs",
+        batch_size: int = 100,
     ):
         self.pipeline_name = pipeline_name
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._writer: threading.Thread = None
+        self._writer_error: BaseException = None
         self.log_table_name = log_table_name
         self.postgresql_client = postgresql_client
         self.config = config
@@ -35,40 +54,136 @@ class MetaDataLogging:
             Column("config", JSON),
             Column("logs", String),
         )
+        self.chunks_table = Table(
+            f"{self.log_table_name}_chunks",
+            self.metadata,
+            Column("pipeline_name", String, primary_key=True),
+            Column("run_id", Integer, primary_key=True),
+            Column("status", String, primary_key=True),
+            Column("chunk_index", Integer, primary_key=True),
+            Column("logs", LargeBinary),
+        )
+        self.run_id_table = Table(
+            f"{self.log_table_name}_run_ids",
+            self.metadata,
+            Column("pipeline_name", String, primary_key=True),
+            Column("run_id", Integer),
+        )
         self.run_id: int = self._get_run_id()
 
     def _create_log_table(self) -> None:
         """Create log table if it does not exist."""
         self.postgresql_client.create_table(self.log_table_name, metadata=self.metadata)
+        self.postgresql_client.create_table(self.chunks_table.name, metadata=self.metadata)
+        self.postgresql_client.create_table(self.run_id_table.name, metadata=self.metadata)
 
     def _get_run_id(self):
-        """Gets the next run id. Sets run id to 1 if no run id exists."""
+        """
+        Allocates the next run id of the pipeline. Sets run id to 1 if no run id exists.
+
+        The last run id of each pipeline is kept in a counter table and incremented in a
+        single upsert, so pipelines started at the same time never get the same run id.
+        The counter of a pipeline starts from the highest run id already in the log table.
+        """
         self._create_log_table()
-        run_id = self.postgresql_client.engine.execute(
-            select(func.max(self.table.c.run_id)).where(
-                self.table.c.pipeline_name == self.pipeline_name
-            )
-        ).first()[0]
-        if run_id is None:
-            return 1
-        else:
-            return run_id + 1
+        insert_statement = postgresql.insert(self.run_id_table).from_select(
+            ["pipeline_name", "run_id"],
+            select(
+                literal(self.pipeline_name),
+                func.coalesce(func.max(self.table.c.run_id), 0) + 1
+            ).where(self.table.c.pipeline_name == self.pipeline_name)
+        )
+        upsert_statement = insert_statement.on_conflict_do_update(
+            index_elements=["pipeline_name"],
+            set_={"run_id": self.run_id_table.c.run_id + 1},
+        ).returning(self.run_id_table.c.run_id)
+        with self.postgresql_client.engine.begin() as connection:
+            return connection.execute(upsert_statement).scalar()
 
     def log(
         self,
         status: MetaDataLoggingStatus = MetaDataLoggingStatus.RUN_START,
         timestamp: datetime = None,
         logs: str = None,
+        log_chunks: list[bytes] = None,
     ) -> None:
-        """Writes pipeline metadata log to a database"""
+        """
+        Queues a pipeline metadata log to be written to the database, with the logs of
+        the run as text, or as gzip-compressed chunks (see PipelineLogging.get_log_chunks()).
+        """
         if timestamp is None:
             timestamp = datetime.now()
-        insert_statement = insert(self.table).values(
-            pipeline_name=self.pipeline_name,
-            timestamp=timestamp,
-            run_id=self.run_id,
-            status=status,
-            config=self.config,
-            logs=logs,
-        )
-        self.postgresql_client.engine.execute(insert_statement)
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_rows, daemon=True)
+            self._writer.start()
+        self._queue.put((
+            self.table,
+            dict(
+                pipeline_name=self.pipeline_name,
+                timestamp=timestamp,
+                run_id=self.run_id,
+                status=status,
+                config=self.config,
+                logs=logs,
+            )
+        ))
+        for chunk_index, chunk in enumerate(log_chunks or []):
+            self._queue.put((
+                self.chunks_table,
+                dict(
+                    pipeline_name=self.pipeline_name,
+                    run_id=self.run_id,
+                    status=status,
+                    chunk_index=chunk_index,
+                    logs=chunk,
+                )
+            ))
+
+    def _write_rows(self) -> None:
+        """Inserts queued rows in batches until close() queues None."""
+        closed = False
+        while not closed:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in items:
+                closed = True
+                items = [item for item in items if item is not None]
+            if not items or self._writer_error is not None:
+                continue
+            rows_by_table = {}
+            for table, row in items:
+                rows_by_table.setdefault(table, []).append(row)
+            try:
+                # run logs are not pipeline work, keep them out of the db_round_trips run metric
+                writer_engine = self.postgresql_client.engine.execution_options(count_statements=False)
+                with writer_engine.begin() as connection:
+                    for table, rows in rows_by_table.items():
+                        connection.execute(insert(table), rows)
+            except BaseException as e:
+                self._writer_error = e
+
+    def get_logs(self, run_id: int, status: MetaDataLoggingStatus = None) -> str:
+        """Reads the stored logs of a run of the pipeline, of its entries with status if given."""
+        where = (self.chunks_table.c.pipeline_name == self.pipeline_name) & (self.chunks_table.c.run_id == run_id)
+        if status is not None:
+            where = where & (self.chunks_table.c.status == status)
+        with self.postgresql_client.engine.connect() as connection:
+            chunks = connection.execute(
+                select(self.chunks_table.c.logs).where(where)
+                .order_by(self.chunks_table.c.status, self.chunks_table.c.chunk_index)
+            ).scalars().all()
+        return decompress_logs(chunks)
+
+    def close(self) -> None:
+        """Waits until every queued row is written, raising the writer's error if any."""
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+        if self._writer_error is not None:
+            raise self._writer_error
@@ -1,29 +1,149 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import gzip
 import logging
+import queue
 import time
 
 
+class ChunkedLogHandler(logging.Handler):
+    """
+    Keeps the formatted log records of a run in memory as gzip-compressed chunks.
+
+    Records are buffered until they reach chunk_bytes, then the buffer is compressed into
+    a new chunk. The whole log is kept, and at most one chunk of it is uncompressed.
+    """
+
+    def __init__(self, chunk_bytes: int):
+        super().__init__()
+        self.chunk_bytes = chunk_bytes
+        self.chunks: list[bytes] = []
+        self.lines = []
+        self.size = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        line = self.format(record) + "\n"
+        self.lines.append(line)
+        self.size += len(line)
+        if self.size >= self.chunk_bytes:
+            self.chunks.append(gzip.compress("".join(self.lines).encode()))
+            self.lines = []
+            self.size = 0
+
+    def clear(self) -> None:
+        self.acquire()
+        try:
+            self.chunks = []
+            self.lines = []
+            self.size = 0
+        finally:
+            self.release()
+
+    def get_chunks(self) -> list[bytes]:
+        """Gets the compressed chunks, including the records not compressed yet."""
+        self.acquire()
+        try:
+            if not self.lines:
+                return list(self.chunks)
+            return [*self.chunks, gzip.compress("".join(self.lines).encode())]
+        finally:
+            self.release()
+
+
+def decompress_logs(chunks: list[bytes]) -> str:
+    """Joins gzip-compressed log chunks back into the text of the log."""
+    return "".join(gzip.decompress(chunk).decode() for chunk in chunks)
+
+
 class PipelineLogging:
-    def __init__(self, pipeline_name: str, log_folder_path: str):
+    """
+    Logs a pipeline run to the console and to a log file.
+
+    The logger only puts records on a queue, a background listener writes them out, so
+    logging does not wait on file or console I/O. The logs of the run are kept in memory
+    as gzip-compressed chunks of log_chunk_bytes for get_log_chunks() and get_logs().
+
+    Each PipelineLogging writes a new timestamped log file, or, when log_file_max_bytes
+    is set (e.g. for a resident process), appends to `<pipeline_name>.log`, rotated at
+    that size with log_file_backups old files kept. A new PipelineLogging for the same
+    pipeline closes the previous one and replaces its handlers. Call close() at the end
+    of the run.
+    """
+    def __init__(
+        self,
+        pipeline_name: str,
+        log_folder_path: str,
+        log_chunk_bytes: int = 64 * 1024,
+        log_file_max_bytes: int = None,
+        log_file_backups: int = 5,
+    ):
         self.pipeline_name = pipeline_name
         self.log_folder_path = log_folder_path
         logger = logging.getLogger(pipeline_name)
         logger.setLevel(logging.INFO)
-        self.file_path = (
-            f"{self.log_folder_path}/{self.pipeline_name}_{time.time()}.log"
-        )
-        file_handler = logging.FileHandler(self.file_path)
-        file_handler.setLevel(logging.INFO)
-        stream_handler = logging.StreamHandler()
-        stream_handler.setLevel(logging.INFO)
+        if log_file_max_bytes is None:
+            self.file_path = f"{self.log_folder_path}/{self.pipeline_name}_{time.time()}.log"
+            file_handler = logging.FileHandler(self.file_path)
+        else:
+            self.file_path = f"{self.log_folder_path}/{self.pipeline_name}.log"
+            file_handler = RotatingFileHandler(
+                self.file_path, maxBytes=log_file_max_bytes, backupCount=log_file_backups
+            )
         formatter = logging.Formatter(
             "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
         )
-        file_handler.setFormatter(formatter)
-        stream_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        logger.addHandler(stream_handler)
+        stream_handler = logging.StreamHandler()
+        self.chunk_handler = ChunkedLogHandler(chunk_bytes=log_chunk_bytes)
+        for handler in (file_handler, stream_handler, self.chunk_handler):
+            handler.setLevel(logging.INFO)
+            handler.setFormatter(formatter)
+        log_queue = queue.SimpleQueue()
+        self.listener = QueueListener(
+            log_queue, file_handler, stream_handler, self.chunk_handler,
+            respect_handler_level=True
+        )
+        self.listener.start()
+        self.closed = False
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            replaced_logging = getattr(handler, "pipeline_logging", None)
+            if replaced_logging is not None:
+                # stop the listener thread of the replaced PipelineLogging and close its file
+                replaced_logging.close()
+            handler.close()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.pipeline_logging = self
+        logger.addHandler(queue_handler)
         self.logger = logger
 
+    def flush(self) -> None:
+        """Waits until every record logged so far has been written."""
+        if self.closed:
+            return
+        self.listener.stop()
+        self.listener.start()
+
+    def get_log_chunks(self) -> list[bytes]:
+        """Gets the logs of the run as gzip-compressed chunks (see decompress_logs())."""
+        self.flush()
+        return self.chunk_handler.get_chunks()
+
     def get_logs(self) -> str:
-        with open(self.file_path, "r") as file:
-            return "".join(file.readlines())
+        """Gets the logs of the run."""
+        return decompress_logs(self.get_log_chunks())
+
+    def clear_logs(self) -> None:
+        """Starts a new run in a long-running process, so get_logs() only returns its logs."""
+        self.flush()
+        self.chunk_handler.clear()
+
+    def close(self) -> None:
+        """Writes the remaining records and detaches the handlers from the logger."""
+        if self.closed:
+            return
+        self.closed = True
+        self.listener.stop()
+        for handler in list(self.logger.handlers):
+            if getattr(handler, "pipeline_logging", None) is self:
+                self.logger.removeHandler(handler)
+        for handler in self.listener.handlers:
+            handler.close()
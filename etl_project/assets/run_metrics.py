@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+from etl_project.connectors.postgresql import PostgreSqlClient
+from sqlalchemy import Table, Column, String, Integer, BigInteger, Float, DateTime, MetaData
+from sqlalchemy.dialects import postgresql
+import os
+import resource
+import sys
+import time
+
+
+# metrics recorded for every stage, and the column type they are stored with
+STAGE_METRICS = {
+    "wall_seconds": Float,
+    "cpu_seconds": Float,
+    "rows_in": BigInteger,
+    "rows_out": BigInteger,
+    "bytes_fetched": BigInteger,
+    "peak_rss_bytes": BigInteger,
+    "db_round_trips": BigInteger,
+    "http_retries": BigInteger,
+}
+
+
+def peak_rss_bytes() -> int:
+    """Gets the peak resident set size of the current process."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+class RunMetrics:
+    """
+    Collects timing, row count and resource metrics per stage of a pipeline run.
+
+    Wrap a stage in `with run_metrics.stage(name) as metrics:` to record its wall and CPU
+    time, the statements it sent through postgresql_client (without those of the
+    background metadata log writer) and the peak RSS at its end, and set counts such as
+    metrics["rows_in"] in the block. Metrics measured elsewhere,
+    e.g. in worker processes, are added with add(). Stages entered several times
+    accumulate.
+
+    write() stores one row per stage in the metrics table, keyed by pipeline name, run
+    id and stage. write_prometheus() writes them in the Prometheus textfile format.
+    """
+    def __init__(
+        self,
+        pipeline_name: str,
+        run_id: int,
+        postgresql_client: PostgreSqlClient = None,
+        metrics_table_name: str = "pipeline_run_metrics",
+    ):
+        self.pipeline_name = pipeline_name
+        self.run_id = run_id
+        self.postgresql_client = postgresql_client
+        self.metrics_table_name = metrics_table_name
+        self.stages: dict[str, dict] = {}
+        self.metadata = MetaData()
+        self.table = Table(
+            self.metrics_table_name,
+            self.metadata,
+            Column("pipeline_name", String, primary_key=True),
+            Column("run_id", Integer, primary_key=True),
+            Column("stage", String, primary_key=True),
+            *[Column(name, column_type) for name, column_type in STAGE_METRICS.items()],
+            Column("recorded_at", DateTime),
+        )
+
+    def _stage_metrics(self, name: str) -> dict:
+        return self.stages.setdefault(name, dict.fromkeys(STAGE_METRICS, 0))
+
+    def _db_round_trips(self) -> int:
+        if self.postgresql_client is None:
+            return 0
+        return self.postgresql_client.pool_status()["statements"]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        """Measures the block as stage `name`, yielding its metrics dictionary."""
+        metrics = self._stage_metrics(name)
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_db_round_trips = self._db_round_trips()
+        try:
+            yield metrics
+        finally:
+            metrics["wall_seconds"] += time.perf_counter() - start_wall
+            metrics["cpu_seconds"] += time.process_time() - start_cpu
+            metrics["db_round_trips"] += self._db_round_trips() - start_db_round_trips
+            metrics["peak_rss_bytes"] = max(metrics["peak_rss_bytes"], peak_rss_bytes())
+
+    def add(self, name: str, **values) -> None:
+        """Adds measured values to stage `name`, keeping the maximum of peak_rss_bytes."""
+        metrics = self._stage_metrics(name)
+        for key, value in values.items():
+            if key == "peak_rss_bytes":
+                metrics[key] = max(metrics[key], value)
+            else:
+                metrics[key] += value
+
+    def write(self) -> None:
+        """Stores the metrics of every stage in the metrics table."""
+        if not self.stages:
+            return
+        self.postgresql_client.create_table(self.metrics_table_name, metadata=self.metadata)
+        recorded_at = datetime.now()
+        insert_statement = postgresql.insert(self.table).values([
+            dict(pipeline_name=self.pipeline_name, run_id=self.run_id, stage=stage, recorded_at=recorded_at, **metrics)
+            for stage, metrics in self.stages.items()
+        ])
+        self.postgresql_client.execute(
+            insert_statement.on_conflict_do_update(
+                index_elements=["pipeline_name", "run_id", "stage"],
+                set_={name: insert_statement.excluded[name] for name in [*STAGE_METRICS, "recorded_at"]},
+            )
+        )
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Writes the metrics of every stage to a Prometheus textfile, e.g. for the node
+        exporter's textfile collector. The file is replaced atomically.
+        """
+        lines = []
+        for name in STAGE_METRICS:
+            metric_name = f"etl_pipeline_stage_{name}"
+            lines.append(f"# TYPE {metric_name} gauge")
+            for stage, metrics in self.stages.items():
+                lines.append(
+                    f'{metric_name}{{pipeline="{self.pipeline_name}",stage="{stage}"}} {metrics[name]}'
+                )
+        lines.append("# TYPE etl_pipeline_run_id gauge")
+        lines.append(f'etl_pipeline_run_id{{pipeline="{self.pipeline_name}"}} {self.run_id}')
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, path)
@@ -0,0 +1,56 @@
+from typing import Callable
+import time
+
+
+class LocationScheduler:
+    """
+    Schedules the refresh of each location on its own interval.
+
+    Every location is refreshed every interval_seconds, or intervals[location_key] when
+    set. The first refreshes are spread evenly over the interval, so the API and the
+    database see a steady load instead of every location at once. A location that falls
+    behind is rescheduled one interval from now rather than catching up in a burst.
+    """
+    def __init__(
+        self,
+        location_keys: list[int],
+        interval_seconds: float,
+        intervals: dict[int, float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.interval_seconds = interval_seconds
+        self.intervals = intervals or {}
+        self.clock = clock
+        self.next_due: dict[int, float] = {}
+        self.set_locations(location_keys)
+
+    def interval(self, location_key: int) -> float:
+        return self.intervals.get(location_key, self.interval_seconds)
+
+    def set_locations(self, location_keys: list[int]) -> None:
+        """
+        Updates the scheduled locations. New locations are staggered over their interval
+        from now, removed ones are dropped, and the others keep their schedule.
+        """
+        now = self.clock()
+        # called on every tick with thousands of keys, keep the membership tests O(1)
+        scheduled_keys = set(location_keys)
+        new_keys = [key for key in location_keys if key not in self.next_due]
+        self.next_due = {key: due for key, due in self.next_due.items() if key in scheduled_keys}
+        for index, key in enumerate(new_keys):
+            self.next_due[key] = now + self.interval(key) * index / len(new_keys)
+
+    def due(self) -> list[int]:
+        """Gets the locations due for a refresh and schedules their next one."""
+        now = self.clock()
+        due_keys = sorted(key for key, due in self.next_due.items() if due <= now)
+        for key in due_keys:
+            next_due = self.next_due[key] + self.interval(key)
+            self.next_due[key] = next_due if next_due > now else now + self.interval(key)
+        return due_keys
+
+    def seconds_until_next(self) -> float:
+        """Gets the time until the next location is due, or None without locations."""
+        if not self.next_due:
+            return None
+        return max(min(self.next_due.values()) - self.clock(), 0)
@@ -1,13 +1,17 @@
 {% set config = {
+    "sources": [source_table_name],
+    "target": target_table_name,
     "extract_type": "incremental",
-    "incremental_column": "date"
+    "incremental_column": "date",
+    "watermark_strategy": "current_date",
+    "materialization": "in_database"
 } %}
 
 select
-    cast('{{ incremental_value }}' as date) as date,
+    cast({{ incremental_parameter }} as date) as date,
     sum(cast(has_precipitation as int)) as count_precipitations_next_five_days
 from 
     {{ source_table_name }}
 {% if is_incremental %}
-    where {{ config["incremental_column"] }} >= '{{ incremental_value }}'
+    where {{ config["incremental_column"] }} >= cast({{ incremental_parameter }} as date)
 {% endif %}
@@ -1,61 +1,332 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from jinja2 import Environment, FileSystemLoader, Template
-from sqlalchemy import MetaData
-from etl_project.connectors.postgresql import PostgreSqlClient
+from functools import lru_cache
+from graphlib import TopologicalSorter
+from typing import Iterator
+from weakref import WeakKeyDictionary
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+from sqlalchemy import MetaData, Table
+from etl_project.connectors.postgresql import PostgreSqlClient, UpsertCounts
+from etl_project.assets.watermark import WatermarkStore
+import logging
+import os
+import threading
 
 
-def staging_transform(
+# bind marker rendered for the incremental value, its value is sent as a query parameter
+INCREMENTAL_PARAMETER = ":incremental_value"
+
+_template_configs = WeakKeyDictionary()
+_template_configs_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_environment(environment_path: str, bytecode_cache_path: str = None) -> Environment:
+    """
+    Gets the Jinja environment of a template folder.
+
+    The environment is created once per process, so compiled templates are kept in its
+    template cache between transform_load() calls (and reloaded when the file changes).
+    When bytecode_cache_path is set, compiled templates are also stored in that folder
+    and shared across runs.
+    """
+    bytecode_cache = None
+    if bytecode_cache_path is not None:
+        os.makedirs(bytecode_cache_path, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_path)
+    return Environment(loader=FileSystemLoader(environment_path), bytecode_cache=bytecode_cache)
+
+
+def get_template_config(
     sql_template: Template,
+    source_table_name: str = None,
+    target_table_name: str = None
+) -> dict:
+    """
+    Gets the config set in a sql template, evaluating the template module only once
+    per compiled template and table names.
+
+    The config can refer to the staging and serving tables of the pipeline config as
+    {{ source_table_name }} and {{ target_table_name }}, e.g. in its sources and target.
+    """
+    table_names = (source_table_name, target_table_name)
+    with _template_configs_lock:
+        configs = _template_configs.setdefault(sql_template, {})
+        config = configs.get(table_names)
+        if config is None:
+            config = sql_template.make_module({
+                "source_table_name": source_table_name,
+                "target_table_name": target_table_name,
+            }).config
+            configs[table_names] = config
+        return config
+
+
+def get_watermarks(
+    config: dict,
+    template_name: str,
     postgresql_client: PostgreSqlClient,
-    source_table_name: str
-):
-    """Transform staging table."""
-    extract_type = sql_template.make_module().config.get("extract_type")
+    source_table_name: str,
+    watermark_store: WatermarkStore = None
+) -> tuple[str, str]:
+    """
+    Gets the incremental value to transform from, and the watermark to store once the
+    transformation is loaded.
+
+    The template config selects the strategy with "watermark_strategy":
+    - "current_date" (default): rows from today onwards are transformed on every run.
+    - "high_watermark": rows from the stored watermark onwards are transformed, and the
+      watermark advances to the current maximum of the incremental column. When no
+      watermark is stored yet, "initial_watermark" is used, or the whole table.
+    """
+    watermark_strategy = config.get("watermark_strategy", "current_date")
+    if watermark_strategy == "current_date":
+        current_date = datetime.today().strftime('%Y-%m-%d')
+        return current_date, current_date
+    elif watermark_strategy == "high_watermark":
+        incremental_value = None
+        if watermark_store is not None:
+            incremental_value = watermark_store.get(template_name)
+        if incremental_value is None:
+            incremental_value = config.get("initial_watermark")
+        new_watermark = postgresql_client.execute_sql(
+            f"select max({config['incremental_column']}) from {source_table_name}"
+        )[0][0]
+        return incremental_value, new_watermark
+    else:
+        raise Exception(
+            f"Watermark strategy {watermark_strategy} is not supported. Please use either 'current_date' or 'high_watermark' watermark strategy."
+        )
+
+
+def render_transform(
+    sql_template: Template,
+    source_table_name: str,
+    incremental_value: str = None
+) -> tuple[str, dict]:
+    """
+    Render the sql template of a transformation. Incremental templates transform rows
+    from incremental_value onwards, or every row when incremental_value is None.
+
+    Returns the sql and its query parameters. Templates that use
+    `{{ incremental_parameter }}` instead of `'{{ incremental_value }}'` bind the
+    incremental value as a parameter rather than quoting it into the sql.
+    """
+    extract_type = get_template_config(sql_template, source_table_name).get("extract_type")
     if extract_type == "full":
-        sql = sql_template.render()
-        return [dict(row) for row in postgresql_client.execute_sql(sql)]
+        return sql_template.render(), {}
     elif extract_type == "incremental":
-        # incremental extraction is based on current date
-        current_date = datetime.today().strftime('%Y-%m-%d')
         sql = sql_template.render(
-            is_incremental=True, 
+            is_incremental=incremental_value is not None,
             source_table_name=source_table_name,
-            incremental_value=current_date
+            incremental_value=incremental_value,
+            incremental_parameter=INCREMENTAL_PARAMETER
         )
-        return [dict(row) for row in postgresql_client.execute_sql(sql)]
+        return sql, {"incremental_value": incremental_value}
     else:
         raise Exception(
             f"Extract type {extract_type} is not supported. Please use either 'full' or 'incremental' extract type."
         )
 
 
+def staging_transform(
+    sql_template: Template,
+    postgresql_client: PostgreSqlClient,
+    source_table_name: str,
+    batch_size: int = 1000,
+    incremental_value: str = None
+) -> Iterator[dict]:
+    """
+    Transform staging table.
+
+    Rows are streamed from a server-side cursor, batch_size at a time, rather than
+    being loaded into memory all at once.
+    """
+    sql, parameters = render_transform(
+        sql_template=sql_template,
+        source_table_name=source_table_name,
+        incremental_value=incremental_value
+    )
+    return postgresql_client.stream_sql(sql, batch_size=batch_size, parameters=parameters)
+
+
+def transform_load_template(
+    sql_template: Template,
+    template_name: str,
+    postgresql_client: PostgreSqlClient,
+    metadata: MetaData,
+    source_table_name: str,
+    target_table: Table,
+    batch_size: int = 1000,
+    max_batch_bytes: int = None,
+    watermark_store: WatermarkStore = None
+) -> UpsertCounts:
+    """
+    Transform one sql template and load its result into the target table, returning how
+    many rows were inserted, updated and skipped because they were unchanged.
+    """
+    config = get_template_config(sql_template, source_table_name, target_table.name)
+    incremental_value, new_watermark = None, None
+    if config.get("extract_type") == "incremental":
+        incremental_value, new_watermark = get_watermarks(
+            config=config,
+            template_name=template_name,
+            postgresql_client=postgresql_client,
+            source_table_name=source_table_name,
+            watermark_store=watermark_store
+        )
+
+    materialization = config.get("materialization", "round_trip")
+    if materialization == "in_database":
+        # apply transformation defined in sql template and upsert the result in place
+        sql, parameters = render_transform(
+            sql_template=sql_template,
+            source_table_name=source_table_name,
+            incremental_value=incremental_value
+        )
+        counts = postgresql_client.upsert_from_select(
+            sql=sql,
+            table=target_table,
+            metadata=metadata,
+            parameters=parameters
+        )
+    elif materialization == "round_trip":
+        # extract data from staging and apply transformation defined in sql template
+        data = staging_transform(
+            sql_template=sql_template,
+            postgresql_client=postgresql_client,
+            source_table_name=source_table_name,
+            batch_size=batch_size,
+            incremental_value=incremental_value
+        )
+
+        counts = postgresql_client.upsert(
+            data=data,
+            table=target_table,
+            metadata=metadata,
+            batch_size=batch_size,
+            max_batch_bytes=max_batch_bytes
+        )
+    else:
+        raise Exception(
+            f"Materialization {materialization} is not supported. Please use either 'in_database' or 'round_trip' materialization."
+        )
+
+    if watermark_store is not None and new_watermark is not None:
+        watermark_store.set(template_name, new_watermark)
+    return counts
+
+
+def get_template_dependencies(templates: dict[str, dict]) -> dict[str, set[str]]:
+    """
+    Builds the dependency graph of transform templates from their configs.
+
+    A template depends on every template whose "target" is one of its "sources".
+    Returns a mapping of template name to the names of the templates it depends on.
+    """
+    producers = {}
+    for template_name, config in templates.items():
+        producers.setdefault(config["target"], set()).add(template_name)
+    return {
+        template_name: {
+            producer
+            for source in config["sources"]
+            for producer in producers.get(source, set())
+            if producer != template_name
+        }
+        for template_name, config in templates.items()
+    }
+
+
 def transform_load(
     environment_path: str,
     postgresql_client: PostgreSqlClient,
     metadata: MetaData,
     source_table_name: str,
-    target_table_name: str
-):
-    """Create serving table based off a staging table and load to database."""
-    environment = Environment(loader=FileSystemLoader(environment_path))
+    target_table_name: Table = None,
+    batch_size: int = 1000,
+    max_batch_bytes: int = None,
+    watermark_store: WatermarkStore = None,
+    max_workers: int = 4,
+    bytecode_cache_path: str = None
+) -> dict[str, UpsertCounts]:
+    """
+    Create serving tables based off staging tables and load to database.
+
+    Each template declares the tables it reads with "sources" and the table it loads with
+    "target" in its config, defaulting to source_table_name and target_table_name. Target
+    tables are looked up by name in metadata. Templates run as a dependency graph: a
+    template starts once every template loading one of its sources has finished, and
+    independent templates run concurrently on up to max_workers pooled connections, each
+    in its own transaction.
+
+    The transformed rows are streamed from staging and upserted in batches of batch_size
+    rows (and at most max_batch_bytes of values).
+
+    Incremental templates are transformed from their watermark (see get_watermarks()),
+    which is stored in watermark_store once the load succeeded.
+
+    The template config selects where the transformation is materialised with
+    "materialization": "in_database" runs a single INSERT ... SELECT ... ON CONFLICT on
+    the server, "round_trip" (default) streams the rows through Python.
+
+    Compiled templates and their configs are cached per process, and in
+    bytecode_cache_path across runs (see get_environment()).
+
+    Returns the rows inserted, updated and skipped of each template that ran.
+    """
+    environment = get_environment(environment_path, bytecode_cache_path)
+    sql_templates = {}
+    templates = {}
+    target_name = target_table_name.name if target_table_name is not None else None
     for sql_path in environment.list_templates():
         sql_template = environment.get_template(sql_path)
+        config = get_template_config(sql_template, source_table_name, target_name)
+        sql_templates[sql_path] = sql_template
+        templates[sql_path] = {
+            "sources": config.get("sources", [source_table_name]),
+            "target": config.get("target", target_name),
+        }
 
-        # check if source table exists in source database
-        if postgresql_client.table_exists(
-            source_table_name
-        ):
-            # extract data from staging and apply transformation defined in sql template
-            data = staging_transform(
-                sql_template=sql_template,
+    counts = {}
+
+    def run(template_name: str) -> None:
+        sources = templates[template_name]["sources"]
+        missing_sources = [
+            source for source in sources if not postgresql_client.table_exists(source)
+        ]
+        # check if source tables exist in source database
+        if missing_sources:
+            logging.getLogger(__name__).warning(
+                f"Tables {missing_sources} do not exist in source database. Transformation and load of {template_name} did not happen."
+            )
+            return
+        target = templates[template_name]["target"]
+        if target not in metadata.tables:
+            raise Exception(f"Target table {target} of template {template_name} is not defined in metadata.")
+        with postgresql_client.begin():
+            counts[template_name] = transform_load_template(
+                sql_template=sql_templates[template_name],
+                template_name=template_name,
                 postgresql_client=postgresql_client,
-                source_table_name=source_table_name
+                metadata=metadata,
+                source_table_name=sources[0],
+                target_table=metadata.tables[target],
+                batch_size=batch_size,
+                max_batch_bytes=max_batch_bytes,
+                watermark_store=watermark_store
             )
 
-            postgresql_client.upsert(
-                data=data,
-                table=target_table_name,
-                metadata=metadata
-            )
-        else:
-            print("Table {source_table_name} does not exist in source database. Transformation and load did not happen.")
+    sorter = TopologicalSorter(get_template_dependencies(templates))
+    sorter.prepare()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while sorter.is_active():
+            for template_name in sorter.get_ready():
+                running[executor.submit(run, template_name)] = template_name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                template_name = running.pop(future)
+                future.result()
+                sorter.done(template_name)
+    return counts
@@ -0,0 +1,62 @@
+from etl_project.connectors.postgresql import PostgreSqlClient
+from datetime import datetime
+from sqlalchemy import Table, Column, String, DateTime, MetaData
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+
+class WatermarkStore:
+    """
+    Persists the high watermark of each transform template, per pipeline.
+
+    The watermark is the last value of a template's incremental column that was
+    transformed and loaded successfully, stored as text.
+    """
+    def __init__(
+        self,
+        pipeline_name: str,
+        postgresql_client: PostgreSqlClient,
+        watermark_table_name: str = "pipeline_watermarks",
+    ):
+        self.pipeline_name = pipeline_name
+        self.watermark_table_name = watermark_table_name
+        self.postgresql_client = postgresql_client
+        self.metadata = MetaData()
+        self.table = Table(
+            self.watermark_table_name,
+            self.metadata,
+            Column("pipeline_name", String, primary_key=True),
+            Column("template_name", String, primary_key=True),
+            Column("watermark", String),
+            Column("updated_at", DateTime),
+        )
+
+    def get(self, template_name: str) -> str:
+        """Gets the watermark of a template, or None if it never ran."""
+        self.postgresql_client.create_table(self.watermark_table_name, metadata=self.metadata)
+        rows = self.postgresql_client.execute_sql(
+            select(self.table.c.watermark).where(
+                self.table.c.pipeline_name == self.pipeline_name,
+                self.table.c.template_name == template_name,
+            )
+        )
+        return rows[0][0] if rows else None
+
+    def set(self, template_name: str, watermark: str) -> None:
+        """Stores the watermark of a template."""
+        self.postgresql_client.create_table(self.watermark_table_name, metadata=self.metadata)
+        insert_statement = postgresql.insert(self.table).values(
+            pipeline_name=self.pipeline_name,
+            template_name=template_name,
+            watermark=str(watermark),
+            updated_at=datetime.now(),
+        )
+        self.postgresql_client.execute(
+            insert_statement.on_conflict_do_update(
+                index_elements=["pipeline_name", "template_name"],
+                set_={
+                    "watermark": insert_statement.excluded.watermark,
+                    "updated_at": insert_statement.excluded.updated_at,
+                },
+            )
+        )
@@ -1,16 +1,223 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from etl_project.connectors.response_cache import ResponseCache
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+import math
+import random
 import requests
+import threading
+import time
+
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class AccuWeatherApiError(Exception):
+    """Raised when the AccuWeather API does not return usable forecast data."""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AccuWeatherQuotaExceeded(AccuWeatherApiError):
+    """Raised when the daily call quota is used up and cannot be waited out."""
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting how many requests are sent per second.
+
+    Up to `burst` requests may be sent back to back, after which callers are
+    spaced out to `requests_per_second`.
+    """
+    def __init__(self, requests_per_second: float, burst: int = 1):
+        if requests_per_second <= 0:
+            raise Exception("requests_per_second must be greater than 0.")
+        self.requests_per_second = requests_per_second
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request is allowed to be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._last_refill) * self.requests_per_second
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.requests_per_second
+            time.sleep(wait_seconds)
+
+
+class QuotaTracker:
+    """
+    Tracks the remaining daily call quota reported by the AccuWeather API.
+
+    The quota is read from the `RateLimit-Limit` and `RateLimit-Remaining` response
+    headers and resets at midnight UTC. Once the remaining quota drops below
+    `low_watermark` calls, requests are paced so the rest of the quota is spread
+    over the time left until the reset instead of being burnt through at once.
+    Calls below `reserve` are never spent.
+    """
+    def __init__(
+        self,
+        reserve: int = 0,
+        low_watermark: int = None,
+        max_wait_seconds: float = 0
+    ):
+        self.reserve = reserve
+        self.low_watermark = low_watermark
+        self.max_wait_seconds = max_wait_seconds
+        self.limit: int = None
+        self.remaining: int = None
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, headers: dict) -> None:
+        """Update the quota from the headers of an API response."""
+        with self._lock:
+            if headers.get("RateLimit-Limit") is not None:
+                self.limit = int(headers["RateLimit-Limit"])
+            if headers.get("RateLimit-Remaining") is not None:
+                self.remaining = int(headers["RateLimit-Remaining"])
+
+    @staticmethod
+    def seconds_until_reset() -> float:
+        now = datetime.now(timezone.utc)
+        reset = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (reset - now).total_seconds()
+
+    def acquire(self) -> None:
+        """
+        Block until a request may be spent against the quota.
+
+        Raises:
+            AccuWeatherQuotaExceeded when the quota is used up and the wait until the
+            reset is longer than max_wait_seconds.
+        """
+        with self._lock:
+            if self.remaining is None:
+                return
+            available = self.remaining - self.reserve
+            if available <= 0:
+                wait_seconds = self.seconds_until_reset()
+                if wait_seconds > self.max_wait_seconds:
+                    raise AccuWeatherQuotaExceeded(
+                        f"AccuWeather API call quota exhausted ({self.remaining} calls remaining, {self.reserve} reserved)."
+                    )
+                # the quota is fresh again after the reset
+                self.remaining = None
+            else:
+                low_watermark = self.low_watermark
+                if low_watermark is None and self.limit is not None:
+                    low_watermark = self.limit // 10
+                if low_watermark is None or available > low_watermark:
+                    return
+                interval = self.seconds_until_reset() / available
+                now = time.monotonic()
+                self._next_slot = max(self._next_slot + interval, now)
+                wait_seconds = self._next_slot - now
+                # optimistically spend the call so concurrent callers are paced too
+                self.remaining -= 1
+        time.sleep(wait_seconds)
 
 
 class AccuWeatherApiClient:
     """
     Client for getting data from AccuWeather API.
+
+    All requests go through a single pooled keep-alive session, so concurrent
+    calls reuse the same TCP/TLS connections instead of opening one per call.
+
+    Connection errors and responses with a status in RETRYABLE_STATUS_CODES are
+    retried up to max_retries times with exponential backoff and full jitter,
+    honouring the `Retry-After` header when the API sends one. Every request gives up
+    after timeout seconds, a (connect, read) pair or a single value for both, and is
+    retried like a connection error.
+
+    When a response_cache is given, fresh forecasts are served from disk and stale
+    ones are revalidated with the ETag / Last-Modified the API sent last time.
     """
-    def __init__(self, api_key: str):
-        self.base_url = "https://dataservice.accuweather.com"
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://dataservice.accuweather.com",
+        max_workers: int = 8,
+        requests_per_second: float = None,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60,
+        quota_tracker: QuotaTracker = None,
+        response_cache: ResponseCache = None,
+        timeout: float | tuple[float, float] = (10, 30),
+    ):
+        self.base_url = base_url
         if api_key is None:
             raise Exception("API key cannot be set to None.")
         self.api_key = api_key
+        self.max_workers = max_workers
+        self.rate_limiter = (
+            RateLimiter(requests_per_second=requests_per_second)
+            if requests_per_second is not None else None
+        )
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.quota_tracker = quota_tracker if quota_tracker is not None else QuotaTracker()
+        self.retries = 0
+        self.bytes_fetched = 0
+        # counters are updated from the threads of get_forecasts()
+        self._counters_lock = threading.Lock()
+        self.response_cache = response_cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_config(cls, api_key: str, config: dict, workers: int = 1) -> "AccuWeatherApiClient":
+        """
+        Creates a client from the pipeline config.
+
+        When the client is one of `workers` clients sharing the API (e.g. one per process),
+        the requests_per_second budget is split evenly between them.
+        """
+        requests_per_second = config.get("requests_per_second")
+        response_cache_path = config.get("response_cache_path")
+        timeout = config.get("timeout_seconds", (10, 30))
+        if isinstance(timeout, list):
+            # a YAML list is the (connect, read) pair
+            timeout = tuple(timeout)
+        return cls(
+            api_key=api_key,
+            base_url=config.get("base_url", "https://dataservice.accuweather.com"),
+            max_workers=config.get("max_workers", 8),
+            requests_per_second=(
+                requests_per_second / workers if requests_per_second is not None else None
+            ),
+            max_retries=config.get("max_retries", 5),
+            timeout=timeout,
+            quota_tracker=QuotaTracker(reserve=config.get("quota_reserve", 0)),
+            response_cache=(
+                ResponseCache(
+                    path=response_cache_path,
+                    ttl_seconds=config.get("response_cache_ttl_seconds", 3600),
+                    max_bytes=config.get("response_cache_max_bytes", 64 * 1024 * 1024),
+                )
+                if response_cache_path is not None else None
+            ),
+        )
 
     def get_forecast(
             self, location_key: int, forecast_days: int
@@ -18,16 +225,16 @@ class AccuWeatherApiClient:
         """Extract forecast data from AccuWeather API.
 
         Args:
-            location_key: provide an integer based on your desired location. The Locations 
+            location_key: provide an integer based on your desired location. The Locations
                 API can be used to obtain the location key for your desired location.
             forecast)days: provide an integer based on the desired number of forecasted days.
                 Possible values are 1, 5, 10, and 15.
-        
+
         Returns:
             A list of dictionaries with forecast data.
-        
+
         Raises:
-            Exception when it is not possible to extract data from the API.
+            AccuWeatherApiError when it is not possible to extract data from the API.
         """
         forecast_url = f"{self.base_url}/forecasts/v1/daily/{forecast_days}day/{location_key}"
         params = {
@@ -36,10 +243,123 @@ class AccuWeatherApiClient:
             "details": "true",
             "metric": "true"
         }
-        response = requests.get(url=forecast_url, params=params)
+        cache_key = f"{forecast_url}?language={params['language']}&details={params['details']}&metric={params['metric']}"
+        cached_response = None
+        headers = {}
+        if self.response_cache is not None:
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                if self.response_cache.is_fresh(cached_response):
+                    return cached_response.data
+                if cached_response.etag is not None:
+                    headers["If-None-Match"] = cached_response.etag
+                if cached_response.last_modified is not None:
+                    headers["If-Modified-Since"] = cached_response.last_modified
+        response = self._get(url=forecast_url, params=params, headers=headers)
+        if response.status_code == 304 and cached_response is not None:
+            self.response_cache.touch(cache_key)
+            return cached_response.data
         if response.status_code == 200 and response.json().get("DailyForecasts") is not None:
-            return response.json().get("DailyForecasts")
+            data = response.json().get("DailyForecasts")
+            if self.response_cache is not None:
+                self.response_cache.set(
+                    cache_key,
+                    data,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified")
+                )
+            return data
         else:
-            raise Exception(
-                f"Failes to extract data from AccuWeather API. Status Code: {response.status_code}. Response: {response.text}"
+            raise AccuWeatherApiError(
+                f"Failes to extract data from AccuWeather API. Status Code: {response.status_code}. Response: {response.text}",
+                status_code=response.status_code
             )
+
+    def _get(self, url: str, params: dict, headers: dict = None) -> requests.Response:
+        """Send a GET request, retrying transient failures with backoff."""
+        attempt = 0
+        while True:
+            self.quota_tracker.acquire()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.get(url=url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                response = None
+            if response is not None:
+                with self._counters_lock:
+                    self.bytes_fetched += len(response.content)
+                self.quota_tracker.update(response.headers)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+            time.sleep(self._retry_delay(attempt=attempt, response=response))
+            attempt += 1
+            with self._counters_lock:
+                self.retries += 1
+
+    def _retry_delay(self, attempt: int, response: requests.Response = None) -> float:
+        """
+        Seconds to wait before the next attempt, preferring the API's Retry-After, capped
+        at max_backoff. A Retry-After that cannot be parsed falls back to the backoff.
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None:
+            delay = self._parse_retry_after(retry_after)
+            if delay is not None:
+                return min(max(delay, 0), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    @staticmethod
+    def _parse_retry_after(retry_after: str) -> float:
+        """Seconds to wait of a Retry-After in seconds or as an HTTP date, or None if invalid."""
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError, IndexError):
+                return None
+            if retry_at.tzinfo is None:
+                # HTTP dates are in GMT
+                retry_at = retry_at.replace(tzinfo=timezone.utc)
+            delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        return delay if math.isfinite(delay) else None
+
+    def get_forecasts(
+            self,
+            location_keys: list[int],
+            forecast_days: int,
+            max_workers: int = None,
+            return_exceptions: bool = False
+    ) -> dict[int, list[dict]]:
+        """Extract forecast data for many locations concurrently.
+
+        Args:
+            location_keys: list of location keys to extract forecasts for.
+            forecast_days: number of forecasted days. Possible values are 1, 5, 10, and 15.
+            max_workers: maximum number of requests in flight at once. Defaults to the
+                client's max_workers.
+            return_exceptions: when True, a location that fails is mapped to the raised
+                exception instead of aborting the whole batch.
+
+        Returns:
+            A dictionary mapping each location key to its list of forecast dictionaries.
+
+        Raises:
+            Exception when a location fails and return_exceptions is False.
+        """
+        max_workers = min(max_workers or self.max_workers, self.max_workers)
+
+        def fetch(location_key: int):
+            try:
+                return self.get_forecast(location_key=location_key, forecast_days=forecast_days)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(fetch, location_keys)
+            return dict(zip(location_keys, results))
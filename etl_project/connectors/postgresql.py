@@ -1,10 +1,96 @@
-from sqlalchemy import create_engine, MetaData, Table, Column, inspect
-from sqlalchemy.engine import URL
+from contextlib import contextmanager
+from datetime import date
+from typing import TYPE_CHECKING, Iterable, Iterator, NamedTuple
+from sqlalchemy import create_engine, event, MetaData, Table, Column, Integer, JSON, inspect, select, text
+from sqlalchemy import column as sql_column, func, literal, literal_column, tuple_
+from sqlalchemy.engine import URL, Connection
 from sqlalchemy.dialects import postgresql
+import os
+import sys
+import threading
+
+if TYPE_CHECKING:
+    # only used in annotations, so that importing the client does not load pandas
+    import pandas as pd
+
+
+# pool settings accepted by PostgreSqlClient, with the type used to parse them from the environment
+POOL_SETTINGS = {
+    "pool_size": int,
+    "max_overflow": int,
+    "pool_timeout": float,
+    "pool_recycle": int,
+    "pool_pre_ping": lambda value: str(value).lower() in ("1", "true", "yes"),
+    "statement_timeout_ms": int,
+}
+
+
+class UpsertCounts(NamedTuple):
+    """Number of rows an upsert inserted, updated, and skipped because they were unchanged."""
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+    def add(self, other: "UpsertCounts") -> "UpsertCounts":
+        return UpsertCounts(*(a + b for a, b in zip(self, other)))
+
+    @classmethod
+    def total(cls, counts: Iterable["UpsertCounts"]) -> "UpsertCounts":
+        total = cls()
+        for other in counts:
+            total = total.add(other)
+        return total
+
+
+def _batched(rows: Iterable[dict], batch_size: int, max_batch_bytes: int = None) -> Iterator[list[dict]]:
+    """
+    Groups rows into lists of at most batch_size rows.
+
+    When max_batch_bytes is set, a batch is also closed once the approximate in-memory
+    size of its values reaches that ceiling.
+    """
+    batch = []
+    batch_bytes = 0
+    for row in rows:
+        batch.append(row)
+        if max_batch_bytes is not None:
+            batch_bytes += sum(sys.getsizeof(value) for value in row.values())
+        if len(batch) >= batch_size or (max_batch_bytes is not None and batch_bytes >= max_batch_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
 
 
 class PostgreSqlClient:
-    def __init__(self, server_name: str, database_name: str, username: str, password: str, port: int):
+    """
+    Client for reading from and loading to a PostgreSQL database.
+
+    Tables known to exist and the reflected metadata are cached per client, so DDL checks
+    hit the catalog once per table instead of on every load, and tables created within
+    begin() are cached once it commits. Call invalidate_schema_cache() after altering
+    or dropping tables outside of this client.
+
+    Connections come from a bounded pool configured by pool_size, max_overflow,
+    pool_timeout, pool_recycle and pool_pre_ping. statement_timeout_ms is set on every
+    new connection. Use `with client.begin():` to run a whole pipeline stage on a single
+    connection and transaction.
+    """
+    def __init__(
+        self,
+        server_name: str,
+        database_name: str,
+        username: str,
+        password: str,
+        port: int,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = 1800,
+        pool_pre_ping: bool = True,
+        statement_timeout_ms: int = None,
+    ):
         self.server_name = server_name
         self.database_name = database_name
         self.username = username
@@ -20,51 +106,529 @@ class PostgreSqlClient:
             password=password
         )
 
-        self.engine = create_engine(connection_url)
+        self.engine = create_engine(
+            connection_url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+        )
+        self._pool_events = {"connects": 0, "checkouts": 0, "invalidations": 0, "statements": 0}
+        # events fire on the threads of transform_load(), the shards and background writers
+        self._pool_events_lock = threading.Lock()
+        event.listen(self.engine, "connect", self._on_connect)
+        event.listen(self.engine, "checkout", self._on_checkout)
+        event.listen(self.engine, "invalidate", self._on_invalidate)
+        event.listen(self.engine, "before_cursor_execute", self._on_statement)
+        self.statement_timeout_ms = statement_timeout_ms
+        self._local = threading.local()
+        self._existing_tables: set[str] = set()
+        self._reflected_metadata: MetaData = None
+        self._schema_lock = threading.Lock()
+
+    @staticmethod
+    def pool_settings(config: dict = None) -> dict:
+        """
+        Gets the pool settings from a config dictionary (e.g. the pipeline YAML).
+
+        Each setting can be overridden by a POSTGRES_<SETTING> environment variable, e.g.
+        POSTGRES_POOL_SIZE or POSTGRES_STATEMENT_TIMEOUT_MS.
+        """
+        config = config or {}
+        settings = {}
+        for name, parse in POOL_SETTINGS.items():
+            value = os.environ.get(f"POSTGRES_{name.upper()}", config.get(name))
+            if value is not None:
+                settings[name] = parse(value)
+        return settings
+
+    def _count_event(self, name: str) -> None:
+        with self._pool_events_lock:
+            self._pool_events[name] += 1
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        self._count_event("connects")
+        if self.statement_timeout_ms is not None:
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET statement_timeout = {int(self.statement_timeout_ms)}")
+            cursor.close()
+            dbapi_connection.commit()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self._count_event("checkouts")
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self._count_event("invalidations")
+
+    def _on_statement(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        # background writers (e.g. of the run logs) opt out with count_statements=False
+        if connection.get_execution_options().get("count_statements", True):
+            self._count_event("statements")
+
+    def pool_status(self) -> dict:
+        """
+        Gets the current state of the connection pool and counters of pool events and
+        executed statements since the client was created. Statements run with the
+        execution option count_statements=False are not counted.
+        """
+        pool = self.engine.pool
+        with self._pool_events_lock:
+            pool_events = dict(self._pool_events)
+        return {
+            "pool_size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            **pool_events,
+        }
+
+    @contextmanager
+    def begin(self) -> Iterator[Connection]:
+        """
+        Binds one pooled connection and transaction to the calling thread.
+
+        Every client method called in the block from the same thread reuses that
+        connection instead of checking out its own, and batches are written in
+        savepoints. The transaction commits when the block exits without error.
+        """
+        current_connection = getattr(self._local, "connection", None)
+        if current_connection is not None:
+            yield current_connection
+            return
+        created_tables = set()
+        with self.engine.begin() as connection:
+            self._local.connection = connection
+            self._local.created_tables = created_tables
+            try:
+                yield connection
+            finally:
+                self._local.connection = None
+                self._local.created_tables = None
+        # only cache the tables created in the block once their DDL is committed
+        self._remember_tables(created_tables)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[Connection]:
+        """Yields a connection in a new transaction, or a savepoint within begin()."""
+        current_connection = getattr(self._local, "connection", None)
+        if current_connection is not None:
+            with current_connection.begin_nested():
+                yield current_connection
+        else:
+            with self.engine.begin() as connection:
+                yield connection
+
+    @contextmanager
+    def _connection(self) -> Iterator[Connection]:
+        """Yields the connection bound by begin(), or a pooled connection."""
+        current_connection = getattr(self._local, "connection", None)
+        if current_connection is not None:
+            yield current_connection
+        else:
+            with self.engine.connect() as connection:
+                yield connection
 
     def get_metadata(self) -> MetaData:
         """
         Gets the metadata object for all tables for a given database
         """
-        metadata = MetaData(bind=self.engine)
-        metadata.reflect()
-        return metadata
+        with self._schema_lock:
+            if self._reflected_metadata is None:
+                metadata = MetaData(bind=self.engine)
+                metadata.reflect()
+                self._reflected_metadata = metadata
+                self._existing_tables.update(metadata.tables.keys())
+            return self._reflected_metadata
+
+    def _is_known_table(self, table_name: str) -> bool:
+        """Checks if the table is cached as existing, or was created in the current begin() block."""
+        created_tables = getattr(self._local, "created_tables", None)
+        return table_name in self._existing_tables or (created_tables is not None and table_name in created_tables)
+
+    def _remember_tables(self, table_names: Iterable[str]) -> None:
+        """
+        Caches tables as existing. Within begin(), they are only cached once its
+        transaction commits, so a rollback does not leave tables in the cache that were
+        never created.
+        """
+        created_tables = getattr(self._local, "created_tables", None)
+        if created_tables is not None:
+            created_tables.update(table_names)
+            return
+        with self._schema_lock:
+            self._existing_tables.update(table_names)
+
+    def invalidate_schema_cache(self, table_name: str = None) -> None:
+        """
+        Forgets cached schema information, for a single table or for all tables.
+        """
+        with self._schema_lock:
+            self._reflected_metadata = None
+            if table_name is None:
+                self._existing_tables.clear()
+            else:
+                self._existing_tables.discard(table_name)
 
     def execute_sql(self, sql: str) -> None:
-        return self.engine.execute(sql).all()
+        with self._transaction() as connection:
+            return connection.execute(sql).all()
+
+    def execute(self, sql: str, parameters: dict = None) -> None:
+        """Executes a statement that does not return rows, e.g. DDL or DML."""
+        with self._transaction() as connection:
+            connection.execute(sql, parameters or {})
+
+    def stream_sql(self, sql: str, batch_size: int = 1000, parameters: dict = None) -> Iterator[dict]:
+        """
+        Executes a query and yields its rows as dictionaries.
+
+        Rows are fetched from a server-side cursor batch_size at a time, so the result set
+        is never held in memory as a whole. When parameters are given, the query is bound
+        with `:name` markers.
+        """
+        with self._connection() as connection:
+            connection = connection.execution_options(
+                stream_results=True, max_row_buffer=batch_size
+            )
+            if parameters:
+                result = connection.execute(text(sql), parameters)
+            else:
+                result = connection.execute(sql)
+            for partition in result.partitions(batch_size):
+                for row in partition:
+                    yield dict(row)
 
     def table_exists(self, table_name: str) -> bool:
         """
         Checks if the table already exists in the database.
         """
-        return inspect(self.engine).has_table(table_name)
-    
+        if self._is_known_table(table_name):
+            return True
+        with self._connection() as connection:
+            exists = inspect(connection).has_table(table_name)
+        if exists:
+            self._remember_tables([table_name])
+        return exists
+
     def create_table(self, table_name: str, metadata: MetaData) -> None:
         """
         Create table provided in the metadata object.
         """
-        existing_table = metadata.tables[table_name]
+        if self._is_known_table(table_name):
+            return
+        # carry over table options (e.g. postgresql_partition_by), constraints, identity
+        # columns and indexes with their options (e.g. postgresql_using)
         new_metadata = MetaData()
-        columns = [
-            Column(column.name, column.type, primary_key=column.primary_key)
-            for column in existing_table.columns
-        ]
-        new_table = Table(table_name, new_metadata, *columns)
-        new_metadata.create_all(bind=self.engine)
+        metadata.tables[table_name].to_metadata(new_metadata)
+        with self._transaction() as connection:
+            new_metadata.create_all(bind=connection)
+        self._remember_tables([table_name])
 
-    def upsert(self, data: list[dict], table: Table, metadata: MetaData) -> None:
+    def create_date_partitions(
+        self,
+        table_name: str,
+        dates: Iterable[date],
+        interval: str = "month"
+    ) -> None:
+        """
+        Creates the range partitions of a table partitioned by a date column that are
+        needed to hold the given dates, one partition per day or per month.
+
+        Nothing is created when the table is not partitioned, so existing plain tables
+        keep working.
+        """
+        if interval not in ("day", "month"):
+            raise Exception(
+                f"Partition interval {interval} is not supported. Please use either 'day' or 'month' interval."
+            )
+        partition_bounds = {}
+        for value in dates:
+            start = value if interval == "day" else value.replace(day=1)
+            if interval == "day":
+                end = date.fromordinal(start.toordinal() + 1)
+            else:
+                end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+            suffix = start.strftime("%Y%m%d" if interval == "day" else "%Y%m")
+            partition_bounds[f"{table_name}_p{suffix}"] = (start, end)
+        missing_partitions = {
+            name: bounds for name, bounds in partition_bounds.items()
+            if not self._is_known_table(name)
+        }
+        if not missing_partitions:
+            return
+        preparer = self.engine.dialect.identifier_preparer
+        with self._transaction() as connection:
+            is_partitioned = connection.execute(
+                text("select relkind = 'p' from pg_class where oid = to_regclass(:table_name)"),
+                {"table_name": preparer.quote(table_name)}
+            ).scalar()
+            if not is_partitioned:
+                return
+            for name, (start, end) in sorted(missing_partitions.items()):
+                connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {preparer.quote(name)} "
+                    f"PARTITION OF {preparer.quote(table_name)} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+        self._remember_tables(missing_partitions.keys())
+
+    def upsert(
+        self,
+        data: Iterable[dict],
+        table: Table,
+        metadata: MetaData,
+        batch_size: int = 1000,
+        max_batch_bytes: int = None
+    ) -> UpsertCounts:
         """
         Upserts data into a database table. This method creates the table also if it doesn't exist.
+
+        The data can be any iterable of rows, including a generator. It is consumed in batches
+        of at most batch_size rows (and max_batch_bytes of values, when set) and each batch is
+        upserted in its own transaction, so memory use does not grow with the number of rows.
+
+        Rows identical to the stored ones are not rewritten. Returns how many rows were
+        inserted, updated and skipped.
         """
         self.create_table(table_name=table.name, metadata=metadata)
         key_columns = [
             pk_column.name for pk_column in table.primary_key.columns.values()
         ]
-        insert_statement = postgresql.insert(table).values(data)
-        upsert_statement = insert_statement.on_conflict_do_update(
-            index_elements=key_columns,
-            set_={
-                c.key: c for c in insert_statement.excluded if c.key not in key_columns
-            },
+        counts = UpsertCounts()
+        for batch in _batched(data, batch_size=batch_size, max_batch_bytes=max_batch_bytes):
+            upsert_statement = self._on_conflict_update(
+                postgresql.insert(table).values(batch), key_columns=key_columns
+            )
+            existing = self._count_existing(
+                table, key_columns, keys=[tuple(row[key] for key in key_columns) for row in batch]
+            )
+            with self._transaction() as connection:
+                counts = counts.add(
+                    self._execute_upsert(connection, upsert_statement, rows=len(batch), existing=existing)
+                )
+        return counts
+
+    def upsert_from_select(
+        self,
+        sql: str,
+        table: Table,
+        metadata: MetaData,
+        parameters: dict = None
+    ) -> UpsertCounts:
+        """
+        Upserts the result of a query into a database table without it leaving the server.
+        This method creates the table also if it doesn't exist.
+
+        The query runs as `INSERT INTO table (...) SELECT ... FROM (sql) ON CONFLICT DO UPDATE`.
+        Its output columns are matched to the table's columns by name. Returns how many rows
+        were inserted, updated and skipped because they were unchanged.
+        """
+        self.create_table(table_name=table.name, metadata=metadata)
+        key_columns = [
+            pk_column.name for pk_column in table.primary_key.columns.values()
+        ]
+        column_names = [column.name for column in table.columns]
+        transformed = text(sql).columns(
+            *[sql_column(name) for name in column_names]
+        ).cte("transformed")
+        insert_statement = postgresql.insert(table).from_select(
+            column_names, select(*[transformed.c[name] for name in column_names])
         )
-        self.engine.execute(upsert_statement)
+        upsert_statement = self._on_conflict_update(insert_statement, key_columns=key_columns)
+        with self._transaction() as connection:
+            return self._execute_upsert(
+                connection,
+                upsert_statement,
+                rows=select(func.count()).select_from(transformed).scalar_subquery(),
+                existing=self._count_existing(
+                    table, key_columns, keys=select(*[transformed.c[key] for key in key_columns])
+                ),
+                parameters=parameters
+            )
+
+    def bulk_upsert(
+        self,
+        dataframe: "pd.DataFrame",
+        table: Table,
+        metadata: MetaData,
+        chunk_rows: int = 10_000
+    ) -> UpsertCounts:
+        """
+        Upserts a dataframe into a database table using COPY. This method creates the table also if it doesn't exist.
+
+        Rows are streamed as CSV with `COPY ... FROM STDIN` into a temporary table, chunk_rows
+        at a time, and merged into the target with a single `INSERT ... ON CONFLICT` statement.
+        This avoids building one bound parameter per value, which does not scale past a few
+        thousand rows. Returns how many rows were inserted, updated and skipped because they
+        were unchanged.
+        """
+        self.create_table(table_name=table.name, metadata=metadata)
+        key_columns = [
+            pk_column.name for pk_column in table.primary_key.columns.values()
+        ]
+        columns = [column for column in table.columns if column.name in dataframe.columns]
+        column_names = [column.name for column in columns]
+        with self.temporary_table(
+            dataframe, f"{table.name}_bulk_upsert", columns, chunk_rows
+        ) as (connection, staging_table):
+            insert_statement = postgresql.insert(table).from_select(
+                column_names, select(staging_table)
+            )
+            upsert_statement = self._on_conflict_update(
+                insert_statement, key_columns=key_columns, column_names=column_names
+            )
+            existing = self._count_existing(
+                table, key_columns, keys=select(*[staging_table.c[key] for key in key_columns])
+            )
+            return self._execute_upsert(connection, upsert_statement, rows=len(dataframe), existing=existing)
+
+    @contextmanager
+    def temporary_table(
+        self,
+        dataframe: "pd.DataFrame",
+        table_name: str,
+        columns: list[Column],
+        chunk_rows: int = 10_000
+    ) -> Iterator[tuple[Connection, Table]]:
+        """
+        Copies the columns of a dataframe into a temporary table, yielding the connection
+        and the table to merge it from in the block.
+
+        Rows are streamed as CSV with `COPY ... FROM STDIN`, chunk_rows at a time. The table
+        only lives in the transaction of the block (a savepoint within begin()), and is
+        dropped at its end.
+        """
+        column_names = [column.name for column in columns]
+        dataframe = self._nullable_integers(dataframe[column_names], columns)
+
+        temporary_metadata = MetaData()
+        temporary_table = Table(
+            table_name,
+            temporary_metadata,
+            *[Column(column.name, column.type) for column in columns],
+            prefixes=["TEMPORARY"],
+            postgresql_on_commit="DROP",
+        )
+        preparer = self.engine.dialect.identifier_preparer
+        copy_statement = (
+            f"COPY {preparer.format_table(temporary_table)} "
+            f"({', '.join(preparer.quote(name) for name in column_names)}) "
+            "FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        )
+        with self._transaction() as connection:
+            temporary_table.create(bind=connection)
+            cursor = connection.connection.cursor()
+            cursor.execute(copy_statement, stream=self._csv_chunks(dataframe, chunk_rows))
+            yield connection, temporary_table
+            # within begin() the transaction outlives this call, so do not wait for ON COMMIT DROP
+            temporary_table.drop(bind=connection)
+
+    @staticmethod
+    def _on_conflict_update(
+        insert_statement: postgresql.Insert,
+        key_columns: list[str],
+        column_names: list[str] = None
+    ) -> postgresql.Insert:
+        """
+        Turns an insert into an upsert that updates the non-key columns (restricted to
+        column_names when given) of conflicting rows, or skips them if there are none.
+
+        Conflicting rows whose updated columns are all equal to the stored ones are
+        skipped as well, so unchanged rows leave no dead tuples or WAL behind. JSON
+        columns have no equality operator, tables with one are always updated.
+        """
+        set_ = {
+            c.key: c for c in insert_statement.excluded
+            if c.key not in key_columns and (column_names is None or c.key in column_names)
+        }
+        if not set_:
+            return insert_statement.on_conflict_do_nothing(index_elements=key_columns)
+        table = insert_statement.table
+        where = None
+        if not any(isinstance(table.c[key].type, JSON) for key in set_):
+            where = tuple_(*[table.c[key] for key in set_]).is_distinct_from(tuple_(*set_.values()))
+        return insert_statement.on_conflict_do_update(index_elements=key_columns, set_=set_, where=where)
+
+    @staticmethod
+    def _count_existing(table: Table, key_columns: list[str], keys):
+        """
+        Scalar subquery counting the stored rows of table whose key is in keys, a list of
+        key tuples or a select of the key columns.
+        """
+        return select(func.count()).select_from(table).where(
+            tuple_(*[table.c[key] for key in key_columns]).in_(keys)
+        ).scalar_subquery()
+
+    @staticmethod
+    def _execute_upsert(
+        connection: Connection,
+        upsert_statement: postgresql.Insert,
+        rows,
+        existing,
+        parameters: dict = None
+    ) -> UpsertCounts:
+        """
+        Executes an upsert of `rows` rows (a number, or a scalar subquery counting them),
+        `existing` of which conflict with stored rows (see _count_existing()), and counts
+        the rows it inserted, updated and skipped.
+
+        The upsert returns a row for every row it inserted or updated, and nothing for the
+        rows ON CONFLICT left alone. existing is counted in the same statement, so it sees
+        the table as it was before the upsert, and the rows that did not conflict are the
+        inserted ones. (Returning xmax = 0 would tell them apart directly, but system
+        columns cannot be returned from partitioned tables.)
+        """
+        # a bound parameter in the CTE would be sent out of order by the positional pg8000 dialect
+        upserted = upsert_statement.returning(literal_column("1").label("upserted")).cte("upserted")
+        upserted_rows, total_rows, existing_rows = connection.execute(
+            select(
+                func.count(),
+                literal(rows, Integer) if isinstance(rows, int) else rows,
+                existing,
+            ).select_from(upserted),
+            parameters or {}
+        ).one()
+        inserted = total_rows - existing_rows
+        updated = upserted_rows - inserted
+        return UpsertCounts(inserted, updated, existing_rows - updated)
+
+    @staticmethod
+    def _csv_chunks(dataframe: "pd.DataFrame", chunk_rows: int):
+        """Yields the dataframe as CSV text, chunk_rows at a time."""
+        for start in range(0, len(dataframe), chunk_rows):
+            yield dataframe.iloc[start:start + chunk_rows].to_csv(
+                index=False, header=False, na_rep="\\N"
+            )
+
+    @staticmethod
+    def _nullable_integers(dataframe: "pd.DataFrame", columns: Iterable[Column]) -> "pd.DataFrame":
+        """Converts the float columns of dataframe that are integer columns in the table to Int64."""
+        # integer columns with nulls are float in pandas, "1.0" is not a valid integer for Postgres
+        dtypes = {
+            column.name: "Int64" for column in columns
+            if isinstance(column.type, Integer)
+            and column.name in dataframe.columns
+            and dataframe[column.name].dtype.kind == "f"
+        }
+        return dataframe.astype(dtypes) if dtypes else dataframe
+
+    @classmethod
+    def dataframe_records(
+        cls,
+        dataframe: "pd.DataFrame",
+        chunk_rows: int = 10_000,
+        columns: Iterable[Column] = None
+    ) -> Iterator[dict]:
+        """
+        Yields the rows of a dataframe as dictionaries, converting chunk_rows at a time.
+        Missing values (NaN, NaT, pd.NA) become None.
+
+        When the columns of the target table are given, float columns holding integers
+        are sent as integers, as bulk_upsert() does.
+        """
+        if columns is not None:
+            dataframe = cls._nullable_integers(dataframe, columns)
+        for start in range(0, len(dataframe), chunk_rows):
+            chunk = dataframe.iloc[start:start + chunk_rows]
+            yield from chunk.astype(object).where(chunk.notna(), None).to_dict(orient="records")
@@ -0,0 +1,68 @@
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Iterator, NamedTuple
+import gzip
+import json
+import os
+
+
+class RawResponse(NamedTuple):
+    location_key: int
+    extracted_at: str
+    data: list
+
+
+class RawResponseStore:
+    """
+    Local store of raw API responses, partitioned by extraction date and location.
+
+    Each response is appended as one JSON line to a gzip file at
+    `<path>/date=<YYYY-MM-DD>/location_key=<key>.jsonl.gz`, so responses can be
+    transformed again later without calling the API.
+    """
+    def __init__(self, path: str, compresslevel: int = 6):
+        self.path = path
+        self.compresslevel = compresslevel
+
+    def _partition_path(self, extraction_date: date, location_key: int) -> Path:
+        return Path(self.path) / f"date={extraction_date.isoformat()}" / f"location_key={location_key}.jsonl.gz"
+
+    def write(self, location_key: int, data: list, extracted_at: datetime = None) -> None:
+        """Appends a response to the partition of its extraction date and location."""
+        extracted_at = extracted_at or datetime.now(timezone.utc)
+        path = self._partition_path(extracted_at.date(), location_key)
+        os.makedirs(path.parent, exist_ok=True)
+        record = {"location_key": location_key, "extracted_at": extracted_at.isoformat(), "data": data}
+        # every append adds a gzip member, which gzip reads back as one stream
+        with gzip.open(path, "at", encoding="utf-8", compresslevel=self.compresslevel) as file:
+            file.write(json.dumps(record) + "\n")
+
+    def read(
+        self,
+        start_date: date = None,
+        end_date: date = None,
+        location_keys: list[int] = None
+    ) -> Iterator[RawResponse]:
+        """
+        Yields the stored responses extracted between start_date and end_date (both
+        inclusive), oldest extraction date first.
+
+        Only the partitions in the date range and of location_keys, when given, are opened.
+        """
+        root = Path(self.path)
+        if not root.exists():
+            return
+        for date_path in sorted(root.glob("date=*")):
+            extraction_date = date.fromisoformat(date_path.name.split("=", 1)[1])
+            if start_date is not None and extraction_date < start_date:
+                continue
+            if end_date is not None and extraction_date > end_date:
+                continue
+            for path in sorted(date_path.glob("location_key=*.jsonl.gz")):
+                location_key = int(path.name.split("=", 1)[1].split(".", 1)[0])
+                if location_keys is not None and location_key not in location_keys:
+                    continue
+                with gzip.open(path, "rt", encoding="utf-8") as file:
+                    for line in file:
+                        record = json.loads(line)
+                        yield RawResponse(record["location_key"], record["extracted_at"], record["data"])
@@ -0,0 +1,113 @@
+from typing import NamedTuple
+import json
+import sqlite3
+import threading
+import time
+
+
+class CachedResponse(NamedTuple):
+    data: list
+    etag: str
+    last_modified: str
+    stored_at: float
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of API responses backed by a SQLite file.
+
+    Entries younger than ttl_seconds are served without contacting the API. Older
+    entries are kept so they can be revalidated with `If-None-Match` /
+    `If-Modified-Since`. Once the cached bodies exceed max_bytes, the least recently
+    used entries are evicted.
+    """
+    def __init__(self, path: str, ttl_seconds: float = 3600, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("pragma journal_mode=wal")
+        self._connection.execute(
+            """
+            create table if not exists responses (
+                key text primary key,
+                body text not null,
+                etag text,
+                last_modified text,
+                stored_at real not null,
+                accessed_at real not null,
+                size integer not null
+            )
+            """
+        )
+        self._connection.execute(
+            "create index if not exists responses_accessed_at on responses (accessed_at)"
+        )
+
+    def get(self, key: str) -> CachedResponse:
+        """Returns the cached response for a key, or None if there is none."""
+        with self._lock:
+            row = self._connection.execute(
+                "select body, etag, last_modified, stored_at from responses where key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "update responses set accessed_at = ? where key = ?", (time.time(), key)
+            )
+        body, etag, last_modified, stored_at = row
+        return CachedResponse(json.loads(body), etag, last_modified, stored_at)
+
+    def is_fresh(self, cached_response: CachedResponse) -> bool:
+        return time.time() - cached_response.stored_at < self.ttl_seconds
+
+    def set(self, key: str, data: list, etag: str = None, last_modified: str = None) -> None:
+        """Stores a response and evicts least recently used entries above max_bytes."""
+        body = json.dumps(data)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                """
+                insert or replace into responses
+                (key, body, etag, last_modified, stored_at, accessed_at, size)
+                values (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, body, etag, last_modified, now, now, len(body))
+            )
+            self._evict()
+
+    def touch(self, key: str) -> None:
+        """Marks a revalidated entry as fresh again."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "update responses set stored_at = ?, accessed_at = ? where key = ?",
+                (now, now, key)
+            )
+
+    def _evict(self) -> None:
+        total_size = self._connection.execute(
+            "select coalesce(sum(size), 0) from responses"
+        ).fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        excess = total_size - self.max_bytes
+        rows = self._connection.execute(
+            "select key, size from responses order by accessed_at"
+        ).fetchall()
+        evicted_keys = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            evicted_keys.append((key,))
+            excess -= size
+        self._connection.executemany("delete from responses where key = ?", evicted_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("delete from responses")
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, TypeVar
+from etl_project.connectors.postgresql import PostgreSqlClient
+import os
+
+if TYPE_CHECKING:
+    # only used in annotations, so that importing the client does not load pandas
+    import pandas as pd
+
+
+T = TypeVar("T")
+
+# functions combining the values of the shards for a key in gather_sql()
+COMBINE_FUNCTIONS = {"sum": sum, "min": min, "max": max}
+
+
+class ShardedPostgreSqlClient:
+    """
+    Spreads rows over several PostgreSQL databases by their shard key.
+
+    A row is stored on shard `shard_key % len(shards)`, so every shard holds the same
+    tables for its own subset of keys (e.g. locations) and the same key always lands on
+    the same shard. Adding a shard moves keys between shards, reload them after changing
+    the shard list.
+
+    map_dataframe() splits a dataframe by shard and writes every part on its shard,
+    map_shards() runs a function on every shard, and gather_sql() runs a query on every
+    shard and concatenates the rows, or combines the partial rows of each key. Shards are
+    processed in parallel, one thread each, so each thread has its own connection and
+    transaction on its shard (see PostgreSqlClient.begin()).
+    """
+    def __init__(self, shards: list[PostgreSqlClient], shard_key: str = "location_key"):
+        if not shards:
+            raise Exception("Please configure at least one shard.")
+        self.shards = shards
+        self.shard_key = shard_key
+
+    @classmethod
+    def from_config(
+        cls,
+        shard_configs: list[dict],
+        shard_key: str = "location_key",
+        pool_config: dict = None
+    ) -> "ShardedPostgreSqlClient":
+        """
+        Creates a client from the postgresql_shards list of the pipeline config.
+
+        Each entry may set server_name, database_name, username, password and port, which
+        default to the POSTGRES_* environment variables, so shards can be several
+        databases of one server or several servers. Every shard gets its own pool,
+        configured by pool_config (see PostgreSqlClient.pool_settings()).
+        """
+        defaults = {
+            "server_name": os.environ.get("POSTGRES_HOST"),
+            "database_name": os.environ.get("POSTGRES_DB"),
+            "username": os.environ.get("POSTGRES_USER"),
+            "password": os.environ.get("POSTGRES_PASSWORD"),
+            "port": os.environ.get("POSTGRES_PORT"),
+        }
+        return cls(
+            shards=[
+                PostgreSqlClient(**{**defaults, **shard_config}, **PostgreSqlClient.pool_settings(pool_config))
+                for shard_config in shard_configs
+            ],
+            shard_key=shard_key,
+        )
+
+    def shard_index(self, key: int) -> int:
+        """Gets the index of the shard storing key."""
+        return key % len(self.shards)
+
+    def split(self, dataframe: "pd.DataFrame") -> dict[int, "pd.DataFrame"]:
+        """Splits a dataframe by the shard of its shard_key column, omitting empty shards."""
+        if len(self.shards) == 1:
+            return {0: dataframe} if len(dataframe) else {}
+        shard_indexes = dataframe[self.shard_key].astype("int64") % len(self.shards)
+        return {
+            int(shard_index): shard_dataframe
+            for shard_index, shard_dataframe in dataframe.groupby(shard_indexes, sort=True)
+        }
+
+    def _run(self, jobs: dict[int, Callable[[], T]]) -> dict[int, T]:
+        """
+        Runs the jobs of the shards in parallel, returning their results by shard index.
+        Every job finishes before the first error is raised.
+        """
+        if len(jobs) <= 1:
+            return {shard_index: job() for shard_index, job in jobs.items()}
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = {shard_index: executor.submit(job) for shard_index, job in jobs.items()}
+        return {shard_index: future.result() for shard_index, future in futures.items()}
+
+    def map_shards(self, function: Callable[[PostgreSqlClient], T]) -> dict[int, T]:
+        """Runs function(shard) on every shard, returning the results by shard index."""
+        return self._run({
+            shard_index: (lambda shard=shard: function(shard))
+            for shard_index, shard in enumerate(self.shards)
+        })
+
+    def map_dataframe(
+        self,
+        dataframe: "pd.DataFrame",
+        function: Callable[[PostgreSqlClient, "pd.DataFrame"], T]
+    ) -> dict[int, T]:
+        """
+        Runs function(shard, rows) with the rows of the dataframe stored on each shard,
+        returning the results by shard index. Shards without rows are skipped.
+        """
+        return self._run({
+            shard_index: (lambda shard_index=shard_index, rows=rows: function(self.shards[shard_index], rows))
+            for shard_index, rows in self.split(dataframe).items()
+        })
+
+    def gather_sql(
+        self,
+        sql: str,
+        parameters: dict = None,
+        batch_size: int = 1000,
+        key_columns: list[str] = None,
+        combine: dict[str, str] = None
+    ) -> list[dict]:
+        """
+        Runs a query on every shard and concatenates their rows, in shard order.
+
+        Each shard only answers for its keys, so a query aggregating over several keys
+        (e.g. per date across locations, as the serving tables do) returns one partial row
+        per shard for the same group. With key_columns, the rows with the same values in
+        key_columns are combined into one: every other column with its function in
+        combine, "sum" (the default), "min" or "max", ignoring nulls. Counts and sums
+        combine as sums, averages have to be gathered as a sum and a count.
+        """
+        shard_rows = self.map_shards(
+            lambda shard: list(shard.stream_sql(sql, batch_size=batch_size, parameters=parameters))
+        )
+        rows = [row for shard_index in sorted(shard_rows) for row in shard_rows[shard_index]]
+        if key_columns is None:
+            return rows
+        combine = combine or {}
+        for function_name in combine.values():
+            if function_name not in COMBINE_FUNCTIONS:
+                raise Exception(
+                    f"Combine function {function_name} is not supported. Please use one of {list(COMBINE_FUNCTIONS)}."
+                )
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row[name] for name in key_columns), []).append(row)
+        combined_rows = []
+        for group in groups.values():
+            combined_row = dict(group[0])
+            for name in combined_row:
+                if name in key_columns:
+                    continue
+                values = [row[name] for row in group if row[name] is not None]
+                combined_row[name] = COMBINE_FUNCTIONS[combine.get(name, "sum")](values) if values else None
+            combined_rows.append(combined_row)
+        return combined_rows
+
+    def pool_status(self) -> dict:
+        """Sums the pool status and statement counts of every shard."""
+        status = {}
+        for shard in self.shards:
+            for name, value in shard.pool_status().items():
+                status[name] = status.get(name, 0) + value
+        return status
+
+    def dispose(self) -> None:
+        """Closes the pooled connections of every shard."""
+        for shard in self.shards:
+            shard.engine.dispose()
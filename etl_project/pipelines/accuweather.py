@@ -1,168 +1,672 @@
+"""
+Loads AccuWeather forecasts to staging and serving tables.
+
+    python -m etl_project.pipelines.accuweather [run|extract|load|transform] [options]
+
+`extract` stores raw API responses in raw_store_path, `load` extracts (or, with
+--replay, replays) and transforms them into staging, `transform` loads the serving
+tables from staging, and `run`, the default, does all of it. --dry-run prints what a
+command would do without calling the API or the database.
+
+pandas, SQLAlchemy, Jinja2 and requests are imported by the functions that use them, so
+a command only pays the start-up time of the libraries it needs (see
+benchmarks/bench_imports.py).
+"""
+from datetime import date, datetime, timezone
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
+import argparse
 import os
+import signal
+import sys
+import threading
 import yaml
 from pathlib import Path
-from sqlalchemy import (
-    Table,
-    Column,
-    MetaData,
-    String,
-    Integer,
-    Float,
-    Boolean,
-    DateTime,
-    Date,
-)
-from etl_project.connectors.accuweather import AccuWeatherApiClient
-from etl_project.connectors.postgresql import PostgreSqlClient
-from etl_project.assets.accuweather import (
-    extract_forecast_weather,
-    raw_data_transform,
-    staging_upsert_load,
-)
-from etl_project.assets.transform_load import transform_load
 from etl_project.assets.pipeline_logging import PipelineLogging
-from etl_project.assets.metadata_logging import MetaDataLogging, MetaDataLoggingStatus
+from etl_project.assets.scheduler import LocationScheduler
 
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from sqlalchemy import Table, MetaData
+    from etl_project.assets.run_metrics import RunMetrics
+    from etl_project.connectors.accuweather import AccuWeatherApiClient
+    from etl_project.connectors.postgresql import PostgreSqlClient
+    from etl_project.connectors.sharded_postgresql import ShardedPostgreSqlClient
 
-if __name__ == "__main__":
-    # load environment variables
-    load_dotenv()
 
-    # get config variables
-    yaml_file_path = __file__.replace(".py", ".yaml")
-    if Path(yaml_file_path).exists():
-        with open(yaml_file_path) as yaml_file:
-            pipeline_config = yaml.safe_load(yaml_file)
-    else:
-        raise Exception(f"Missing {yaml_file_path} file.")
+COMMANDS = ["run", "extract", "load", "transform"]
+
+
+def get_serving_table(table_name: str) -> tuple["Table", "MetaData"]:
+    """Serving table the transform templates are loaded into."""
+    from sqlalchemy import Table, Column, MetaData, Integer, Date
+
+    serving_metadata = MetaData()
+    serving_table = Table(
+        table_name,
+        serving_metadata,
+        Column("date", Date, primary_key=True),
+        Column("count_precipitations_next_five_days", Integer),
+    )
+    return serving_table, serving_metadata
+
 
-    postgresql_client = PostgreSqlClient(
+def get_postgresql_client(config: dict) -> "PostgreSqlClient":
+    """Creates the database client from the POSTGRES_* environment variables."""
+    from etl_project.connectors.postgresql import PostgreSqlClient
+
+    return PostgreSqlClient(
         server_name=os.environ.get("POSTGRES_HOST"),
         database_name=os.environ.get("POSTGRES_DB"),
         username=os.environ.get("POSTGRES_USER"),
         password=os.environ.get("POSTGRES_PASSWORD"),
         port=os.environ.get("POSTGRES_PORT"),
+        **PostgreSqlClient.pool_settings(config.get("postgresql_pool")),
     )
 
-    config = pipeline_config.get("config")
-    pipeline_name = pipeline_config.get("name")
-    pipeline_logging = PipelineLogging(pipeline_name, config.get("log_folder_path"))
-    metadata_logger = MetaDataLogging(
-        pipeline_name,
-        postgresql_client,
-        config,
-        f"{pipeline_name}_pipeline_logs",
-    )
 
-    metadata_logger.log()
-    try:
-        # extract raw data
-        pipeline_logging.logger.info("Extracting raw data from AccuWeather")
-        accuweather_client = AccuWeatherApiClient(api_key=os.environ.get("API_KEY"))
-        df_forecast = extract_forecast_weather(
-            accuweather_client=accuweather_client,
-            location_key=config.get("location_key"),
-            forecast_days=config.get("forecast_days"),
+def get_load_targets(config: dict, postgresql_client: "PostgreSqlClient") -> "ShardedPostgreSqlClient":
+    """
+    Gets the databases staging and serving tables are loaded into: the shards of
+    config["postgresql_shards"] when set, by location_key, otherwise postgresql_client.
+    """
+    from etl_project.connectors.sharded_postgresql import ShardedPostgreSqlClient
+
+    if config.get("postgresql_shards"):
+        return ShardedPostgreSqlClient.from_config(
+            config.get("postgresql_shards"), pool_config=config.get("postgresql_pool")
         )
+    return ShardedPostgreSqlClient([postgresql_client])
 
-        # transform raw data
-        pipeline_logging.logger.info("Transforming raw data into dataframe")
-        df_clean_forecast = raw_data_transform(
-            df_forecast=df_forecast,
-            location_key=config.get("location_key"),
+
+def get_location_keys(config: dict, postgresql_client: "PostgreSqlClient") -> list[int]:
+    """
+    Gets the location keys to extract.
+
+    Keys are read from the `location_key` column of config["location_table"] when set,
+    otherwise from config["location_keys"], falling back to the single config["location_key"].
+    """
+    if config.get("location_table") is not None:
+        rows = postgresql_client.execute_sql(
+            f"select distinct location_key from {config.get('location_table')} order by location_key"
         )
+        return [row[0] for row in rows]
+    if config.get("location_keys"):
+        return list(config.get("location_keys"))
+    return [config.get("location_key")]
+
 
-        # load data to staging
-        pipeline_logging.logger.info("Loading data into staging DB table")
-
-        staging_metadata = MetaData()
-        staging_table = Table(
-            config.get("staging_table_name"),
-            staging_metadata,
-            Column("date", Date, primary_key=True),
-            Column("location_key", Integer, primary_key=True),
-            Column("sunrise_time", DateTime),
-            Column("sunset_time", DateTime),
-            Column("moonrise_time", DateTime),
-            Column("moonset_time", DateTime),
-            Column("moon_phase", String),
-            Column("minimum_temperature_value", Float),
-            Column("minimum_temperature_unit", String),
-            Column("maximum_temperature_value", Float),
-            Column("maximum_temperature_unit", String),
-            Column("minimum_real_feel_temperature_value", Float),
-            Column("minimum_real_feel_temperature_unit", String),
-            Column("maximum_real_feel_temperature_value", Float),
-            Column("maximum_real_feel_temperature_unit", String),
-            Column("day_has_precipitation", Boolean),
-            Column("day_precipitation_probability", Integer),
-            Column("day_thunderstorm_probability", Integer),
-            Column("day_rain_probability", Integer),
-            Column("day_snow_probability", Integer),
-            Column("day_ice_probability", Integer),
-            Column("night_has_precipitation", Boolean),
-            Column("night_precipitation_probability", Integer),
-            Column("night_thunderstorm_probability", Integer),
-            Column("night_rain_probability", Integer),
-            Column("night_snow_probability", Integer),
-            Column("night_ice_probability", Integer),
-            Column("day_wind_speed_value", Float),
-            Column("day_wind_speed_unit", String),
-            Column("day_wind_direction_degrees", Integer),
-            Column("day_wind_direction_english_abbreviation", String),
-            Column("night_wind_speed_value", Float),
-            Column("night_wind_speed_unit", String),
-            Column("night_wind_direction_degrees", Integer),
-            Column("night_wind_direction_english_abbreviation", String),
-            Column("day_percentage_cloud_cover", Integer),
-            Column("night_percentage_cloud_cover", Integer),
-            Column("airquality_category", String),
-            Column("grass_category", String),
-            Column("mold_category", String),
-            Column("ragweed_category", String),
-            Column("tree_category", String),
-            Column("uvindex_category", String),
-            Column("has_precipitation", Boolean),
-            Column("time_between_sunset_and_sunrise", String),
-            Column("windier_period", String),
+def extract_raw(
+    config: dict,
+    pipeline_logging: PipelineLogging,
+    location_keys: list[int],
+) -> dict[int, str]:
+    """
+    Extracts the forecasts of all locations into the raw store at config["raw_store_path"],
+    without transforming them, config["locations_per_task"] locations at a time. They
+    can be loaded to staging later with `load --replay`. Returns the locations that
+    failed, mapped to their error message.
+    """
+    from etl_project.connectors.accuweather import AccuWeatherApiClient
+    from etl_project.connectors.raw_store import RawResponseStore
+
+    if config.get("raw_store_path") is None:
+        raise Exception("Extract needs raw_store_path to be set in the config.")
+    raw_store = RawResponseStore(config.get("raw_store_path"))
+    accuweather_client = AccuWeatherApiClient.from_config(api_key=os.environ.get("API_KEY"), config=config)
+    locations_per_task = config.get("locations_per_task", 50)
+    failures = {}
+    for start in range(0, len(location_keys), locations_per_task):
+        data = accuweather_client.get_forecasts(
+            location_keys=location_keys[start:start + locations_per_task],
+            forecast_days=config.get("forecast_days"),
+            return_exceptions=True,
         )
+        for location_key, forecasts in data.items():
+            if isinstance(forecasts, Exception):
+                failures[location_key] = str(forecasts)
+            else:
+                raw_store.write(location_key=location_key, data=forecasts)
+    pipeline_logging.logger.info(
+        f"Stored {len(location_keys) - len(failures)} raw responses in {config.get('raw_store_path')}"
+    )
+    return failures
 
-        staging_upsert_load(
-            dataframe=df_clean_forecast,
-            postgresql_client=postgresql_client,
-            table=staging_table,
-            metadata=staging_metadata,
+
+def extract_transform_load_staging(
+    config: dict,
+    postgresql_client: "PostgreSqlClient",
+    pipeline_logging: PipelineLogging,
+    location_keys: list[int],
+    run_metrics: "RunMetrics",
+    replay: bool = False,
+    replay_start_date: date = None,
+    replay_end_date: date = None,
+    accuweather_client: "AccuWeatherApiClient" = None,
+    executor: "ProcessPoolExecutor" = None,
+    load_targets: "ShardedPostgreSqlClient" = None,
+) -> dict[int, str]:
+    """
+    Extracts and transforms all locations in parallel and upserts them into staging.
+
+    Raw responses are kept in the store at config["raw_store_path"], when set. With
+    replay, the responses extracted between replay_start_date and replay_end_date are
+    transformed from that store instead, without calling the API.
+
+    Transformed rows are merged across locations and loaded config["staging_batch_rows"]
+    at a time. With config["staging_compact_dtypes"], low-cardinality string columns are
+    kept as categoricals until they are loaded (see compact_dataframe()). Returns the
+    locations that failed, mapped to their error message.
+
+    With config["history_table_name"], the extracted forecasts are also stored as new
+    versions in that history table, as deltas against their previous fetch (see
+    history_load()). Replays are not added to the history.
+
+    Rows are loaded into load_targets (see get_load_targets()), in parallel on every
+    shard, or into postgresql_client when None.
+
+    The extract and raw_data_transform metrics measured by each task, and the staging
+    load, are recorded in run_metrics. accuweather_client and executor are passed on to
+    extract_transform_locations() to reuse warm connections across runs.
+    """
+    import pandas as pd
+    from etl_project.connectors.raw_store import RawResponseStore
+    from etl_project.assets.accuweather import (
+        compact_dataframe,
+        extract_transform_locations,
+        replay_transform_locations,
+        staging_upsert_load,
+    )
+    from etl_project.assets.forecast_history import history_load
+    from etl_project.assets.forecast_schema import get_staging_table
+    from etl_project.connectors.postgresql import UpsertCounts
+    from etl_project.connectors.sharded_postgresql import ShardedPostgreSqlClient
+
+    load_targets = load_targets or ShardedPostgreSqlClient([postgresql_client])
+    staging_table, staging_metadata = get_staging_table(config.get("staging_table_name"))
+    history_table_name = None if replay else config.get("history_table_name")
+    fetched_at = datetime.now(timezone.utc)
+    staging_batch_rows = config.get("staging_batch_rows", 50_000)
+    compact = config.get("staging_compact_dtypes", False)
+    failures = {}
+    pending = []
+    pending_rows = 0
+
+    def load_pending():
+        # the same forecast day can come from several extractions, keep the latest one
+        dataframe = pd.concat(pending, ignore_index=True).drop_duplicates(
+            subset=["date", "location_key"], keep="last"
+        )
+        if compact:
+            # concat falls back to strings when the categories of the tasks differ
+            dataframe = compact_dataframe(dataframe)
+
+        def load_staging_shard(shard: "PostgreSqlClient", rows: pd.DataFrame) -> UpsertCounts:
+            with shard.begin():
+                return staging_upsert_load(
+                    dataframe=rows,
+                    postgresql_client=shard,
+                    table=staging_table,
+                    metadata=staging_metadata,
+                    load_method=config.get("staging_load_method", "copy"),
+                    batch_size=config.get("load_batch_size", 1000),
+                    partition_interval=config.get("staging_partition_interval", "month"),
+                )
+
+        def load_history_shard(shard: "PostgreSqlClient", rows: pd.DataFrame) -> UpsertCounts:
+            with shard.begin():
+                return history_load(
+                    dataframe=rows,
+                    postgresql_client=shard,
+                    table_name=history_table_name,
+                    fetched_at=fetched_at,
+                )
+
+        with run_metrics.stage("staging_load") as metrics:
+            counts = UpsertCounts.total(load_targets.map_dataframe(dataframe, load_staging_shard).values())
+            metrics["rows_in"] += len(dataframe)
+            metrics["rows_out"] += counts.inserted + counts.updated
+        pipeline_logging.logger.info(
+            f"Loaded {len(dataframe)} rows into staging: {counts.inserted} inserted, "
+            f"{counts.updated} updated, {counts.skipped} unchanged"
         )
+        if history_table_name is not None:
+            with run_metrics.stage("history_load") as metrics:
+                counts = UpsertCounts.total(load_targets.map_dataframe(dataframe, load_history_shard).values())
+                metrics["rows_in"] += len(dataframe)
+                metrics["rows_out"] += counts.inserted
+            pipeline_logging.logger.info(
+                f"Stored {counts.inserted} forecast versions in history, {counts.skipped} unchanged"
+            )
 
-        # create serving table based off staging table
-        pipeline_logging.logger.info("Creating serving DB table")
-        serving_metadata = MetaData()
-        serving_table = Table(
-            config.get("serving_table_name"),
-            serving_metadata,
-            Column("date", Date, primary_key=True),
-            Column("count_precipitations_next_five_days", Integer),
+    raw_store_path = config.get("raw_store_path")
+    raw_store = RawResponseStore(raw_store_path) if raw_store_path is not None else None
+    if replay:
+        if raw_store is None:
+            raise Exception("Replay needs raw_store_path to be set in the config.")
+        results = replay_transform_locations(
+            raw_store=raw_store,
+            start_date=replay_start_date,
+            end_date=replay_end_date,
+            location_keys=location_keys,
+            locations_per_task=config.get("locations_per_task", 50),
+            compact=compact,
+        )
+    else:
+        results = extract_transform_locations(
+            api_key=os.environ.get("API_KEY"),
+            client_config=config,
+            location_keys=location_keys,
+            forecast_days=config.get("forecast_days"),
+            max_processes=config.get("max_processes", 1),
+            locations_per_task=config.get("locations_per_task", 50),
+            compact=compact,
+            raw_store=raw_store,
+            accuweather_client=accuweather_client,
+            executor=executor,
         )
+    for result in results:
+        failures.update(result.failures)
+        for stage, stats in result.stats.items():
+            run_metrics.add(stage, **stats)
+        if result.dataframe is None:
+            continue
+        pending.append(result.dataframe)
+        pending_rows += len(result.dataframe)
+        if pending_rows >= staging_batch_rows:
+            load_pending()
+            pending = []
+            pending_rows = 0
+    if pending:
+        load_pending()
+    return failures
+
+
+def transform_load_serving(
+    config: dict,
+    pipeline_name: str,
+    postgresql_client: "PostgreSqlClient",
+    pipeline_logging: PipelineLogging,
+    run_metrics: "RunMetrics",
+    load_targets: "ShardedPostgreSqlClient" = None,
+) -> None:
+    """
+    Loads the serving tables from staging with the transform templates.
 
-        transform_load(
+    With several load_targets, every shard transforms its own staging rows into its own
+    serving tables, in parallel, with its own watermarks (see get_load_targets()).
+    """
+    from etl_project.assets.transform_load import transform_load
+    from etl_project.assets.watermark import WatermarkStore
+    from etl_project.connectors.postgresql import UpsertCounts
+    from etl_project.connectors.sharded_postgresql import ShardedPostgreSqlClient
+
+    load_targets = load_targets or ShardedPostgreSqlClient([postgresql_client])
+    pipeline_logging.logger.info("Creating serving DB table")
+    serving_table, serving_metadata = get_serving_table(config.get("serving_table_name"))
+
+    def transform_load_shard(shard: "PostgreSqlClient") -> dict[str, UpsertCounts]:
+        return transform_load(
             environment_path=config.get("transform_template_path"),
-            postgresql_client=postgresql_client,
+            postgresql_client=shard,
             source_table_name=config.get("staging_table_name"),
             target_table_name=serving_table,
             metadata=serving_metadata,
+            batch_size=config.get("load_batch_size", 1000),
+            max_batch_bytes=config.get("load_max_batch_bytes"),
+            watermark_store=WatermarkStore(
+                pipeline_name, shard, f"{pipeline_name}_watermarks"
+            ),
+            max_workers=config.get("transform_max_workers", 4),
+            bytecode_cache_path=config.get("transform_bytecode_cache_path"),
         )
+
+    with run_metrics.stage("transform_load") as metrics:
+        transform_counts = {}
+        for shard_counts in load_targets.map_shards(transform_load_shard).values():
+            for template_name, counts in shard_counts.items():
+                transform_counts[template_name] = transform_counts.get(template_name, UpsertCounts()).add(counts)
+        for counts in transform_counts.values():
+            metrics["rows_in"] += sum(counts)
+            metrics["rows_out"] += counts.inserted + counts.updated
+    for template_name, counts in transform_counts.items():
+        pipeline_logging.logger.info(
+            f"Loaded {template_name}: {counts.inserted} inserted, "
+            f"{counts.updated} updated, {counts.skipped} unchanged"
+        )
+
+
+def run_pipeline(
+    config: dict,
+    pipeline_name: str,
+    postgresql_client: "PostgreSqlClient",
+    pipeline_logging: PipelineLogging,
+    location_keys: list[int] = None,
+    load_staging: bool = True,
+    load_serving: bool = True,
+    replay: bool = False,
+    replay_start_date: date = None,
+    replay_end_date: date = None,
+    accuweather_client: "AccuWeatherApiClient" = None,
+    executor: "ProcessPoolExecutor" = None,
+    load_targets: "ShardedPostgreSqlClient" = None,
+) -> bool:
+    """
+    Runs the pipeline once for location_keys, or every location of get_location_keys()
+    when None. With load_staging, extracts and transforms them into staging. With
+    load_serving, then loads the serving table with the transform templates.
+
+    Staging and serving tables are loaded into load_targets, or postgresql_client when
+    None. The run is logged in the metadata table of postgresql_client under a new run
+    id and its metrics are stored in its run metrics table. Returns whether the run
+    succeeded.
+    """
+    from etl_project.assets.metadata_logging import MetaDataLogging, MetaDataLoggingStatus
+    from etl_project.assets.run_metrics import RunMetrics
+
+    metadata_logger = MetaDataLogging(
+        pipeline_name,
+        postgresql_client,
+        config,
+        f"{pipeline_name}_pipeline_logs",
+    )
+    run_metrics = RunMetrics(
+        pipeline_name,
+        metadata_logger.run_id,
+        postgresql_client,
+        f"{pipeline_name}_run_metrics",
+    )
+
+    metadata_logger.log()
+    try:
+        if load_staging:
+            if location_keys is None:
+                location_keys = get_location_keys(config, postgresql_client)
+
+            # extract and transform raw data, then load it to staging
+            pipeline_logging.logger.info(
+                f"{'Replaying' if replay else 'Extracting'} and transforming raw data from AccuWeather for {len(location_keys)} locations"
+            )
+            failures = extract_transform_load_staging(
+                config=config,
+                postgresql_client=postgresql_client,
+                pipeline_logging=pipeline_logging,
+                location_keys=location_keys,
+                run_metrics=run_metrics,
+                replay=replay,
+                replay_start_date=replay_start_date,
+                replay_end_date=replay_end_date,
+                accuweather_client=accuweather_client,
+                executor=executor,
+                load_targets=load_targets,
+            )
+            for location_key, error in failures.items():
+                pipeline_logging.logger.warning(f"Location {location_key} failed: {error}")
+            if len(failures) == len(location_keys):
+                raise Exception("Extraction failed for every location.")
+
+        if load_serving:
+            # create serving table based off staging table
+            transform_load_serving(
+                config=config,
+                pipeline_name=pipeline_name,
+                postgresql_client=postgresql_client,
+                pipeline_logging=pipeline_logging,
+                run_metrics=run_metrics,
+                load_targets=load_targets,
+            )
+        pipeline_logging.logger.info(f"Database pool status: {postgresql_client.pool_status()}")
+        if load_targets is not None and len(load_targets.shards) > 1:
+            pipeline_logging.logger.info(f"Shard pool status: {load_targets.pool_status()}")
         metadata_logger.log(
-            status=MetaDataLoggingStatus.RUN_SUCCESS, logs=pipeline_logging.get_logs()
+            status=MetaDataLoggingStatus.RUN_SUCCESS, log_chunks=pipeline_logging.get_log_chunks()
         )
+        return True
     except BaseException as e:
         pipeline_logging.logger.error(f"Pipeline run failed. See detailed logs: {e}")
         metadata_logger.log(
-            status=MetaDataLoggingStatus.RUN_FAILURE, logs=pipeline_logging.get_logs()
+            status=MetaDataLoggingStatus.RUN_FAILURE, log_chunks=pipeline_logging.get_log_chunks()
         )  # log error
+        return False
+    finally:
+        # a failed write must not hide the result of the run, nor stop the scheduler
+        cleanups = {"run metrics": run_metrics.write}
+        if config.get("metrics_prometheus_path") is not None:
+            cleanups["Prometheus metrics"] = lambda: run_metrics.write_prometheus(config.get("metrics_prometheus_path"))
+        cleanups["run logs"] = metadata_logger.close
+        for name, cleanup in cleanups.items():
+            try:
+                cleanup()
+            except Exception as e:
+                pipeline_logging.logger.error(f"Writing the {name} failed: {e}")
+
+
+def run_scheduler(
+    config: dict,
+    pipeline_name: str,
+    postgresql_client: "PostgreSqlClient",
+    pipeline_logging: PipelineLogging,
+    stop_event: threading.Event,
+    load_targets: "ShardedPostgreSqlClient" = None,
+) -> None:
+    """
+    Runs the pipeline in a resident process until stop_event is set.
+
+    Each location is refreshed every config["location_refresh_seconds"], or its entry in
+    config["location_refresh_intervals"], with the locations staggered over the interval
+    (see LocationScheduler). Every config["scheduler_tick_seconds"] at most, the location
+    list is read again and the locations that are due run through run_pipeline().
+
+    The database pools, the API client (or, with max_processes > 1, the worker pool and
+    the clients of its processes) and the logger stay open between runs. A failed run
+    is logged and its locations wait for their next refresh, the other locations keep
+    their schedule. Setting stop_event lets the current run finish before returning.
+    """
+    from etl_project.connectors.accuweather import AccuWeatherApiClient
+    from etl_project.assets.accuweather import create_worker_pool
+
+    scheduler = LocationScheduler(
+        location_keys=get_location_keys(config, postgresql_client),
+        interval_seconds=config.get("location_refresh_seconds", 3600),
+        intervals=config.get("location_refresh_intervals"),
+    )
+    tick_seconds = config.get("scheduler_tick_seconds", 60)
+    max_processes = config.get("max_processes", 1)
+    accuweather_client = None
+    executor = None
+    if max_processes <= 1:
+        accuweather_client = AccuWeatherApiClient.from_config(api_key=os.environ.get("API_KEY"), config=config)
+    else:
+        executor = create_worker_pool(os.environ.get("API_KEY"), config, max_processes)
+    pipeline_logging.logger.info(
+        f"Scheduling {len(scheduler.next_due)} locations every {scheduler.interval_seconds} seconds"
+    )
+    try:
+        while not stop_event.is_set():
+            try:
+                scheduler.set_locations(get_location_keys(config, postgresql_client))
+            except Exception as e:
+                pipeline_logging.logger.warning(f"Keeping the previous locations, reading them failed: {e}")
+            location_keys = scheduler.due()
+            if location_keys:
+                pipeline_logging.clear_logs()
+                try:
+                    run_pipeline(
+                        config=config,
+                        pipeline_name=pipeline_name,
+                        postgresql_client=postgresql_client,
+                        pipeline_logging=pipeline_logging,
+                        location_keys=location_keys,
+                        accuweather_client=accuweather_client,
+                        executor=executor,
+                        load_targets=load_targets,
+                    )
+                except Exception as e:
+                    # e.g. the database is down, the locations are retried at their next refresh
+                    pipeline_logging.logger.error(f"Run of locations {location_keys} failed: {e}")
+                continue
+            seconds_until_next = scheduler.seconds_until_next()
+            stop_event.wait(tick_seconds if seconds_until_next is None else min(seconds_until_next, tick_seconds))
+        pipeline_logging.logger.info("Stopped the scheduler")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def dry_run(command: str, config: dict, pipeline_logging: PipelineLogging) -> None:
+    """
+    Logs what a command would do, without calling the API or the database: the locations
+    it would extract, the DDL of the staging table it would load and the SQL of the
+    transform templates, rendered for a full load.
+    """
+    logger = pipeline_logging.logger
+    if command in ("run", "extract", "load"):
+        from etl_project.connectors.accuweather import AccuWeatherApiClient
+
+        if os.environ.get("API_KEY") is None:
+            logger.warning("API_KEY is not set")
+        # without the response cache of from_config(), which would create its file
+        accuweather_client = AccuWeatherApiClient(
+            api_key=os.environ.get("API_KEY", ""),
+            base_url=config.get("base_url", "https://dataservice.accuweather.com"),
+            max_workers=config.get("max_workers", 8),
+        )
+        if config.get("location_table") is not None:
+            locations = f"the locations of table {config.get('location_table')}"
+        else:
+            locations = f"locations {get_location_keys(config, None)}"
+        logger.info(
+            f"Would extract {config.get('forecast_days')} forecast days for {locations} "
+            f"from {accuweather_client.base_url}"
+        )
+    if command in ("run", "load"):
+        from sqlalchemy.dialects import postgresql
+        from sqlalchemy.schema import CreateTable
+        from etl_project.assets.forecast_schema import get_staging_table
+
+        staging_table, _ = get_staging_table(config.get("staging_table_name"))
+        logger.info(f"Would load staging table:{CreateTable(staging_table).compile(dialect=postgresql.dialect())}")
+    if command in ("run", "transform"):
+        from etl_project.assets.transform_load import get_environment, render_transform
+
+        environment = get_environment(config.get("transform_template_path"), config.get("transform_bytecode_cache_path"))
+        for template_name in environment.list_templates():
+            sql, _ = render_transform(environment.get_template(template_name), config.get("staging_table_name"))
+            logger.info(f"Would run {template_name}:\n{sql}")
+
+
+def main(argv: list[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in [*COMMANDS, "-h", "--help"]:
+        # without a command, run the whole pipeline
+        argv = ["run", *argv]
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--config",
+        type=Path,
+        default=Path(__file__).with_suffix(".yaml"),
+        help="pipeline config file (default: %(default)s)",
+    )
+    common.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print what the command would do without calling the API or the database",
+    )
+    replay = argparse.ArgumentParser(add_help=False)
+    replay.add_argument(
+        "--replay",
+        action="store_true",
+        help="transform the raw responses in raw_store_path instead of calling the API",
+    )
+    replay.add_argument("--replay-start-date", type=date.fromisoformat, help="first extraction date to replay")
+    replay.add_argument("--replay-end-date", type=date.fromisoformat, help="last extraction date to replay")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser(
+        "run", parents=[common, replay], help="load staging, then the serving tables (default)"
+    )
+    run_parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and refresh each location every location_refresh_seconds, until SIGTERM",
+    )
+    subparsers.add_parser("extract", parents=[common], help="store raw API responses in raw_store_path")
+    subparsers.add_parser("load", parents=[common, replay], help="extract and transform into staging")
+    subparsers.add_parser("transform", parents=[common], help="load the serving tables from staging")
+    args = parser.parse_args(argv)
+    if getattr(args, "daemon", False) and args.replay:
+        parser.error("--daemon cannot be combined with --replay")
+
+    # load environment variables
+    load_dotenv()
+
+    # get config variables
+    if args.config.exists():
+        with open(args.config) as yaml_file:
+            pipeline_config = yaml.safe_load(yaml_file)
+    else:
+        raise Exception(f"Missing {args.config} file.")
+
+    config = pipeline_config.get("config")
+    pipeline_name = pipeline_config.get("name")
+    daemon = getattr(args, "daemon", False)
+    pipeline_logging = PipelineLogging(
+        pipeline_name,
+        config.get("log_folder_path"),
+        log_chunk_bytes=config.get("log_chunk_bytes", 64 * 1024),
+        # a resident process appends to one rotated file instead of a file per start
+        log_file_max_bytes=config.get("log_file_max_bytes", 10 * 1024 * 1024) if daemon else None,
+        log_file_backups=config.get("log_file_backups", 5),
+    )
+    postgresql_client = None
+    load_targets = None
+    try:
+        if args.dry_run:
+            dry_run(args.command, config, pipeline_logging)
+            return 0
+        if args.command == "extract":
+            # the database is only needed to read the locations from a table
+            if config.get("location_table") is not None:
+                postgresql_client = get_postgresql_client(config)
+            location_keys = get_location_keys(config, postgresql_client)
+            failures = extract_raw(config, pipeline_logging, location_keys)
+            for location_key, error in failures.items():
+                pipeline_logging.logger.warning(f"Location {location_key} failed: {error}")
+            return 1 if len(failures) == len(location_keys) else 0
+        postgresql_client = get_postgresql_client(config)
+        load_targets = get_load_targets(config, postgresql_client)
+        if daemon:
+            # drain on SIGTERM or Ctrl-C: finish the current run, then exit
+            stop_event = threading.Event()
+            for signal_number in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signal_number, lambda signal_number, frame: stop_event.set())
+            run_scheduler(config, pipeline_name, postgresql_client, pipeline_logging, stop_event, load_targets)
+            return 0
+        succeeded = run_pipeline(
+            config=config,
+            pipeline_name=pipeline_name,
+            postgresql_client=postgresql_client,
+            pipeline_logging=pipeline_logging,
+            load_staging=args.command in ("run", "load"),
+            load_serving=args.command in ("run", "transform"),
+            replay=getattr(args, "replay", False),
+            replay_start_date=getattr(args, "replay_start_date", None),
+            replay_end_date=getattr(args, "replay_end_date", None),
+            load_targets=load_targets,
+        )
+        return 0 if succeeded else 1
     finally:
-        pipeline_logging.logger.handlers.clear()
+        pipeline_logging.close()
+        if load_targets is not None:
+            load_targets.dispose()
+        if postgresql_client is not None:
+            postgresql_client.engine.dispose()
+
 
-    # TODO: write project-plan.MD and commit and request PR
-    # TODO: create logging
-    # TODO: create pytest
+# TODO: write project-plan.MD and commit and request PR
+# TODO: create logging
+# TODO: create pytest
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic import make_daily_forecasts
+from datetime import date
+from etl_project.assets.accuweather import (
+    CATEGORICAL_COLUMNS,
+    compact_dataframe,
+    extract_transform_locations,
+    raw_data_transform,
+    replay_transform_locations,
+)
+from etl_project.assets.forecast_schema import PANDAS_DTYPES, get_staging_table
+from etl_project.connectors.raw_store import RawResponseStore
+import pandas as pd
+import pytest
+import random
+
+
+@pytest.fixture
+def forecast_server():
+    with StubServer() as server:
+        yield server
+
+
+def test_raw_data_transform_air_and_pollen_categories():
+    data = make_daily_forecasts(forecast_days=5, start_date=date(2023, 9, 26))
+
+    df_clean_forecast = raw_data_transform(pd.json_normalize(data=data), location_key=60449)
+
+    for name in ["airquality", "grass", "mold", "ragweed", "tree", "uvindex"]:
+        assert f"{name}_category" in df_clean_forecast.columns
+    assert "AirAndPollen" not in df_clean_forecast.columns
+    assert df_clean_forecast["grass_category"].tolist() == [
+        next(entry["Category"] for entry in forecast["AirAndPollen"] if entry["Name"] == "Grass")
+        for forecast in data
+    ]
+
+
+def test_raw_data_transform_ignores_air_and_pollen_order():
+    data = make_daily_forecasts(forecast_days=5, start_date=date(2023, 9, 26))
+    expected = raw_data_transform(pd.json_normalize(data=data), location_key=60449)
+
+    for forecast in data:
+        random.Random(0).shuffle(forecast["AirAndPollen"])
+    data[0]["AirAndPollen"] = data[0]["AirAndPollen"][1:]
+    df_clean_forecast = raw_data_transform(pd.json_normalize(data=data), location_key=60449)
+
+    pd.testing.assert_frame_equal(df_clean_forecast.iloc[1:], expected.iloc[1:])
+    assert pd.isna(df_clean_forecast.loc[0, [c for c in expected.columns if c.endswith("_category")]]).sum() == 1
+
+
+def test_raw_data_transform_derived_columns():
+    data = make_daily_forecasts(forecast_days=5, start_date=date(2023, 9, 26))
+
+    df_clean_forecast = raw_data_transform(pd.json_normalize(data=data), location_key=60449)
+
+    assert df_clean_forecast["date"].tolist() == [date(2023, 9, 26 + offset) for offset in range(5)]
+    assert (df_clean_forecast["location_key"] == 60449).all()
+    assert df_clean_forecast["windier_period"].tolist() == [
+        "day" if forecast["Day"]["Wind"]["Speed"]["Value"] >= forecast["Night"]["Wind"]["Speed"]["Value"] else "night"
+        for forecast in data
+    ]
+
+
+def test_raw_data_transform_matches_staging_schema():
+    data = make_daily_forecasts(forecast_days=5, start_date=date(2023, 9, 26))
+
+    df_clean_forecast = raw_data_transform(pd.json_normalize(data=data), location_key=60449)
+    staging_table, _ = get_staging_table("staging_forecast_weather")
+
+    assert list(df_clean_forecast.columns) == [column.name for column in staging_table.columns]
+    for name, dtype in PANDAS_DTYPES.items():
+        assert df_clean_forecast[name].dtype == dtype
+
+
+def test_compact_dataframe():
+    data = make_daily_forecasts(forecast_days=5, start_date=date(2023, 9, 26))
+    df_clean_forecast = pd.concat(
+        [raw_data_transform(pd.json_normalize(data=data), location_key=location_key) for location_key in range(200)],
+        ignore_index=True
+    )
+
+    df_compact = compact_dataframe(df_clean_forecast)
+
+    for column in CATEGORICAL_COLUMNS:
+        assert df_compact[column].dtype == "category"
+    pd.testing.assert_frame_equal(df_compact.astype(df_clean_forecast.dtypes), df_clean_forecast)
+    assert df_compact.memory_usage(deep=True).sum() < df_clean_forecast.memory_usage(deep=True).sum() / 2
+
+
+@pytest.mark.parametrize("max_processes", [1, 2])
+def test_extract_transform_locations_isolates_failures(forecast_server, max_processes):
+    client_config = {"base_url": f"http://127.0.0.1:{forecast_server.port}", "max_retries": 0}
+
+    results = list(extract_transform_locations(
+        api_key="test",
+        client_config=client_config,
+        location_keys=[1, 2, 999, 4, 5],
+        forecast_days=5,
+        max_processes=max_processes,
+        locations_per_task=2
+    ))
+
+    dataframe = pd.concat([result.dataframe for result in results if result.dataframe is not None])
+    failures = {key: error for result in results for key, error in result.failures.items()}
+    assert len(results) == 3
+    assert sorted(dataframe["location_key"].unique()) == [1, 2, 4, 5]
+    assert len(dataframe) == 20
+    assert list(failures) == [999]
+    assert sum(result.stats["extract"]["bytes_fetched"] for result in results) > 0
+    assert sum(result.stats["raw_data_transform"]["rows_out"] for result in results) == 20
+
+
+def test_replay_transform_locations(forecast_server, tmp_path):
+    client_config = {"base_url": f"http://127.0.0.1:{forecast_server.port}", "max_retries": 0}
+    raw_store = RawResponseStore(path=str(tmp_path))
+    extracted = pd.concat([
+        result.dataframe for result in extract_transform_locations(
+            api_key="test",
+            client_config=client_config,
+            location_keys=[1, 2, 999],
+            forecast_days=5,
+            raw_store=raw_store
+        )
+    ], ignore_index=True)
+
+    results = list(replay_transform_locations(raw_store=raw_store, locations_per_task=1))
+
+    assert len(results) == 2
+    assert all(result.failures == {} for result in results)
+    pd.testing.assert_frame_equal(pd.concat([result.dataframe for result in results], ignore_index=True), extracted)
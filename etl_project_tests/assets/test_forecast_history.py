@@ -0,0 +1,44 @@
+from benchmarks.synthetic import make_daily_forecasts
+from datetime import date, datetime, timezone
+from etl_project.assets.accuweather import raw_data_transform
+from etl_project.assets.forecast_history import VERSION_COLUMNS, history_load
+import pandas as pd
+
+
+def test_history_load_stores_deltas(postgresql_client):
+    table_name = "test_forecast_history"
+    postgresql_client.execute(f"drop view if exists {table_name}_versions")
+    postgresql_client.execute(f"drop table if exists {table_name}, {table_name}_codes")
+    postgresql_client.invalidate_schema_cache()
+    data = make_daily_forecasts(forecast_days=5, start_date=date(2023, 9, 26))
+    dataframe = raw_data_transform(pd.json_normalize(data), location_key=60449)
+    first_fetch = datetime(2023, 9, 26, 6, tzinfo=timezone.utc)
+    second_fetch = datetime(2023, 9, 26, 12, tzinfo=timezone.utc)
+    third_fetch = datetime(2023, 9, 26, 18, tzinfo=timezone.utc)
+
+    first_counts = history_load(dataframe, postgresql_client, table_name, first_fetch)
+    second_counts = history_load(dataframe, postgresql_client, table_name, second_fetch)
+    changed = dataframe.copy()
+    changed.loc[0, "maximum_temperature_value"] += 1
+    changed.loc[0, "windier_period"] = "night" if changed.loc[0, "windier_period"] == "day" else "day"
+    third_counts = history_load(changed, postgresql_client, table_name, third_fetch)
+
+    assert (first_counts.inserted, first_counts.skipped) == (5, 0)
+    assert (second_counts.inserted, second_counts.skipped) == (0, 5)
+    assert (third_counts.inserted, third_counts.skipped) == (1, 4)
+    delta = postgresql_client.execute_sql(
+        f"select changed_columns, maximum_temperature_value, moon_phase from {table_name} where fetched_at = '{third_fetch.isoformat()}'"
+    )[0]
+    assert delta[0] == sum(
+        1 << index for index, column in enumerate(VERSION_COLUMNS)
+        if column.name in ("maximum_temperature_value", "windier_period")
+    )
+    assert delta[1] == changed.loc[0, "maximum_temperature_value"]
+    assert delta[2] is None
+    versions = postgresql_client.execute_sql(
+        f"select fetched_at, maximum_temperature_value, windier_period, moon_phase from {table_name}_versions "
+        f"where date = '{dataframe.loc[0, 'date'].isoformat()}' order by fetched_at"
+    )
+    assert [row[1] for row in versions] == [dataframe.loc[0, "maximum_temperature_value"], changed.loc[0, "maximum_temperature_value"]]
+    assert [row[2] for row in versions] == [dataframe.loc[0, "windier_period"], changed.loc[0, "windier_period"]]
+    assert versions[0][3] == versions[1][3] == dataframe.loc[0, "moon_phase"]
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from etl_project.assets.metadata_logging import MetaDataLogging, MetaDataLoggingStatus
+import gzip
+import pytest
+
+
+@pytest.fixture
+def log_table_name(postgresql_client):
+    for table_name in ["test_logs", "test_logs_run_ids", "test_logs_chunks"]:
+        postgresql_client.engine.execute(f"drop table if exists {table_name}")
+    yield "test_logs"
+    for table_name in ["test_logs", "test_logs_run_ids", "test_logs_chunks"]:
+        postgresql_client.engine.execute(f"drop table if exists {table_name}")
+
+
+def test_metadata_logging_allocates_unique_run_ids(postgresql_client, log_table_name):
+    MetaDataLogging("test", postgresql_client, log_table_name=log_table_name)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        run_ids = list(executor.map(
+            lambda _: MetaDataLogging("test", postgresql_client, log_table_name=log_table_name).run_id,
+            range(16)
+        ))
+
+    assert sorted(run_ids) == list(range(2, 18))
+    assert MetaDataLogging("other", postgresql_client, log_table_name=log_table_name).run_id == 1
+
+
+def test_metadata_logging_writes_in_background(postgresql_client, log_table_name):
+    metadata_logger = MetaDataLogging("test", postgresql_client, log_table_name=log_table_name)
+
+    statements = postgresql_client.pool_status()["statements"]
+    metadata_logger.log()
+    metadata_logger.log(status=MetaDataLoggingStatus.RUN_SUCCESS, logs="done")
+    metadata_logger.close()
+
+    assert postgresql_client.pool_status()["statements"] == statements
+
+    rows = postgresql_client.execute_sql(f"select run_id, status, logs from {log_table_name} order by timestamp")
+    assert [tuple(row) for row in rows] == [(1, "start", None), (1, "success", "done")]
+
+
+def test_metadata_logging_stores_log_chunks(postgresql_client, log_table_name):
+    metadata_logger = MetaDataLogging("test", postgresql_client, log_table_name=log_table_name)
+
+    metadata_logger.log(
+        status=MetaDataLoggingStatus.RUN_SUCCESS,
+        log_chunks=[gzip.compress(b"setup\n"), gzip.compress(b"done\n")],
+    )
+    metadata_logger.close()
+
+    assert metadata_logger.get_logs(metadata_logger.run_id) == "setup\ndone\n"
@@ -0,0 +1,61 @@
+from etl_project.assets.pipeline_logging import PipelineLogging, decompress_logs
+
+
+def test_pipeline_logging_replaces_handlers(tmp_path):
+    first_logging = PipelineLogging("test_pipeline", str(tmp_path))
+    second_logging = PipelineLogging("test_pipeline", str(tmp_path))
+
+    second_logging.logger.info("hello")
+
+    assert len(second_logging.logger.handlers) == 1
+    # the replaced instance stopped its listener and closed its log file
+    assert first_logging.closed
+    assert first_logging.listener.handlers[0].stream is None
+    assert "hello" in second_logging.get_logs()
+    assert "hello" not in first_logging.get_logs()
+    second_logging.close()
+    first_logging.close()
+    assert "hello" in open(second_logging.file_path).read()
+
+
+def test_pipeline_logging_keeps_compressed_chunks(tmp_path):
+    pipeline_logging = PipelineLogging("test_pipeline", str(tmp_path), log_chunk_bytes=1000)
+
+    for line in range(100):
+        pipeline_logging.logger.info(f"line {line}")
+    chunks = pipeline_logging.get_log_chunks()
+    logs = pipeline_logging.get_logs()
+    pipeline_logging.close()
+
+    assert len(chunks) > 1
+    assert logs == decompress_logs(chunks)
+    assert "line 0\n" in logs
+    assert logs.endswith("line 99\n")
+    assert len(logs.splitlines()) == 100
+
+
+def test_pipeline_logging_rotated_file(tmp_path):
+    first_logging = PipelineLogging("test_pipeline", str(tmp_path), log_file_max_bytes=1024 * 1024)
+    first_logging.logger.info("first start")
+    first_logging.close()
+    second_logging = PipelineLogging("test_pipeline", str(tmp_path), log_file_max_bytes=1024 * 1024)
+    second_logging.logger.info("second start")
+    second_logging.close()
+
+    assert [path.name for path in tmp_path.iterdir()] == ["test_pipeline.log"]
+    logs = (tmp_path / "test_pipeline.log").read_text()
+    assert "first start" in logs and "second start" in logs
+
+
+def test_pipeline_logging_clear_logs(tmp_path):
+    pipeline_logging = PipelineLogging("test_pipeline", str(tmp_path))
+
+    pipeline_logging.logger.info("first run")
+    pipeline_logging.clear_logs()
+    pipeline_logging.logger.info("second run")
+    logs = pipeline_logging.get_logs()
+    pipeline_logging.close()
+
+    assert "first run" not in logs
+    assert "second run" in logs
+    assert "first run" in open(pipeline_logging.file_path).read()
@@ -0,0 +1,47 @@
+from etl_project.assets.run_metrics import RunMetrics
+import time
+
+
+def test_run_metrics_stages_accumulate():
+    run_metrics = RunMetrics("test", run_id=1)
+
+    for _ in range(2):
+        with run_metrics.stage("load") as metrics:
+            time.sleep(0.01)
+            metrics["rows_in"] += 5
+    run_metrics.add("extract", wall_seconds=1.5, bytes_fetched=100, peak_rss_bytes=10)
+    run_metrics.add("extract", wall_seconds=0.5, bytes_fetched=50, peak_rss_bytes=5)
+
+    assert run_metrics.stages["load"]["rows_in"] == 10
+    assert run_metrics.stages["load"]["wall_seconds"] >= 0.02
+    assert run_metrics.stages["load"]["peak_rss_bytes"] > 0
+    assert run_metrics.stages["extract"]["wall_seconds"] == 2
+    assert run_metrics.stages["extract"]["bytes_fetched"] == 150
+    assert run_metrics.stages["extract"]["peak_rss_bytes"] == 10
+
+
+def test_run_metrics_write_prometheus(tmp_path):
+    run_metrics = RunMetrics("test", run_id=7)
+    run_metrics.add("extract", bytes_fetched=100)
+
+    run_metrics.write_prometheus(str(tmp_path / "test.prom"))
+
+    lines = (tmp_path / "test.prom").read_text().splitlines()
+    assert 'etl_pipeline_stage_bytes_fetched{pipeline="test",stage="extract"} 100' in lines
+    assert 'etl_pipeline_run_id{pipeline="test"} 7' in lines
+    assert list(tmp_path.iterdir()) == [tmp_path / "test.prom"]
+
+
+def test_run_metrics_write(postgresql_client):
+    postgresql_client.engine.execute("drop table if exists test_run_metrics")
+    run_metrics = RunMetrics("test", 1, postgresql_client, "test_run_metrics")
+    with run_metrics.stage("load") as metrics:
+        postgresql_client.execute_sql("select 1")
+        metrics["rows_out"] = 3
+
+    run_metrics.write()
+    run_metrics.write()
+
+    rows = postgresql_client.execute_sql("select run_id, stage, rows_out, db_round_trips from test_run_metrics")
+    postgresql_client.engine.execute("drop table if exists test_run_metrics")
+    assert [tuple(row) for row in rows] == [(1, "load", 3, 1)]
@@ -0,0 +1,56 @@
+from etl_project.assets.scheduler import LocationScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_location_scheduler_staggers_locations():
+    clock = FakeClock()
+    scheduler = LocationScheduler([1, 2, 3, 4], interval_seconds=100, clock=clock)
+
+    assert scheduler.due() == [1]
+    clock.now = 50
+    assert scheduler.due() == [2, 3]
+    assert scheduler.seconds_until_next() == 25
+    clock.now = 100
+    assert scheduler.due() == [1, 4]
+    assert scheduler.due() == []
+
+
+def test_location_scheduler_uses_location_intervals():
+    clock = FakeClock()
+    scheduler = LocationScheduler([1, 2], interval_seconds=100, intervals={1: 10}, clock=clock)
+
+    refreshed = []
+    for now in range(0, 101, 10):
+        clock.now = now
+        refreshed.extend(scheduler.due())
+
+    assert refreshed.count(1) == 11
+    assert refreshed.count(2) == 1
+
+
+def test_location_scheduler_reschedules_late_locations():
+    clock = FakeClock()
+    scheduler = LocationScheduler([1], interval_seconds=10, clock=clock)
+    scheduler.due()
+
+    clock.now = 35
+    assert scheduler.due() == [1]
+    assert scheduler.next_due[1] == 45
+
+
+def test_location_scheduler_set_locations():
+    clock = FakeClock()
+    scheduler = LocationScheduler([1, 2], interval_seconds=100, clock=clock)
+    clock.now = 20
+    scheduler.due()
+
+    scheduler.set_locations([2, 3, 4])
+
+    assert scheduler.next_due == {2: 50, 3: 20, 4: 70}
@@ -0,0 +1,176 @@
+from etl_project.assets.transform_load import (
+    transform_load,
+    get_template_dependencies,
+    get_environment,
+    get_template_config,
+    render_transform,
+)
+from etl_project.assets.watermark import WatermarkStore
+from sqlalchemy import Table, Column, MetaData, Integer, Date
+from datetime import date
+import pytest
+
+
+HIGH_WATERMARK_TEMPLATE = """{% set config = {
+    "extract_type": "incremental",
+    "incremental_column": "date",
+    "watermark_strategy": "high_watermark",
+    "materialization": "MATERIALIZATION"
+} %}
+
+select date, count(*) as location_count
+from {{ source_table_name }}
+{% if is_incremental %}
+    where {{ config["incremental_column"] }} >= '{{ incremental_value }}'
+{% endif %}
+group by date
+"""
+
+
+@pytest.fixture
+def source_table(postgresql_client):
+    for table_name in ["test_source", "test_target", "test_watermarks", "test_total"]:
+        postgresql_client.engine.execute(f"drop table if exists {table_name}")
+    metadata = MetaData()
+    table = Table(
+        "test_source",
+        metadata,
+        Column("date", Date, primary_key=True),
+        Column("location_key", Integer, primary_key=True),
+    )
+    yield table, metadata
+    for table_name in ["test_source", "test_target", "test_watermarks", "test_total"]:
+        postgresql_client.engine.execute(f"drop table if exists {table_name}")
+
+
+@pytest.mark.parametrize("materialization", ["round_trip", "in_database"])
+def test_transform_load_high_watermark(postgresql_client, source_table, tmp_path, materialization):
+    (tmp_path / "location_count.sql").write_text(
+        HIGH_WATERMARK_TEMPLATE.replace("MATERIALIZATION", materialization)
+    )
+    table, metadata = source_table
+    target_metadata = MetaData()
+    target_table = Table(
+        "test_target",
+        target_metadata,
+        Column("date", Date, primary_key=True),
+        Column("location_count", Integer),
+    )
+    watermark_store = WatermarkStore("test", postgresql_client, "test_watermarks")
+
+    def run(rows):
+        postgresql_client.upsert(data=rows, table=table, metadata=metadata)
+        transform_load(
+            environment_path=str(tmp_path),
+            postgresql_client=postgresql_client,
+            metadata=target_metadata,
+            source_table_name="test_source",
+            target_table_name=target_table,
+            watermark_store=watermark_store,
+        )
+
+    run([{"date": date(2023, 9, day), "location_key": 1} for day in (1, 2, 3)])
+    assert watermark_store.get("location_count.sql") == "2023-09-03"
+
+    # a late row before the watermark is not transformed again, new rows are
+    run([
+        {"date": date(2023, 9, 1), "location_key": 2},
+        {"date": date(2023, 9, 4), "location_key": 2},
+    ])
+    rows = postgresql_client.execute_sql("select date, location_count from test_target order by date")
+    assert [tuple(row) for row in rows] == [
+        (date(2023, 9, 1), 1),
+        (date(2023, 9, 2), 1),
+        (date(2023, 9, 3), 1),
+        (date(2023, 9, 4), 1),
+    ]
+    assert watermark_store.get("location_count.sql") == "2023-09-04"
+
+
+def test_render_transform_binds_incremental_value(tmp_path):
+    (tmp_path / "location_count.sql").write_text("""{% set config = {"extract_type": "incremental"} %}
+    select date from {{ source_table_name }}
+    {% if is_incremental %}where date >= {{ incremental_parameter }}{% endif %}
+    """)
+    environment = get_environment(str(tmp_path), str(tmp_path / "bytecode"))
+    sql_template = environment.get_template("location_count.sql")
+    assert environment.get_template("location_count.sql") is sql_template
+
+    first_sql, first_parameters = render_transform(sql_template, "test_source", "2023-09-01")
+    second_sql, second_parameters = render_transform(sql_template, "test_source", "2023-09-02")
+    assert first_sql == second_sql
+    assert ":incremental_value" in first_sql
+    assert first_parameters == {"incremental_value": "2023-09-01"}
+    assert second_parameters == {"incremental_value": "2023-09-02"}
+    assert list((tmp_path / "bytecode").iterdir())
+
+
+def test_template_config_uses_table_names_from_config():
+    environment = get_environment("./etl_project/assets/sql/transform")
+    sql_template = environment.get_template("forecast_weather.sql")
+
+    config = get_template_config(sql_template, "test_staging", "test_serving")
+
+    assert config["sources"] == ["test_staging"]
+    assert config["target"] == "test_serving"
+
+
+def test_get_template_dependencies():
+    templates = {
+        "daily.sql": {"sources": ["staging"], "target": "daily"},
+        "weekly.sql": {"sources": ["daily"], "target": "weekly"},
+        "summary.sql": {"sources": ["daily", "weekly"], "target": "summary"},
+        "other.sql": {"sources": ["staging"], "target": "other"},
+    }
+    assert get_template_dependencies(templates) == {
+        "daily.sql": set(),
+        "weekly.sql": {"daily.sql"},
+        "summary.sql": {"daily.sql", "weekly.sql"},
+        "other.sql": set(),
+    }
+
+
+def test_transform_load_dependency_graph(postgresql_client, source_table, tmp_path):
+    # total.sql sorts first by name but reads the table loaded by location_count.sql
+    (tmp_path / "total.sql").write_text("""{% set config = {
+        "extract_type": "full",
+        "sources": ["test_target"],
+        "target": "test_total"
+    } %}
+    select 1 as id, sum(location_count) as location_count from test_target
+    """)
+    (tmp_path / "location_count.sql").write_text(
+        HIGH_WATERMARK_TEMPLATE.replace("MATERIALIZATION", "in_database")
+    )
+    table, metadata = source_table
+    target_metadata = MetaData()
+    Table(
+        "test_target",
+        target_metadata,
+        Column("date", Date, primary_key=True),
+        Column("location_count", Integer),
+    )
+    Table(
+        "test_total",
+        target_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("location_count", Integer),
+    )
+    for table_name in ["test_target", "test_total"]:
+        postgresql_client.create_table(table_name, metadata=target_metadata)
+    postgresql_client.upsert(
+        data=[{"date": date(2023, 9, day), "location_key": 1} for day in (1, 2, 3)],
+        table=table,
+        metadata=metadata
+    )
+
+    transform_load(
+        environment_path=str(tmp_path),
+        postgresql_client=postgresql_client,
+        metadata=target_metadata,
+        source_table_name="test_source",
+        target_table_name=target_metadata.tables["test_target"],
+        max_workers=2,
+    )
+
+    assert [tuple(row) for row in postgresql_client.execute_sql("select id, location_count from test_total")] == [(1, 3)]
@@ -0,0 +1,32 @@
+from dotenv import load_dotenv
+from etl_project.connectors.postgresql import PostgreSqlClient
+from etl_project.connectors.sharded_postgresql import ShardedPostgreSqlClient
+import os
+import pytest
+
+
+@pytest.fixture
+def postgresql_client():
+    load_dotenv()
+    if not os.environ.get("POSTGRES_HOST"):
+        pytest.skip("POSTGRES_HOST is not set.")
+    return PostgreSqlClient(
+        server_name=os.environ.get("POSTGRES_HOST"),
+        database_name=os.environ.get("POSTGRES_DB"),
+        username=os.environ.get("POSTGRES_USER"),
+        password=os.environ.get("POSTGRES_PASSWORD"),
+        port=os.environ.get("POSTGRES_PORT"),
+    )
+
+
+@pytest.fixture
+def sharded_postgresql_client():
+    load_dotenv()
+    shard_databases = os.environ.get("POSTGRES_SHARD_DATABASES")
+    if not os.environ.get("POSTGRES_HOST") or not shard_databases:
+        pytest.skip("POSTGRES_HOST or POSTGRES_SHARD_DATABASES is not set.")
+    sharded_client = ShardedPostgreSqlClient.from_config(
+        [{"database_name": database_name.strip()} for database_name in shard_databases.split(",")]
+    )
+    yield sharded_client
+    sharded_client.dispose()
@@ -1,6 +1,17 @@
 from dotenv import load_dotenv
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
 import os
-from etl_project.connectors.accuweather import AccuWeatherApiClient
+import requests
+import threading
+import time
+from etl_project.connectors.accuweather import (
+    AccuWeatherApiClient,
+    AccuWeatherApiError,
+    AccuWeatherQuotaExceeded,
+    QuotaTracker,
+)
+from etl_project.connectors.response_cache import ResponseCache
 import pytest
 
 
@@ -23,3 +34,246 @@ def test_accuweather_client_api(setup):
 
     assert type(data) == list
     assert len(data) == number_of_forecast_days
+
+
+class StubAccuWeatherHandler(BaseHTTPRequestHandler):
+    """
+    Serves a fixed forecast payload and records request concurrency.
+
+    Responses queued on `server.responses` as (status_code, headers) are served
+    first, before falling back to a 200 response.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # otherwise the body waits for the delayed ACK of the headers (see benchmarks/stub_server.py)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.request_times.append(time.monotonic())
+            status_code, headers = server.responses.pop(0) if server.responses else (200, {})
+        time.sleep(server.latency)
+        if server.etag is not None:
+            headers = {**headers, "ETag": server.etag}
+            if self.headers.get("If-None-Match") == server.etag:
+                status_code = 304
+        if status_code == 304:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            with server.lock:
+                server.in_flight -= 1
+            return
+        if status_code == 200:
+            body = json.dumps({"DailyForecasts": [{"Date": "2023-09-26T07:00:00-04:00"}]}).encode()
+        else:
+            body = json.dumps({"Code": "ServiceUnavailable"}).encode()
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAccuWeatherHandler)
+    server.lock = threading.Lock()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.request_times = []
+    server.responses = []
+    server.etag = None
+    server.latency = 0.05
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_accuweather_client_get_forecasts_caps_concurrency(stub_server):
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        max_workers=4
+    )
+
+    data = accuweather_client.get_forecasts(
+        location_keys=list(range(20)),
+        forecast_days=5
+    )
+
+    assert list(data.keys()) == list(range(20))
+    assert all(len(forecasts) == 1 for forecasts in data.values())
+    assert stub_server.max_in_flight <= 4
+
+
+def test_accuweather_client_get_forecasts_rate_limit(stub_server):
+    stub_server.latency = 0
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        max_workers=4,
+        requests_per_second=20
+    )
+
+    accuweather_client.get_forecasts(location_keys=list(range(10)), forecast_days=5)
+
+    elapsed = stub_server.request_times[-1] - stub_server.request_times[0]
+    assert elapsed >= 9 / 20 * 0.9
+
+
+def test_accuweather_client_retries_transient_errors(stub_server):
+    stub_server.responses = [(503, {}), (500, {}), (429, {"Retry-After": "0"})]
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        backoff_factor=0.01
+    )
+
+    data = accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+
+    assert len(data) == 1
+    assert accuweather_client.retries == 3
+    assert len(stub_server.request_times) == 4
+
+
+def test_accuweather_client_honours_retry_after(stub_server):
+    stub_server.latency = 0
+    stub_server.responses = [(429, {"Retry-After": "1"})]
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        backoff_factor=0
+    )
+
+    accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+
+    assert stub_server.request_times[1] - stub_server.request_times[0] >= 0.9
+
+
+def test_accuweather_client_retries_timed_out_requests(stub_server):
+    stub_server.latency = 0.5
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        max_retries=1,
+        backoff_factor=0,
+        timeout=0.1
+    )
+
+    with pytest.raises(requests.Timeout):
+        accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+    assert accuweather_client.retries == 1
+    assert len(stub_server.request_times) == 2
+
+
+@pytest.mark.parametrize("retry_after, expected_delay", [
+    ("86400", 2),
+    ("-5", 0),
+    ("Wed, 21 Oct 2099 07:28:00 GMT", 2),
+    ("Wed, 21 Oct 2099 07:28:00 -0000", 2),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0),
+])
+def test_accuweather_client_caps_retry_after(retry_after, expected_delay):
+    accuweather_client = AccuWeatherApiClient(api_key="test", max_backoff=2)
+    response = requests.Response()
+    response.headers["Retry-After"] = retry_after
+
+    assert accuweather_client._retry_delay(attempt=0, response=response) == expected_delay
+
+
+@pytest.mark.parametrize("retry_after", ["soon", "nan", "Wed, 99 Foo 2099"])
+def test_accuweather_client_falls_back_to_backoff_on_invalid_retry_after(retry_after):
+    accuweather_client = AccuWeatherApiClient(api_key="test", backoff_factor=0.5, max_backoff=2)
+    response = requests.Response()
+    response.headers["Retry-After"] = retry_after
+
+    assert 0 <= accuweather_client._retry_delay(attempt=1, response=response) <= 1
+
+
+def test_accuweather_client_gives_up_after_max_retries(stub_server):
+    stub_server.responses = [(503, {})] * 3
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        max_retries=2,
+        backoff_factor=0.01
+    )
+
+    with pytest.raises(AccuWeatherApiError) as exc_info:
+        accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+
+    assert exc_info.value.status_code == 503
+    assert len(stub_server.request_times) == 3
+
+
+def test_accuweather_client_stops_at_quota_reserve(stub_server):
+    stub_server.responses = [(200, {"RateLimit-Limit": "50", "RateLimit-Remaining": "2"})]
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        quota_tracker=QuotaTracker(reserve=2)
+    )
+
+    accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+    with pytest.raises(AccuWeatherQuotaExceeded):
+        accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+
+    assert len(stub_server.request_times) == 1
+
+
+def test_quota_tracker_paces_requests_when_quota_is_low():
+    quota_tracker = QuotaTracker(low_watermark=5)
+    quota_tracker.seconds_until_reset = lambda: 1.0
+    quota_tracker.update({"RateLimit-Limit": "50", "RateLimit-Remaining": "4"})
+
+    start = time.monotonic()
+    quota_tracker.acquire()
+    quota_tracker.acquire()
+    quota_tracker.acquire()
+
+    # 4 calls left over 1 second, then 3 calls left over 1 second
+    assert time.monotonic() - start >= 1 / 4 + 1 / 3 - 0.05
+    assert quota_tracker.remaining == 1
+
+
+def test_accuweather_client_serves_fresh_forecasts_from_cache(stub_server, tmp_path):
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        response_cache=ResponseCache(path=str(tmp_path / "responses.sqlite"))
+    )
+
+    first = accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+    second = accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+
+    assert first == second
+    assert len(stub_server.request_times) == 1
+
+
+def test_accuweather_client_revalidates_stale_forecasts(stub_server, tmp_path):
+    stub_server.etag = '"v1"'
+    accuweather_client = AccuWeatherApiClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{stub_server.server_port}",
+        response_cache=ResponseCache(path=str(tmp_path / "responses.sqlite"), ttl_seconds=0)
+    )
+
+    first = accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+    second = accuweather_client.get_forecast(location_key=60449, forecast_days=5)
+
+    assert first == second
+    assert len(stub_server.request_times) == 2
@@ -0,0 +1,261 @@
+from etl_project.assets.accuweather import staging_upsert_load
+from etl_project.assets.forecast_schema import get_staging_table, set_dtypes
+from etl_project.connectors.postgresql import PostgreSqlClient
+from sqlalchemy import Table, Column, MetaData, Integer, String, Float, Date, event
+from datetime import date
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def drop_test_table(postgresql_client):
+    postgresql_client.engine.execute("drop table if exists test_forecast_weather")
+    yield
+    postgresql_client.engine.execute("drop table if exists test_forecast_weather")
+
+
+@pytest.fixture
+def forecast_table():
+    metadata = MetaData()
+    table = Table(
+        "test_forecast_weather",
+        metadata,
+        Column("date", Date, primary_key=True),
+        Column("location_key", Integer, primary_key=True),
+        Column("moon_phase", String),
+        Column("minimum_temperature_value", Float),
+        Column("day_precipitation_probability", Integer),
+    )
+    return table, metadata
+
+
+def test_bulk_upsert_inserts_and_updates(postgresql_client, forecast_table):
+    table, metadata = forecast_table
+    dataframe = pd.DataFrame({
+        "date": [date(2023, 9, 26), date(2023, 9, 27)],
+        "location_key": [60449, 60449],
+        "moon_phase": ["Full", "Waning, \"Gibbous\""],
+        "minimum_temperature_value": [11.5, None],
+        "day_precipitation_probability": [40, None],
+    })
+
+    postgresql_client.bulk_upsert(dataframe=dataframe, table=table, metadata=metadata)
+    dataframe["moon_phase"] = ["Last", ""]
+    postgresql_client.bulk_upsert(dataframe=dataframe, table=table, metadata=metadata)
+
+    rows = postgresql_client.execute_sql(
+        "select moon_phase, minimum_temperature_value, day_precipitation_probability "
+        "from test_forecast_weather order by date"
+    )
+    assert [tuple(row) for row in rows] == [("Last", 11.5, 40), ("", None, None)]
+
+
+def test_upsert_consumes_iterator_in_batches(postgresql_client, forecast_table):
+    table, metadata = forecast_table
+    consumed = []
+
+    def rows():
+        for offset in range(25):
+            consumed.append(offset)
+            yield {
+                "date": date(2023, 9, 1 + offset),
+                "location_key": 60449,
+                "moon_phase": "Full",
+                "minimum_temperature_value": 10.0,
+                "day_precipitation_probability": offset,
+            }
+
+    postgresql_client.upsert(data=rows(), table=table, metadata=metadata, batch_size=10)
+
+    assert len(consumed) == 25
+    assert postgresql_client.execute_sql("select count(*) from test_forecast_weather")[0][0] == 25
+
+
+def test_stream_sql_yields_dictionaries(postgresql_client):
+    rows = postgresql_client.stream_sql("select generate_series(1, 5) as n", batch_size=2)
+
+    assert list(rows) == [{"n": n} for n in range(1, 6)]
+
+
+def test_schema_checks_are_cached(postgresql_client, forecast_table):
+    table, metadata = forecast_table
+    statements = []
+    event.listen(
+        postgresql_client.engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement)
+    )
+
+    postgresql_client.create_table(table_name=table.name, metadata=metadata)
+    statements_after_create = len(statements)
+    postgresql_client.create_table(table_name=table.name, metadata=metadata)
+    assert postgresql_client.table_exists(table.name)
+
+    assert statements_after_create > 0
+    assert len(statements) == statements_after_create
+
+    postgresql_client.engine.execute("drop table test_forecast_weather")
+    postgresql_client.invalidate_schema_cache(table.name)
+    assert not postgresql_client.table_exists(table.name)
+
+
+def test_schema_cache_forgets_rolled_back_tables(postgresql_client, forecast_table):
+    table, metadata = forecast_table
+
+    with pytest.raises(Exception, match="load failed"):
+        with postgresql_client.begin():
+            postgresql_client.create_table(table_name=table.name, metadata=metadata)
+            assert postgresql_client.table_exists(table.name)
+            raise Exception("load failed")
+
+    assert not postgresql_client.table_exists(table.name)
+    postgresql_client.upsert(
+        data=[{"date": date(2023, 9, 26), "location_key": 60449}], table=table, metadata=metadata
+    )
+    assert postgresql_client.execute_sql("select count(*) from test_forecast_weather")[0][0] == 1
+
+
+def test_begin_reuses_one_connection(postgresql_client, forecast_table):
+    table, metadata = forecast_table
+    rows = [
+        {"date": date(2023, 9, 26), "location_key": key, "moon_phase": "Full",
+         "minimum_temperature_value": 10.0, "day_precipitation_probability": 10}
+        for key in range(10)
+    ]
+    checkouts = postgresql_client.pool_status()["checkouts"]
+
+    with postgresql_client.begin():
+        postgresql_client.upsert(data=rows, table=table, metadata=metadata, batch_size=3)
+        count = postgresql_client.execute_sql("select count(*) from test_forecast_weather")[0][0]
+
+    assert count == 10
+    assert postgresql_client.pool_status()["checkouts"] == checkouts + 1
+    assert postgresql_client.pool_status()["checked_out"] == 0
+
+
+def test_statement_timeout_is_applied(postgresql_client):
+    timeout_client = PostgreSqlClient(
+        server_name=postgresql_client.server_name,
+        database_name=postgresql_client.database_name,
+        username=postgresql_client.username,
+        password=postgresql_client.password,
+        port=postgresql_client.port,
+        pool_size=1,
+        statement_timeout_ms=1234,
+    )
+
+    assert timeout_client.execute_sql("show statement_timeout")[0][0] == "1234ms"
+
+
+def test_pool_settings_from_config_and_environment(monkeypatch):
+    monkeypatch.setenv("POSTGRES_POOL_SIZE", "20")
+
+    settings = PostgreSqlClient.pool_settings({"pool_size": 5, "pool_pre_ping": "false"})
+
+    assert settings == {"pool_size": 20, "pool_pre_ping": False}
+
+
+def test_create_date_partitions(postgresql_client):
+    metadata = MetaData()
+    table = Table(
+        "test_forecast_weather",
+        metadata,
+        Column("date", Date, primary_key=True),
+        Column("location_key", Integer, primary_key=True),
+        postgresql_partition_by="RANGE (date)",
+    )
+    postgresql_client.create_table(table_name=table.name, metadata=metadata)
+
+    postgresql_client.create_date_partitions(
+        table_name=table.name,
+        dates=[date(2023, 9, 30), date(2023, 10, 1), date(2023, 12, 31)],
+    )
+    postgresql_client.upsert(
+        data=[{"date": date(2023, 12, 31), "location_key": 60449}], table=table, metadata=metadata
+    )
+
+    partitions = postgresql_client.execute_sql(
+        "select inhrelid::regclass::text from pg_inherits "
+        "where inhparent = 'test_forecast_weather'::regclass order by 1"
+    )
+    assert [row[0] for row in partitions] == [
+        "test_forecast_weather_p202309",
+        "test_forecast_weather_p202310",
+        "test_forecast_weather_p202312",
+    ]
+
+
+def test_schema_cache_forgets_rolled_back_partitions(postgresql_client):
+    table, metadata = get_staging_table("test_forecast_weather")
+    postgresql_client.create_table(table_name=table.name, metadata=metadata)
+
+    with pytest.raises(Exception, match="load failed"):
+        with postgresql_client.begin():
+            postgresql_client.create_date_partitions(table_name=table.name, dates=[date(2023, 9, 30)])
+            raise Exception("load failed")
+
+    counts = staging_upsert_load(
+        dataframe=pd.DataFrame({"date": [date(2023, 9, 30)], "location_key": [60449]}),
+        postgresql_client=postgresql_client,
+        table=table,
+        metadata=metadata,
+    )
+    assert counts == (1, 0, 0)
+
+
+@pytest.mark.parametrize("load_method", ["bulk_upsert", "upsert"])
+def test_upsert_skips_unchanged_rows(postgresql_client, forecast_table, load_method):
+    table, metadata = forecast_table
+    dataframe = pd.DataFrame({
+        "date": [date(2023, 9, 26), date(2023, 9, 27)],
+        "location_key": [60449, 60449],
+        "moon_phase": ["Full", "Last"],
+        "minimum_temperature_value": [11.5, None],
+        "day_precipitation_probability": [40, None],
+    })
+
+    def load(dataframe):
+        if load_method == "bulk_upsert":
+            return postgresql_client.bulk_upsert(dataframe=dataframe, table=table, metadata=metadata)
+        return postgresql_client.upsert(
+            data=postgresql_client.dataframe_records(dataframe, columns=table.columns),
+            table=table,
+            metadata=metadata
+        )
+
+    assert load(dataframe) == (2, 0, 0)
+    assert load(dataframe) == (0, 0, 2)
+    dataframe.loc[1, "moon_phase"] = "New"
+    assert load(dataframe) == (0, 1, 1)
+
+
+@pytest.mark.parametrize("load_method", ["copy", "insert"])
+def test_upsert_into_partitioned_staging_table(postgresql_client, load_method):
+    table, metadata = get_staging_table("test_forecast_weather")
+    dataframe = set_dtypes(pd.DataFrame({
+        "date": [date(2023, 9, 30), date(2023, 10, 1)],
+        "location_key": [60449, 60449],
+        "moon_phase": ["Full", "Last"],
+        "day_precipitation_probability": [40, None],
+    }))
+
+    def load(dataframe):
+        return staging_upsert_load(
+            dataframe=dataframe,
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            load_method=load_method,
+        )
+
+    assert load(dataframe) == (2, 0, 0)
+    dataframe.loc[1, "moon_phase"] = "New"
+    assert load(dataframe) == (0, 1, 1)
+    rows = postgresql_client.execute_sql(
+        "select tableoid::regclass::text, moon_phase, day_precipitation_probability "
+        "from test_forecast_weather order by date"
+    )
+    assert [tuple(row) for row in rows] == [
+        ("test_forecast_weather_p202309", "Full", 40),
+        ("test_forecast_weather_p202310", "New", None),
+    ]
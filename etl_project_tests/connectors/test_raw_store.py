@@ -0,0 +1,31 @@
+from datetime import date, datetime, timezone
+from etl_project.connectors.raw_store import RawResponseStore
+
+
+def test_raw_store_round_trip(tmp_path):
+    raw_store = RawResponseStore(path=str(tmp_path))
+
+    raw_store.write(60449, [{"Date": "2023-09-26"}], extracted_at=datetime(2023, 9, 26, tzinfo=timezone.utc))
+    raw_store.write(60449, [{"Date": "2023-09-27"}], extracted_at=datetime(2023, 9, 27, tzinfo=timezone.utc))
+    raw_store.write(1, [{"Date": "2023-09-27"}], extracted_at=datetime(2023, 9, 27, 12, tzinfo=timezone.utc))
+    raw_store.write(1, [{"Date": "2023-09-28"}], extracted_at=datetime(2023, 9, 27, 18, tzinfo=timezone.utc))
+
+    assert (tmp_path / "date=2023-09-27" / "location_key=1.jsonl.gz").exists()
+    assert [(response.location_key, response.data) for response in raw_store.read()] == [
+        (60449, [{"Date": "2023-09-26"}]),
+        (1, [{"Date": "2023-09-27"}]),
+        (1, [{"Date": "2023-09-28"}]),
+        (60449, [{"Date": "2023-09-27"}]),
+    ]
+
+
+def test_raw_store_prunes_partitions(tmp_path):
+    raw_store = RawResponseStore(path=str(tmp_path))
+    for day in (26, 27, 28):
+        for location_key in (1, 2):
+            raw_store.write(location_key, [], extracted_at=datetime(2023, 9, day, tzinfo=timezone.utc))
+
+    responses = list(raw_store.read(start_date=date(2023, 9, 27), end_date=date(2023, 9, 27), location_keys=[2]))
+
+    assert [(response.location_key, response.extracted_at[:10]) for response in responses] == [(2, "2023-09-27")]
+    assert list(RawResponseStore(path=str(tmp_path / "missing")).read()) == []
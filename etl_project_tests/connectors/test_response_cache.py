@@ -0,0 +1,38 @@
+from etl_project.connectors.response_cache import ResponseCache
+import time
+
+
+def test_response_cache_round_trip(tmp_path):
+    response_cache = ResponseCache(path=str(tmp_path / "responses.sqlite"))
+
+    response_cache.set("forecast/60449", [{"Date": "2023-09-26"}], etag='"v1"')
+    cached_response = response_cache.get("forecast/60449")
+
+    assert cached_response.data == [{"Date": "2023-09-26"}]
+    assert cached_response.etag == '"v1"'
+    assert response_cache.is_fresh(cached_response)
+    assert response_cache.get("forecast/0") is None
+
+
+def test_response_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    ResponseCache(path=path).set("forecast/60449", [{"Date": "2023-09-26"}])
+
+    assert ResponseCache(path=path).get("forecast/60449").data == [{"Date": "2023-09-26"}]
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    response_cache = ResponseCache(path=str(tmp_path / "responses.sqlite"), max_bytes=100)
+    payload = ["x" * 30]
+
+    response_cache.set("a", payload)
+    time.sleep(0.01)
+    response_cache.set("b", payload)
+    time.sleep(0.01)
+    response_cache.get("a")
+    time.sleep(0.01)
+    response_cache.set("c", payload)
+
+    assert response_cache.get("a") is not None
+    assert response_cache.get("b") is None
+    assert response_cache.get("c") is not None
@@ -0,0 +1,103 @@
+from etl_project.connectors.sharded_postgresql import ShardedPostgreSqlClient
+from sqlalchemy import Table, Column, MetaData, Integer, Date
+from datetime import date
+import pandas as pd
+import pytest
+
+
+def test_sharded_client_routes_rows_by_shard_key():
+    sharded_client = ShardedPostgreSqlClient(shards=["shard_0", "shard_1", "shard_2"])
+    dataframe = pd.DataFrame({"location_key": [60449, 60450, 60451, 60452], "value": [1, 2, 3, 4]})
+
+    loaded = sharded_client.map_dataframe(
+        dataframe, lambda shard, rows: (shard, rows["location_key"].tolist())
+    )
+
+    assert loaded == {
+        0: ("shard_0", [60450]),
+        1: ("shard_1", [60451]),
+        2: ("shard_2", [60449, 60452]),
+    }
+    assert sharded_client.shard_index(60452) == 2
+
+
+def test_sharded_client_raises_shard_errors():
+    sharded_client = ShardedPostgreSqlClient(shards=["shard_0", "shard_1"])
+    finished = []
+
+    def load(shard):
+        if shard == "shard_0":
+            raise ValueError("shard_0 is down")
+        finished.append(shard)
+
+    with pytest.raises(ValueError, match="shard_0 is down"):
+        sharded_client.map_shards(load)
+    assert finished == ["shard_1"]
+
+
+class StubShard:
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def stream_sql(self, sql, batch_size=1000, parameters=None):
+        return iter(self.rows)
+
+
+def test_gather_sql_combines_partial_rows_by_key():
+    sharded_client = ShardedPostgreSqlClient(shards=[
+        StubShard([{"date": date(2023, 9, 26), "count": 2, "low": 10}, {"date": date(2023, 9, 27), "count": 1, "low": 12}]),
+        StubShard([{"date": date(2023, 9, 26), "count": 3, "low": 8}, {"date": date(2023, 9, 27), "count": None, "low": None}]),
+    ])
+
+    rows = sharded_client.gather_sql("select ...", key_columns=["date"], combine={"low": "min"})
+
+    assert rows == [
+        {"date": date(2023, 9, 26), "count": 5, "low": 8},
+        {"date": date(2023, 9, 27), "count": 1, "low": 12},
+    ]
+    assert len(sharded_client.gather_sql("select ...")) == 4
+    with pytest.raises(Exception, match="avg is not supported"):
+        sharded_client.gather_sql("select ...", key_columns=["date"], combine={"count": "avg"})
+
+
+def test_sharded_bulk_load_and_gather(sharded_postgresql_client):
+    metadata = MetaData()
+    table = Table(
+        "test_sharded_forecast",
+        metadata,
+        Column("date", Date, primary_key=True),
+        Column("location_key", Integer, primary_key=True),
+        Column("day_precipitation_probability", Integer),
+    )
+    sharded_postgresql_client.map_shards(
+        lambda shard: shard.engine.execute("drop table if exists test_sharded_forecast")
+    )
+    dataframe = pd.DataFrame({
+        "date": [date(2023, 9, 26)] * 4,
+        "location_key": [60449, 60450, 60451, 60452],
+        "day_precipitation_probability": [10, 20, 30, 40],
+    })
+
+    counts = sharded_postgresql_client.map_dataframe(
+        dataframe, lambda shard, rows: shard.bulk_upsert(dataframe=rows, table=table, metadata=metadata)
+    )
+    rows = sharded_postgresql_client.gather_sql(
+        "select location_key, day_precipitation_probability from test_sharded_forecast order by location_key"
+    )
+    totals = sharded_postgresql_client.gather_sql(
+        "select date, sum(day_precipitation_probability) as total from test_sharded_forecast group by date",
+        key_columns=["date"],
+    )
+    shard_counts = sharded_postgresql_client.map_shards(
+        lambda shard: shard.execute_sql("select count(*) from test_sharded_forecast")[0][0]
+    )
+    sharded_postgresql_client.map_shards(
+        lambda shard: shard.engine.execute("drop table if exists test_sharded_forecast")
+    )
+
+    assert sum(shard_count.inserted for shard_count in counts.values()) == 4
+    assert sorted(row["location_key"] for row in rows) == [60449, 60450, 60451, 60452]
+    assert totals == [{"date": date(2023, 9, 26), "total": 100}]
+    assert sum(shard_counts.values()) == 4
+    if len(sharded_postgresql_client.shards) > 1:
+        assert max(shard_counts.values()) < 4
@@ -0,0 +1,78 @@
+import subprocess
+import sys
+import threading
+
+import yaml
+
+from etl_project.assets.pipeline_logging import PipelineLogging
+from etl_project.pipelines import accuweather
+from etl_project.pipelines.accuweather import main, run_scheduler
+
+
+def test_pipeline_cli_imports_lazily():
+    imported = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, etl_project.pipelines.accuweather; "
+            "print(sorted(module for module in ('pandas', 'sqlalchemy', 'jinja2', 'requests') if module in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert imported.strip() == "[]"
+
+
+def test_pipeline_cli_dry_run(tmp_path):
+    config_path = tmp_path / "accuweather.yaml"
+    config_path.write_text(yaml.safe_dump({
+        "name": "test_pipeline",
+        "config": {
+            "location_keys": [60449],
+            "forecast_days": 5,
+            "staging_table_name": "staging_forecast_weather",
+            "transform_template_path": "./etl_project/assets/sql/transform",
+            "log_folder_path": str(tmp_path),
+        },
+    }))
+
+    assert main(["transform", "--dry-run", "--config", str(config_path)]) == 0
+    assert main(["--dry-run", "--config", str(config_path)]) == 0
+
+    logs = "".join(path.read_text() for path in tmp_path.glob("test_pipeline_*.log"))
+    assert "Would run forecast_weather.sql" in logs
+    assert "Would extract 5 forecast days for locations [60449]" in logs
+    assert "CREATE TABLE staging_forecast_weather" in logs
+
+
+def test_scheduler_survives_failed_runs(tmp_path, monkeypatch):
+    monkeypatch.setenv("API_KEY", "test")
+    stop_event = threading.Event()
+    runs = []
+
+    def run_pipeline(location_keys, **kwargs):
+        runs.append(location_keys)
+        if len(runs) == 1:
+            raise Exception("database is down")
+        stop_event.set()
+        return True
+
+    monkeypatch.setattr(accuweather, "run_pipeline", run_pipeline)
+    pipeline_logging = PipelineLogging("test_scheduler", str(tmp_path))
+    try:
+        run_scheduler(
+            config={"location_keys": [60449, 60450], "location_refresh_seconds": 0.2, "scheduler_tick_seconds": 0.05},
+            pipeline_name="test_scheduler",
+            postgresql_client=None,
+            pipeline_logging=pipeline_logging,
+            stop_event=stop_event,
+        )
+    finally:
+        pipeline_logging.close()
+
+    assert runs == [[60449], [60450]]
+    assert "Run of locations [60449] failed: database is down" in "".join(
+        path.read_text() for path in tmp_path.glob("test_scheduler_*.log")
+    )